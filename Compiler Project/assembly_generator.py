@@ -1,78 +1,176 @@
+from tac import Op, TEMP, CONST, is_local
+
+# Temps and compiler labels are emitted with a prefix no identifier can
+# start with, so a variable named t1 or a function named L1 never shares a
+# cell or a jump target with generated code.
+TEMP_PREFIX = '%'
+LABEL_PREFIX = '.'
+
+OPCODES = {
+    Op.ADD: 'ADD', Op.SUB: 'SUB', Op.MUL: 'MUL', Op.DIV: 'DIV',
+    Op.GT: 'CMPGT', Op.LT: 'CMPLT', Op.EQ: 'CMPEQ', Op.NE: 'CMPNE',
+    Op.GE: 'CMPGE', Op.LE: 'CMPLE'
+}
+
+
 class AssemblyGenerator:
-    def __init__(self, tac_code):
+    # allocation maps temps to registers (see register_allocator); without
+    # one every temp lives in memory and goes through the R1/R2 scratch pair.
+    #
+    # Layout: top-level code runs from the first instruction and ends in
+    # HALT; function bodies follow it. Top-level temps and all globals are
+    # cells named after them. A function's parameters, locals and temps
+    # outside registers live in its frame instead, so every active call,
+    # recursive ones included, has its own copies (see layout_frame).
+    def __init__(self, tac_code, allocation=None):
         self.tac_code = tac_code
         self.assembly_code = []
+        self.registers = allocation.assignment if allocation is not None else {}
+        self.main_code = []
+        self.function_code = []
+        self.current = self.main_code
+        self.frame = {}
+        self.arguments = 0
 
-    def is_number(self, s):
-        try:
-            if s is None: return False
-            int(s)
-            return True
-        except (ValueError, TypeError):
-            return False
+    def emit(self, line):
+        self.current.append(line)
 
     def get_operand(self, operand):
-        if self.is_number(operand):
-            return f"#{operand}"
-        return operand
+        if operand[0] == CONST:
+            return f"#{operand[1]}"
+        location = self.registers.get(operand) or self.frame.get(operand)
+        if location is not None:
+            return location
+        if operand[0] == TEMP:
+            return f"{TEMP_PREFIX}{operand[1]}"
+        return str(operand[1])
 
-    def generate(self):
-        for instr in self.tac_code:
-            parts = instr.split()
-            if len(parts) == 0: continue
-            
-            if instr.strip().endswith(':'):
-                self.assembly_code.append(f"\n{instr.strip()}")
-                continue
+    def label(self, operand):
+        return f"{LABEL_PREFIX}{operand[1]}"
 
-            op = parts[0]
-            
+    # Emits whatever is needed to have operand in a register and returns it.
+    def load(self, operand, scratch):
+        register = self.registers.get(operand)
+        if register is not None:
+            return register
+        self.emit(f"  LOAD {self.get_operand(operand)}, {scratch}")
+        return scratch
+
+    # Moves the value in register into dest, a register or memory.
+    def store(self, register, dest):
+        target = self.registers.get(dest)
+        if target is None:
+            self.emit(f"  STORE {register}, {self.get_operand(dest)}")
+        elif target != register:
+            self.emit(f"  MOV {register}, {target}")
 
-            if 'call' in parts:
-                dest = parts[0]
-                func_name = parts[3]
-                self.assembly_code.append(f"  CALL {func_name.replace(',', '')}")
-                self.assembly_code.append(f"  STORE AX, {dest}")
+    # PUSH and PRINT read a cell, a register or an immediate; a frame slot
+    # goes through R1 first.
+    def readable(self, operand):
+        if operand in self.frame:
+            return self.load(operand, "R1")
+        return self.get_operand(operand)
+
+    # ENTER saves BP, points it at the top of the stack and reserves the
+    # frame above it; the arguments the caller pushed sit below the saved
+    # BP, the first one nearest. LEAVE drops the frame, restores BP and pops
+    # the arguments. Slots are given out in order of first use.
+    def layout_frame(self, begin):
+        frame = {}
+        arguments = size = 0
+        for instr in self.tac_code[begin + 1:]:
+            if instr.op == Op.FUNC_END:
+                break
+            if instr.op == Op.GET_PARAM:
+                frame[instr.dest] = f"[BP-{arguments + 2}]"
+                arguments += 1
                 continue
+            for operand in (instr.dest, instr.arg1, instr.arg2):
+                if (operand is not None and (operand[0] == TEMP or is_local(operand))
+                        and operand not in frame and operand not in self.registers):
+                    frame[operand] = f"[BP+{size}]"
+                    size += 1
+        return frame, size, arguments
+
+    def generate(self):
+        main_code, function_code = self.generate_sections()
+        self.assembly_code = main_code + ["  HALT"] + function_code
+        return "\n".join(self.assembly_code)
+
+    # Top-level code and function bodies as separate line lists, for
+    # callers that link several pieces of generated code together.
+    def generate_sections(self):
+        emit = self.emit
+        for index, instr in enumerate(self.tac_code):
+            op = instr.op
+            if op == Op.LABEL:
+                emit(f"\n{self.label(instr.arg1)}:")
+            elif op == Op.CALL:
+                emit(f"  CALL {instr.arg1[1]}")
+                self.store("AX", instr.dest)
+            elif op == Op.IF_FALSE:
+                emit(f"  CMP {self.load(instr.arg1, 'R1')}, #0")
+                emit(f"  JE {self.label(instr.arg2)}")
+            elif op == Op.GOTO:
+                emit(f"  JMP {self.label(instr.arg1)}")
 
-            if op == 'if_false':
-                condition, _, label = parts[1], parts[2], parts[3]
-                self.assembly_code.append(f"  LOAD {self.get_operand(condition)}, R1")
-                self.assembly_code.append(f"  CMP R1, #0")
-                self.assembly_code.append(f"  JE {label}")
-            elif op == 'goto':
-                self.assembly_code.append(f"  JMP {parts[1]}")
-
-            elif op == 'func_begin':
-                self.assembly_code.append(f"\n{parts[1]}:")
-                self.assembly_code.append("  PUSH BP")
-                self.assembly_code.append("  MOV SP, BP")
-            elif op == 'func_end':
-                self.assembly_code.append("  POP BP")
-                self.assembly_code.append("  RET")
-            elif op == 'return':
-                self.assembly_code.append(f"  LOAD {self.get_operand(parts[1])}, AX")
-            elif op == 'param':
-                self.assembly_code.append(f"  PUSH {self.get_operand(parts[1])}")
-            elif op == 'get_param':
-                self.assembly_code.append(f"  POP {parts[1]}")
+            elif op == Op.FUNC_BEGIN:
+                self.current = self.function_code
+                self.frame, size, self.arguments = self.layout_frame(index)
+                emit(f"\n{instr.arg1[1]}:")
+                emit(f"  ENTER #{size}")
+            elif op == Op.FUNC_END:
+                emit(f"  LEAVE #{self.arguments}")
+                emit("  RET")
+                self.current = self.main_code
+                self.frame = {}
+            elif op == Op.RETURN:
+                if instr.arg1 in self.registers:
+                    emit(f"  MOV {self.registers[instr.arg1]}, AX")
+                else:
+                    emit(f"  LOAD {self.get_operand(instr.arg1)}, AX")
+                emit(f"  LEAVE #{self.arguments}")
+                emit("  RET")
+            elif op == Op.PARAM:
+                emit(f"  PUSH {self.readable(instr.arg1)}")
+            elif op == Op.GET_PARAM:
+                # The argument is already in its slot.
+                pass
             
-            elif op == 'print':
-                self.assembly_code.append(f"  PRINT {self.get_operand(parts[1])}")
-
-            elif '=' in parts:
-                dest = parts[0]
-                if len(parts) == 3:
-                    src = parts[2]
-                    self.assembly_code.append(f"  LOAD {self.get_operand(src)}, R1")
-                    self.assembly_code.append(f"  STORE R1, {dest}")
-                elif len(parts) == 5:
-                    src1, op_sym, src2 = parts[2], parts[3], parts[4]
-                    op_code = {'+': 'ADD', '-': 'SUB', '*': 'MUL', '/': 'DIV', 
-                               '>': 'CMPGT', '<': 'CMPLT', '==': 'CMPEQ', '!=': 'CMPNE'}.get(op_sym, "OP_ERR")
-                    self.assembly_code.append(f"  LOAD {self.get_operand(src1)}, R1")
-                    self.assembly_code.append(f"  LOAD {self.get_operand(src2)}, R2")
-                    self.assembly_code.append(f"  {op_code} R1, R2")
-                    self.assembly_code.append(f"  STORE R1, {dest}")
-        
-        return "\n".join(self.assembly_code)
\ No newline at end of file
+            elif op == Op.PRINT:
+                emit(f"  PRINT {self.readable(instr.arg1)}")
+
+            elif op == Op.COPY:
+                target = self.registers.get(instr.dest)
+                if target is not None and instr.arg1 not in self.registers:
+                    emit(f"  LOAD {self.get_operand(instr.arg1)}, {target}")
+                else:
+                    self.store(self.load(instr.arg1, "R1"), instr.dest)
+            else:
+                # The allocator never gives dest the register of an operand
+                # that is still live here, so arg1 can be moved into it first.
+                target = self.registers.get(instr.dest, "R1")
+                source = self.registers.get(instr.arg1)
+                if source is None:
+                    emit(f"  LOAD {self.get_operand(instr.arg1)}, {target}")
+                elif source != target:
+                    emit(f"  MOV {source}, {target}")
+                emit(f"  {OPCODES[op]} {target}, {self.load(instr.arg2, 'R2')}")
+                self.store(target, instr.dest)
+
+        return self.main_code, self.function_code
+
+
+# Memory traffic of generated code: LOADs from memory (immediates excluded)
+# and STOREs.
+def count_memory_operations(assembly_code):
+    loads = stores = 0
+    for line in assembly_code.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == 'LOAD' and not parts[1].startswith('#'):
+            loads += 1
+        elif parts[0] == 'STORE':
+            stores += 1
+    return loads, stores
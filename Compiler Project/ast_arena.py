@@ -0,0 +1,190 @@
+import json
+import struct
+import sys
+from array import array
+
+NODE_KINDS = (
+    'program', 'statements', 'assign', 'print', 'if', 'while', 'func_def',
+    'func_call', 'return', 'binop', 'relop', 'number', 'identifier', 'param'
+)
+KIND_INDEX = {name: index for index, name in enumerate(NODE_KINDS)}
+
+NO_NODE = -1
+NO_VALUE = -1
+NO_SYMBOL = -1
+
+_MAGIC = b'AST2'
+# magic, byte order flag, node count, root index, length of the value table
+_HEADER = struct.Struct('<4sBiiI')
+_COLUMNS = ('kind', 'value', 'first_child', 'next_sibling', 'line', 'column', 'symbol')
+
+
+# Flat tree store: one row per node spread over parallel typed arrays. Children
+# are linked through first_child/next_sibling indices instead of Python lists.
+class ASTArena:
+    def __init__(self):
+        self.kind = array('B')
+        self.value = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.line = array('i')
+        self.column = array('i')
+        self.symbol = array('i')
+        self.values = []
+        self.value_index = {}
+        self.root = NO_NODE
+
+    def __len__(self):
+        return len(self.kind)
+
+    def intern_value(self, value):
+        if value is None:
+            return NO_VALUE
+        key = (type(value), value)
+        index = self.value_index.get(key)
+        if index is None:
+            index = self.value_index[key] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def add_node(self, type, children=None, value=None, line=0, column=0):
+        index = len(self.kind)
+        self.kind.append(KIND_INDEX[type])
+        self.value.append(self.intern_value(value))
+        self.next_sibling.append(NO_NODE)
+        self.line.append(line)
+        self.column.append(column)
+        self.symbol.append(NO_SYMBOL)
+        if children:
+            self.first_child.append(children[0])
+            next_sibling = self.next_sibling
+            for previous, child in zip(children, children[1:]):
+                next_sibling[previous] = child
+        else:
+            self.first_child.append(NO_NODE)
+        return index
+
+    # Copies the subtree under node (an ASTNode or an ArenaNode) into a new
+    # arena, children before parents, without recursing.
+    @classmethod
+    def from_tree(cls, node):
+        arena = cls()
+        stack = [(node, False)]
+        built = []
+        while stack:
+            node, expanded = stack.pop()
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children))
+                continue
+            count = len(node.children)
+            children = built[len(built) - count:] if count else None
+            del built[len(built) - count:]
+            index = arena.add_node(node.type, children, node.value, node.line, node.column)
+            if node.symbol is not None:
+                arena.symbol[index] = node.symbol
+            built.append(index)
+        arena.root = built[0]
+        return arena
+
+    def node(self, index):
+        return ArenaNode(self, index)
+
+    def root_node(self):
+        return ArenaNode(self, self.root)
+
+    def children(self, index):
+        child = self.first_child[index]
+        next_sibling = self.next_sibling
+        while child != NO_NODE:
+            yield child
+            child = next_sibling[child]
+
+    def type_of(self, index):
+        return NODE_KINDS[self.kind[index]]
+
+    def value_of(self, index):
+        value_index = self.value[index]
+        return self.values[value_index] if value_index != NO_VALUE else None
+
+    def to_bytes(self):
+        values = json.dumps(self.values).encode('utf-8')
+        byte_order = 0 if sys.byteorder == 'little' else 1
+        parts = [_HEADER.pack(_MAGIC, byte_order, len(self.kind), self.root, len(values))]
+        parts.extend(getattr(self, column).tobytes() for column in _COLUMNS)
+        parts.append(values)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        view = memoryview(data)
+        magic, byte_order, count, root, values_length = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError("Not a serialized AST arena")
+        swap = byte_order != (0 if sys.byteorder == 'little' else 1)
+        arena = cls()
+        offset = _HEADER.size
+        for column in _COLUMNS:
+            buffer = getattr(arena, column)
+            size = count * buffer.itemsize
+            buffer.frombytes(view[offset:offset + size])
+            if swap:
+                buffer.byteswap()
+            offset += size
+        arena.values = json.loads(bytes(view[offset:offset + values_length]).decode('utf-8'))
+        arena.value_index = {(type(value), value): index for index, value in enumerate(arena.values)}
+        arena.root = root
+        return arena
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+# View of one arena row exposing the same interface as ASTNode, so the
+# visitors can walk an arena without it ever being expanded into objects.
+# Only symbol is writable, for semantic analysis to fill in.
+class ArenaNode:
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def type(self):
+        return NODE_KINDS[self.arena.kind[self.index]]
+
+    @property
+    def value(self):
+        return self.arena.value_of(self.index)
+
+    @property
+    def children(self):
+        arena = self.arena
+        return [ArenaNode(arena, child) for child in arena.children(self.index)]
+
+    @property
+    def line(self):
+        return self.arena.line[self.index]
+
+    @property
+    def column(self):
+        return self.arena.column[self.index]
+
+    @property
+    def symbol(self):
+        symbol = self.arena.symbol[self.index]
+        return symbol if symbol != NO_SYMBOL else None
+
+    @symbol.setter
+    def symbol(self, symbol):
+        self.arena.symbol[self.index] = symbol
+
+    def __repr__(self):
+        return f"ASTNode({self.type}, value={self.value})"
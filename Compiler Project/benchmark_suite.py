@@ -0,0 +1,172 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from tac_generator import TACGenerator
+from assembly_generator import AssemblyGenerator
+from program_generator import SHAPES, generate_shape
+
+PHASES = ('lexer', 'parser', 'semantic', 'tac', 'assembly')
+# Sizes are multiples of each shape's base size.
+BASE_SIZES = {'wide': 100, 'deep': 200, 'chains': 200, 'calls': 400}
+SIZE_STEPS = (1, 2, 4, 8)
+# Throughput depends on the machine, so no baseline is checked in. Record
+# one with --save-baseline on the machine that runs the gate, at the scale
+# it runs at; without one the gate fails unless --no-baseline is given.
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def run_phases(source):
+    timings = {}
+    start = time.perf_counter()
+    tokens = Lexer(source).tokenize()
+    timings['lexer'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ast = Parser(tokens).parse()
+    timings['parser'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(ast)
+    timings['semantic'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    generator = TACGenerator(symbols=analyzer.symbols)
+    generator.visit(ast)
+    timings['tac'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    AssemblyGenerator(generator.tac_code).generate()
+    timings['assembly'] = time.perf_counter() - start
+    return len(tokens), timings
+
+
+def measure(source, repeat):
+    best = None
+    for _ in range(repeat):
+        tokens, timings = run_phases(source)
+        best = timings if best is None else {phase: min(best[phase], timings[phase]) for phase in PHASES}
+    return tokens, best
+
+
+# Least-squares slope of log(seconds) against log(tokens): 1.0 is linear,
+# 2.0 quadratic.
+def scaling_exponent(points):
+    xs = [math.log(tokens) for tokens, _ in points]
+    ys = [math.log(max(seconds, 1e-9)) for _, seconds in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if not spread:
+        return 1.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+
+def run_suite(shapes, scale, repeat, report=print):
+    results = {}
+    for shape in shapes:
+        points = {phase: [] for phase in PHASES}
+        for step in SIZE_STEPS:
+            size = max(1, int(BASE_SIZES[shape] * scale * step))
+            tokens, timings = measure(generate_shape(shape, size), repeat)
+            for phase in PHASES:
+                points[phase].append((tokens, timings[phase]))
+            report(f"{shape:>8} size {size:>6} {tokens:>9} tokens  "
+                   + "  ".join(f"{phase} {timings[phase]:.4f}s" for phase in PHASES))
+        tokens, _ = points[PHASES[0]][-1]
+        results[shape] = {
+            phase: {
+                'tokens_per_second': tokens / max(points[phase][-1][1], 1e-9),
+                'exponent': scaling_exponent(points[phase]),
+            }
+            for phase in PHASES
+        }
+    return results
+
+
+def check(results, baseline, threshold, max_exponent):
+    failures = []
+    for shape, phases in results.items():
+        for phase, result in phases.items():
+            if result['exponent'] > max_exponent:
+                failures.append(f"{shape}/{phase}: scales as tokens^{result['exponent']:.2f} "
+                                f"(limit {max_exponent:.2f})")
+            if baseline is None:
+                continue
+            reference = baseline.get(shape, {}).get(phase)
+            if reference is None:
+                failures.append(f"{shape}/{phase}: not in the baseline; record it with --save-baseline")
+                continue
+            floor = reference['tokens_per_second'] * (1 - threshold)
+            if result['tokens_per_second'] < floor:
+                failures.append(f"{shape}/{phase}: {result['tokens_per_second']:,.0f} tokens/s, "
+                                f"baseline {reference['tokens_per_second']:,.0f} "
+                                f"(more than {threshold:.0%} slower)")
+    return failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark each compiler phase across program shapes and sizes.")
+    arg_parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=sorted(SHAPES))
+    arg_parser.add_argument('--scale', type=float, default=1.0, help="multiply every input size")
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline results to compare against")
+    arg_parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    arg_parser.add_argument('--no-baseline', action='store_true',
+                            help="check scaling only, without comparing throughput against a baseline")
+    arg_parser.add_argument('--threshold', type=float, default=0.2,
+                            help="allowed throughput drop against the baseline (0.2 = 20%%)")
+    arg_parser.add_argument('--max-exponent', type=float, default=1.3,
+                            help="largest accepted growth exponent of time against input size")
+    args = arg_parser.parse_args()
+
+    results = run_suite(args.shapes, args.scale, args.repeat)
+
+    print()
+    print(f"{'shape':>8}{'phase':>10}{'tokens/s':>14}{'exponent':>10}")
+    for shape, phases in results.items():
+        for phase, result in phases.items():
+            print(f"{shape:>8}{phase:>10}{result['tokens_per_second']:>14,.0f}{result['exponent']:>10.2f}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'scale': args.scale, 'results': results}, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    baseline = None
+    missing = None
+    if args.no_baseline:
+        pass
+    elif not os.path.exists(args.baseline):
+        missing = f"no baseline at {args.baseline}"
+    else:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get('scale') != args.scale:
+            missing = f"the baseline in {args.baseline} was recorded at scale {stored.get('scale')}, not {args.scale}"
+        else:
+            baseline = stored['results']
+    failures = check(results, baseline, args.threshold, args.max_exponent)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if missing is not None:
+        print(f"\nFAILED: {missing}, so throughput was not compared. Record one on this machine with "
+              f"--save-baseline (and the same --scale), or pass --no-baseline to check scaling only.")
+        return 1
+    if not failures:
+        print("\nNo regressions" + (" (scaling checked only)" if args.no_baseline else ""))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
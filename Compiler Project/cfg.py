@@ -0,0 +1,257 @@
+from collections import defaultdict
+
+from tac import Op
+
+TERMINATOR_OPS = frozenset((Op.GOTO, Op.IF_FALSE, Op.RETURN, Op.FUNC_END))
+MAIN_REGION = '__main__'
+
+
+class BasicBlock:
+    __slots__ = ('index', 'instructions', 'positions', 'label', 'successors', 'predecessors')
+
+    def __init__(self, index):
+        self.index = index
+        self.instructions = []
+        self.positions = []
+        self.label = None
+        self.successors = []
+        self.predecessors = []
+
+    def __repr__(self):
+        return f"BasicBlock({self.index}, label={self.label}, instructions={len(self.instructions)})"
+
+
+class ControlFlowGraph:
+    # blocks[-1] is an empty exit block that every return, func_end and the
+    # end of the region flow into. positions map each instruction back to
+    # its index in the full TAC list.
+    def __init__(self, name, instructions, positions):
+        self.name = name
+        self.blocks = []
+        self.label_blocks = {}
+        self.build(instructions, positions)
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    @property
+    def exit(self):
+        return self.blocks[-1]
+
+    def new_block(self):
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def build(self, instructions, positions):
+        block = self.new_block()
+        for instr, position in zip(instructions, positions):
+            if instr.op == Op.LABEL and block.instructions:
+                block = self.new_block()
+            if instr.op == Op.LABEL:
+                self.label_blocks[instr.arg1[1]] = block
+                if block.label is None:
+                    block.label = instr.arg1[1]
+            block.instructions.append(instr)
+            block.positions.append(position)
+            if instr.op in TERMINATOR_OPS:
+                block = self.new_block()
+        if block.instructions:
+            self.new_block()
+        exit_block = self.blocks[-1]
+
+        for block in self.blocks[:-1]:
+            last = block.instructions[-1] if block.instructions else None
+            op = last.op if last is not None else None
+            if op == Op.GOTO:
+                targets = [self.label_blocks[last.arg1[1]]]
+            elif op == Op.IF_FALSE:
+                targets = [self.blocks[block.index + 1], self.label_blocks[last.arg2[1]]]
+            elif op in (Op.RETURN, Op.FUNC_END):
+                targets = [exit_block]
+            else:
+                targets = [self.blocks[block.index + 1]]
+            for target in targets:
+                if target not in block.successors:
+                    block.successors.append(target)
+                    target.predecessors.append(block)
+
+    # Successors are explored jump target first, fall-through last. For a
+    # while loop that places the body right after its header in reverse
+    # postorder, instead of after all the code following the loop, which
+    # keeps dataflow sweeps over long chains of loops linear.
+    def postorder(self):
+        order = []
+        visited = {self.entry.index}
+        stack = [(self.entry, reversed(self.entry.successors))]
+        while stack:
+            block, successors = stack[-1]
+            for successor in successors:
+                if successor.index not in visited:
+                    visited.add(successor.index)
+                    stack.append((successor, reversed(successor.successors)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        return order
+
+    def reverse_postorder(self):
+        order = self.postorder()
+        order.reverse()
+        return order
+
+    def instruction_count(self):
+        return sum(len(block.instructions) for block in self.blocks)
+
+
+def split_regions(code):
+    # Each func_begin ... func_end range is its own region; everything else
+    # is the top-level region, in program order.
+    main = (MAIN_REGION, [], [])
+    regions = [main]
+    current = main
+    for position, instr in enumerate(code):
+        if instr.op == Op.FUNC_BEGIN:
+            current = (instr.arg1[1], [], [])
+            regions.append(current)
+        current[1].append(instr)
+        current[2].append(position)
+        if instr.op == Op.FUNC_END:
+            current = main
+    return regions
+
+
+def build_cfgs(code):
+    return [ControlFlowGraph(name, instructions, positions)
+            for name, instructions, positions in split_regions(code)]
+
+
+class CodeEdits:
+    # Changes to a TAC list keyed by position in it, applied in one pass so
+    # that positions stay valid while the changes are collected.
+    def __init__(self):
+        self.before = defaultdict(list)
+        self.after = defaultdict(list)
+        self.replaced = {}
+
+    def __bool__(self):
+        return bool(self.before or self.after or self.replaced)
+
+    def insert_before(self, position, instr):
+        self.before[position].append(instr)
+
+    def insert_after(self, position, instr):
+        self.after[position].append(instr)
+
+    def replace(self, position, instructions):
+        self.replaced[position] = instructions
+
+    def apply(self, code):
+        edited = []
+        for position, instr in enumerate(code):
+            if position in self.before:
+                edited.extend(self.before[position])
+            if position in self.replaced:
+                edited.extend(self.replaced[position])
+            else:
+                edited.append(instr)
+            if position in self.after:
+                edited.extend(self.after[position])
+        return edited
+
+
+class DominatorTree:
+    # Immediate dominators by Cooper, Harvey and Kennedy's iteration over
+    # reverse postorder. idom[b] is the index of b's immediate dominator, None
+    # for the entry and for blocks unreachable from it. Every reachable block
+    # also gets a preorder and postorder number in the tree, which answers
+    # "does a dominate b" in constant time.
+    def __init__(self, cfg):
+        self.cfg = cfg
+        order = cfg.reverse_postorder()
+        count = len(cfg.blocks)
+        rank = [count] * count
+        for position, block in enumerate(order):
+            rank[block.index] = position
+        idom = [None] * count
+        entry = cfg.entry.index
+        idom[entry] = entry
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                new = None
+                for predecessor in block.predecessors:
+                    other = predecessor.index
+                    if idom[other] is None:
+                        continue
+                    if new is None:
+                        new = other
+                        continue
+                    while other != new:
+                        while rank[other] > rank[new]:
+                            other = idom[other]
+                        while rank[new] > rank[other]:
+                            new = idom[new]
+                if idom[block.index] != new:
+                    idom[block.index] = new
+                    changed = True
+        idom[entry] = None
+        self.idom = idom
+        self.children = [[] for _ in range(count)]
+        for block in order[1:]:
+            self.children[idom[block.index]].append(block.index)
+        self.number()
+
+    def number(self):
+        count = len(self.idom)
+        self.preorder = [-1] * count
+        self.postorder = [-1] * count
+        clock = 0
+        entry = self.cfg.entry.index
+        self.preorder[entry] = clock
+        stack = [(entry, iter(self.children[entry]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                clock += 1
+                self.preorder[child] = clock
+                stack.append((child, iter(self.children[child])))
+                break
+            else:
+                stack.pop()
+                clock += 1
+                self.postorder[node] = clock
+
+    def reachable(self, index):
+        return self.preorder[index] >= 0
+
+    def dominates(self, dominator, index):
+        return (self.preorder[dominator] >= 0 and self.preorder[dominator] <= self.preorder[index]
+                and self.postorder[index] <= self.postorder[dominator])
+
+    # Dominance frontier of every block, by Cooper, Harvey and Kennedy's
+    # walk: a join is in the frontier of each block on the way up the tree
+    # from one of its predecessors to its immediate dominator. The entry
+    # counts as a join when it has predecessors, for the edge into the
+    # region.
+    def frontiers(self):
+        idom = self.idom
+        entry = self.cfg.entry.index
+        frontiers = [[] for _ in idom]
+        for block in self.cfg.blocks:
+            index = block.index
+            if len(block.predecessors) + (index == entry) < 2 or not self.reachable(index):
+                continue
+            for predecessor in block.predecessors:
+                runner = predecessor.index
+                if not self.reachable(runner):
+                    continue
+                while runner is not None and runner != idom[index]:
+                    frontier = frontiers[runner]
+                    if not frontier or frontier[-1] != index:
+                        frontier.append(index)
+                    runner = idom[runner]
+        return frontiers
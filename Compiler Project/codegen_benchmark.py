@@ -0,0 +1,65 @@
+import argparse
+import os
+import time
+
+from compiler import compile_source
+from memory_benchmark import synthetic_program
+
+# Results on the machine this was last run on (1 CPU, -O2, 4 registers,
+# 2000 functions, best of 5), through compile_source as the driver calls it:
+#
+#         jobs     seconds     speedup
+#       serial       2.854       1.00x
+#            1       2.810       1.02x
+#            2       3.902       0.73x
+#            4       3.343       0.85x
+#
+# With one CPU the workers only add process start-up and pickling; how far
+# the parallel rows scale on more cores has not been measured yet.
+
+
+def best_time(source, repeat, **options):
+    best = assembly_code = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = compile_source(source, verbose=False, **options)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        assembly_code = result.assembly_code
+    return best, assembly_code
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure how compile_source scales when functions are generated on several workers.")
+    arg_parser.add_argument('--functions', type=int, default=5000)
+    arg_parser.add_argument('--jobs', type=int, nargs='+',
+                            default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=2)
+    arg_parser.add_argument('--registers', type=int, default=4)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    source = synthetic_program(args.functions)
+    options = {'opt_level': args.opt_level, 'registers': args.registers}
+    print(f"{os.cpu_count()} CPUs, {args.functions} functions")
+    if (os.cpu_count() or 1) < max(args.jobs):
+        print("fewer CPUs than workers: extra workers only add overhead here")
+    columns = ('jobs', 'seconds', 'speedup')
+    print("".join(f"{column:>12}" for column in columns))
+    # Every run starts its own workers, as a compile through the driver
+    # does, so start-up is part of what is measured.
+    baseline, _ = best_time(source, args.repeat, **options)
+    print(f"{'serial':>12}{baseline:>12.3f}{1:>11.2f}x")
+    reference = None
+    for jobs in args.jobs:
+        best, assembly_code = best_time(source, args.repeat, jobs=jobs, **options)
+        if reference is None:
+            reference = assembly_code
+        elif assembly_code != reference:
+            raise SystemExit(f"{jobs} jobs: assembly differs from the {args.jobs[0]}-job build")
+        print(f"{jobs:>12}{best:>12.3f}{baseline / best:>11.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/tmp', f"compile-server-{os.getuid()}.sock")
+
+
+class CompileClient:
+    # One connection to a running compile_server. Requests can be sent
+    # ahead of their replies; the server answers a connection's requests
+    # in order.
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.buffer = b''
+        self.next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.socket.close()
+
+    def readline(self):
+        while True:
+            end = self.buffer.find(b'\n')
+            if end >= 0:
+                line, self.buffer = self.buffer[:end], self.buffer[end + 1:]
+                return line
+            data = self.socket.recv(1 << 16)
+            if not data:
+                raise ConnectionError("the compile server closed the connection")
+            self.buffer += data
+
+    def send(self, requests):
+        lines = []
+        for request in requests:
+            self.next_id += 1
+            request.setdefault('id', self.next_id)
+            lines.append(json.dumps(request, separators=(',', ':')) + "\n")
+        self.socket.sendall("".join(lines).encode('utf-8'))
+        return [json.loads(self.readline()) for _ in lines]
+
+    def request(self, request):
+        return self.send([request])[0]
+
+    def compile(self, path=None, source=None, **options):
+        request = dict(options)
+        if source is not None:
+            request['source'] = source
+        else:
+            request['path'] = os.path.abspath(path)
+        return self.request(request)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Compile files on a running compile server. Assembly (and with --tac, the TAC) "
+                    "is printed, or written under DIR with -o.")
+    arg_parser.add_argument('inputs', nargs='*', help="source files")
+    arg_parser.add_argument('--socket', default=DEFAULT_SOCKET, help="the server's Unix socket")
+    arg_parser.add_argument('-o', '--output-dir', metavar='DIR', help="write .asm (and .tac) files here")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=0)
+    arg_parser.add_argument('--inline-budget', type=int,
+                            help="largest function body (TAC instructions) inlined at -O3")
+    arg_parser.add_argument('--fused', action='store_true', help="check names and generate TAC in one traversal")
+    arg_parser.add_argument('--registers', type=int, help="allocate temps to this many registers")
+    arg_parser.add_argument('--allocator', default='linear', help="register allocator, checked by the server")
+    arg_parser.add_argument('--peephole', action='store_true', help="run the peephole optimizer over the assembly")
+    arg_parser.add_argument('--tac', action='store_true', help="also return the optimized TAC")
+    arg_parser.add_argument('--stats', action='store_true', help="print the server's counters")
+    arg_parser.add_argument('--shutdown', action='store_true', help="stop the server after these requests")
+    args = arg_parser.parse_args(argv)
+
+    options = {'opt_level': args.opt_level, 'registers': args.registers, 'allocator': args.allocator,
+               'peephole': args.peephole, 'fused': args.fused, 'inline_budget': args.inline_budget}
+    requests = []
+    for path in args.inputs:
+        request = dict(options, path=os.path.abspath(path))
+        if args.output_dir is not None:
+            base = os.path.join(os.path.abspath(args.output_dir), os.path.splitext(os.path.basename(path))[0])
+            request['output'] = base + '.asm'
+            if args.tac:
+                request['tac_output'] = base + '.tac'
+        else:
+            request['tac'] = args.tac
+        requests.append(request)
+    if args.stats:
+        requests.append({'op': 'stats'})
+    if args.shutdown:
+        requests.append({'op': 'shutdown'})
+
+    status = 0
+    with CompileClient(args.socket) as client:
+        responses = client.send(requests) if requests else []
+    for request, response in zip(requests, responses):
+        if not response['ok']:
+            print(f"{request.get('path', request.get('op'))}: {response['error']}", file=sys.stderr)
+            status = 1
+            continue
+        if 'tac' in response:
+            print(response['tac'])
+        if 'assembly' in response:
+            print(response['assembly'])
+        if 'stats' in response:
+            for name, value in response['stats'].items():
+                print(f"{name}: {value}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+import argparse
+import gc
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tac import format_tac
+from register_allocator import ALLOCATORS
+from compiler import SAMPLE_PROGRAM, compile_source
+
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/tmp', f"compile-server-{os.getuid()}.sock")
+
+
+class LRUCache:
+    # get and put are atomic under the lock; building a missing value is
+    # left to the caller, so two requests racing for the same key may both
+    # build it, and the later put wins with an equal value.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class Artifact:
+    # The TAC and assembly of one compile, or the error that stopped it.
+    def __init__(self, tac=None, assembly=None, error=None):
+        self.tac = tac
+        self.assembly = assembly
+        self.error = error
+
+
+class CompileServer:
+    # Compiles sources through compiler.compile_source, behind a cache of
+    # artifacts keyed by a hash of the source text and the options.
+    # Everything a cold run pays for once (imports, keyword and dispatch
+    # tables, the first compile through each pass) is paid when the server
+    # starts.
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.artifacts = LRUCache(max_entries)
+        self.requests = 0
+        self.errors = 0
+        self.counter_lock = threading.Lock()
+        self.started = time.time()
+        self.stopping = threading.Event()
+
+    def warm_up(self):
+        for opt_level in (0, 1, 2, 3):
+            self.build(SAMPLE_PROGRAM, opt_level, None, 'linear', True)
+        self.artifacts = LRUCache(self.max_entries)
+        # What is alive now lives as long as the server; moving it out of
+        # the collector's generations keeps every later collection small.
+        gc.collect()
+        gc.freeze()
+
+    # Returns the artifact and whether it came from the cache. Errors in
+    # the source are cached like any other outcome.
+    def build(self, source, opt_level, registers, allocator, peephole, fused=False, inline_budget=None):
+        digest = hashlib.blake2b(source.encode('utf-8'), digest_size=16).digest()
+        key = (digest, opt_level, registers, allocator, peephole, fused, inline_budget)
+        artifact = self.artifacts.get(key)
+        if artifact is not None:
+            return artifact, True
+        try:
+            result = compile_source(source, fused=fused, opt_level=opt_level, registers=registers,
+                                    allocator=allocator, peephole=peephole, verbose=False,
+                                    inline_budget=inline_budget)
+        except Exception as error:
+            artifact = Artifact(error=str(error))
+        else:
+            if result.error is not None:
+                artifact = Artifact(error=result.error)
+            else:
+                artifact = Artifact(format_tac(result.tac_code), result.assembly_code)
+        self.artifacts.put(key, artifact)
+        return artifact, False
+
+    # One request, one response; neither ever raises. A request names a
+    # file ("path") or carries its text ("source"). With "output" (and
+    # "tac_output") the server writes the artifacts itself and the reply
+    # carries no text, which is the cheapest way back for large programs.
+    def handle(self, request):
+        start = time.perf_counter()
+        op = request.get('op', 'compile')
+        response = {'id': request.get('id'), 'ok': True}
+        try:
+            if op == 'compile':
+                self.compile_request(request, response)
+            elif op == 'stats':
+                response['stats'] = self.stats()
+            elif op == 'shutdown':
+                self.stopping.set()
+            else:
+                raise ValueError(f"unknown op '{op}'")
+        except Exception as error:
+            response['ok'] = False
+            response['error'] = str(error)
+        with self.counter_lock:
+            self.requests += 1
+            self.errors += not response['ok']
+        response['seconds'] = time.perf_counter() - start
+        return response
+
+    def compile_request(self, request, response):
+        source = request.get('source')
+        if source is None:
+            with open(request['path']) as f:
+                source = f.read()
+        allocator = request.get('allocator', 'linear')
+        if allocator not in ALLOCATORS:
+            raise ValueError(f"unknown allocator '{allocator}'")
+        inline_budget = request.get('inline_budget')
+        artifact, cached = self.build(source, int(request.get('opt_level', 0)), request.get('registers'),
+                                      allocator, bool(request.get('peephole', False)),
+                                      bool(request.get('fused', False)),
+                                      None if inline_budget is None else int(inline_budget))
+        response['cached'] = cached
+        if artifact.error is not None:
+            response['ok'] = False
+            response['error'] = artifact.error
+            return
+        output = request.get('output')
+        if output is not None:
+            write_text(output, artifact.assembly)
+        else:
+            response['assembly'] = artifact.assembly
+        tac_output = request.get('tac_output')
+        if tac_output is not None:
+            write_text(tac_output, artifact.tac)
+        elif request.get('tac'):
+            response['tac'] = artifact.tac
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'uptime': time.time() - self.started,
+            'artifacts': len(self.artifacts), 'artifact_hits': self.artifacts.hits,
+            'artifact_misses': self.artifacts.misses,
+        }
+
+
+def write_text(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+        f.write("\n")
+
+
+def encode(response):
+    return (json.dumps(response, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+# The request on line, or None and the reply to a line that is not one.
+def parse_request(line):
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("a request must be a JSON object")
+    except ValueError as error:
+        return None, {'id': None, 'ok': False, 'error': f"bad request: {error}"}
+    return request, None
+
+
+def answer(server, line):
+    request, response = parse_request(line)
+    return response if request is None else server.handle(request)
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    # Requests on one connection are answered in order; separate
+    # connections are served by separate threads.
+    def handle(self):
+        server = self.server.compile_server
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(encode(answer(server, line)))
+            self.wfile.flush()
+            if server.stopping.is_set():
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_socket(server, path):
+    # A socket file left by a server that is gone is replaced; one that
+    # still answers is not.
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+        else:
+            raise SystemExit(f"a server is already listening on {path}")
+        finally:
+            probe.close()
+    with _UnixServer(path, _ConnectionHandler) as unix_server:
+        unix_server.compile_server = server
+        try:
+            unix_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+
+
+def serve_stdio(server, jobs, stdin=sys.stdin.buffer, stdout=sys.stdout.buffer):
+    # JSON lines in, JSON lines out. Requests are handed to a thread pool,
+    # so replies come back as they finish, not in request order; the id a
+    # request carries is echoed in its reply.
+    lock = threading.Lock()
+
+    def reply(request, response):
+        if request is not None:
+            response = server.handle(request)
+        data = encode(response)
+        with lock:
+            stdout.write(data)
+            stdout.flush()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for line in stdin:
+            if not line.strip():
+                continue
+            request, response = parse_request(line)
+            executor.submit(reply, request, response)
+            # Nothing after a shutdown is read, so it takes effect without
+            # waiting for another line; what came before it is still
+            # answered before the executor exits.
+            if request is not None and request.get('op') == 'shutdown':
+                break
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Keep a compiler warm and serve compile requests.")
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument('--socket', default=DEFAULT_SOCKET, help="listen on this Unix socket")
+    mode.add_argument('--stdio', action='store_true', help="read JSON-lines requests from stdin instead")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                            help="requests handled at once in --stdio mode")
+    arg_parser.add_argument('--cache-entries', type=int, default=1024,
+                            help="compiled artifacts kept for reuse")
+    args = arg_parser.parse_args(argv)
+
+    server = CompileServer(args.cache_entries)
+    server.warm_up()
+    if args.stdio:
+        serve_stdio(server, args.jobs)
+    else:
+        print(f"listening on {args.socket}", file=sys.stderr, flush=True)
+        serve_socket(server, args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,51 +1,21 @@
+import argparse
+
 from lexer import Lexer
 from parser import Parser
 from semantic import SemanticAnalyzer
 from tac_generator import TACGenerator
-from assembly_generator import AssemblyGenerator
+from assembly_generator import AssemblyGenerator, count_memory_operations
+from fused_pass import SemanticTACGenerator
+from optimizer import pass_manager_for_level
+from ssa import format_ssa
+from register_allocator import ALLOCATORS, allocate_registers
+from peephole import PeepholeOptimizer
+from parallel_codegen import MIN_FUNCTIONS, ParallelCodeGenerator
+from vm import VirtualMachine, VMError, assemble
 from structures import ASTNode
+from stats import CompileStats, NO_STATS, PROFILE_HOOKS
 
-def print_ast(node, level=0):
-    indent = "  " * level
-    info = f"{node.type}"
-    if node.value is not None: info += f" -> {node.value}"
-    print(indent + info)
-    for child in node.children:
-        print_ast(child, level + 1)
-
-def compile_source(source_code):
-    
-    print("--- 1. Lexical Analysis (Tokens) ---")
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
-    for token in tokens: print(token)
-
-    print("\n--- 2. Parsing (Abstract Syntax Tree) ---")
-    parser = Parser(tokens)
-    ast = parser.parse()
-    print_ast(ast)
-
-    print("\n--- 3. Semantic Analysis ---")
-    semantic_analyzer = SemanticAnalyzer()
-    try:
-        semantic_analyzer.visit(ast)
-        print("Semantic analysis successful.")
-    except NameError as e:
-        print(e)
-        return
-
-    print("\n--- 4. Three-Address Code (TAC) ---")
-    tac_generator = TACGenerator()
-    tac_generator.visit(ast)
-    for tac_line in tac_generator.tac_code: print(tac_line)
-    
-    print("\n--- 5. Assembly Code Generation ---")
-    assembly_generator = AssemblyGenerator(tac_generator.tac_code)
-    assembly_code = assembly_generator.generate()
-    print(assembly_code)
-
-if __name__ == '__main__':
-    code = """
+SAMPLE_PROGRAM = """
     def get_max(a, b) {
         if (a > b) {
             return a;
@@ -65,5 +35,216 @@ if __name__ == '__main__':
     }
     print i;
     """
-    
-    compile_source(code)
\ No newline at end of file
+
+def print_ast(node, level=0):
+    stack = [(node, level)]
+    while stack:
+        node, level = stack.pop()
+        indent = "  " * level
+        info = f"{node.type}"
+        if node.value is not None: info += f" -> {node.value}"
+        print(indent + info)
+        stack.extend((child, level + 1) for child in reversed(node.children))
+
+class CompileResult:
+    # What one compilation produced. A program the semantic analysis rejects
+    # leaves its message in error and the later artifacts None; lexing and
+    # parsing errors are raised. stats is set when it was asked for.
+    def __init__(self):
+        self.tokens = 0
+        self.tac_code = None
+        self.assembly_code = None
+        self.output = None
+        self.error = None
+        self.stats = None
+
+def compile_source(source_code, arena=False, fused=False, opt_level=0, registers=None, allocator='linear',
+                   peephole=False, run=False, verbose=True, stats=False, profile=None, inline_budget=None,
+                   ssa=False, jobs=None):
+    # stats=True (or a profile hook) puts a CompileStats for the run on the
+    # result; the default NO_STATS makes every instrumentation point a no-op.
+    # With jobs, a module of at least MIN_FUNCTIONS functions has its code
+    # generated function by function on that many workers (see
+    # parallel_codegen); -O3 then cannot inline across functions.
+    result = CompileResult()
+    stats = CompileStats(profile) if stats or profile else NO_STATS
+    with stats:
+        _compile_source(source_code, arena, fused, opt_level, registers, allocator, peephole, run,
+                        verbose, stats, inline_budget, ssa, jobs, result)
+    if stats.enabled:
+        result.stats = stats
+    return result
+
+def _compile_source(source_code, arena, fused, opt_level, registers, allocator, peephole, run, verbose, stats,
+                    inline_budget, ssa, jobs, result):
+    with stats.phase('lex'):
+        lexer = Lexer(source_code)
+        tokens = lexer.tokenize()
+    result.tokens = len(tokens)
+    stats.count('tokens', len(tokens))
+    if verbose:
+        print("--- 1. Lexical Analysis (Tokens) ---")
+        for token in tokens: print(token)
+
+    with stats.phase('parse'):
+        parser = Parser(tokens, arena=arena)
+        ast = parser.parse()
+    stats.count_nodes(ast)
+    if verbose:
+        print("\n--- 2. Parsing (Abstract Syntax Tree) ---")
+        print_ast(ast)
+
+    if verbose: print("\n--- 3. Semantic Analysis ---")
+    if fused:
+        # Single traversal: TAC is produced while names are being checked.
+        tac_generator = SemanticTACGenerator()
+        analyzer = tac_generator
+    else:
+        tac_generator = None
+        analyzer = SemanticAnalyzer()
+    try:
+        with stats.phase('semantic+tac' if fused else 'semantic'):
+            analyzer.visit(ast)
+        stats.count('symbols', len(analyzer.symbols))
+        if verbose: print("Semantic analysis successful.")
+    except (NameError, TypeError) as e:
+        result.error = str(e)
+        if verbose: print(e)
+        return
+
+    if tac_generator is None and jobs is not None:
+        functions = sum(child.type == 'func_def' for child in ast.children)
+        if functions >= MIN_FUNCTIONS:
+            with stats.phase('parallel_codegen'):
+                with ParallelCodeGenerator(jobs, opt_level, registers, allocator) as generator:
+                    tac_code, assembly_code = generator.generate(ast, analyzer.symbols)
+            stats.count('tac_instructions', len(tac_code))
+            result.tac_code = tac_code
+            if ssa and verbose:
+                print("\n--- 4b. SSA Form ---")
+                print(format_ssa(tac_code))
+            if verbose:
+                print(f"\n--- 4-5. Parallel Code Generation (-O{opt_level}, {functions} functions, "
+                      f"{generator.jobs} workers) ---")
+                for tac_line in tac_code: print(tac_line)
+                print()
+                print(assembly_code)
+            _finish(assembly_code, peephole, run, verbose, stats, result)
+            return
+
+    if tac_generator is None:
+        with stats.phase('tac'):
+            tac_generator = TACGenerator(symbols=analyzer.symbols)
+            tac_generator.visit(ast)
+    tac_code = tac_generator.tac_code
+    stats.count('tac_instructions', len(tac_code))
+    if verbose:
+        print("\n--- 4. Three-Address Code (TAC) ---")
+        for tac_line in tac_code: print(tac_line)
+
+    if opt_level > 0:
+        pass_manager = pass_manager_for_level(opt_level, stats, inline_budget)
+        tac_code = pass_manager.run(tac_code)
+        stats.count('optimized_tac_instructions', len(tac_code))
+        calls_removed = pass_manager.calls_removed()
+        if calls_removed:
+            stats.count('calls_removed', sum(calls_removed.values()))
+        branches_folded = pass_manager.branches_folded()
+        if branches_folded:
+            stats.count('branches_folded', sum(branches_folded.values()))
+        if verbose:
+            print(f"\n--- 4a. TAC Optimization (-O{opt_level}) ---")
+            for pass_result in pass_manager.report:
+                print(f"{pass_result.name}: {pass_result.before} -> {pass_result.after} ({pass_result.delta:+d})")
+            for name, count in calls_removed.items():
+                print(f"{name}: {count} calls removed")
+            for name, count in branches_folded.items():
+                print(f"{name}: {count} branches folded")
+            print(f"total: {len(tac_generator.tac_code)} -> {len(tac_code)} instructions\n")
+            for tac_line in tac_code: print(tac_line)
+
+    result.tac_code = tac_code
+    if ssa and verbose:
+        print("\n--- 4b. SSA Form ---")
+        print(format_ssa(tac_code))
+
+    if verbose: print("\n--- 5. Assembly Code Generation ---")
+    allocation = None
+    if registers is not None:
+        with stats.phase('register_allocation'):
+            allocation = allocate_registers(tac_code, registers, allocator)
+        if verbose:
+            print(f"Register allocation ({allocator}, {registers} registers): "
+                  f"{len(allocation.assignment)} temps in registers, {len(allocation.spilled)} spilled")
+    with stats.phase('assembly'):
+        assembly_generator = AssemblyGenerator(tac_code, allocation)
+        assembly_code = assembly_generator.generate()
+    if stats.enabled:
+        stats.count('assembly_lines', len(assembly_generator.assembly_code))
+    if verbose: print(assembly_code)
+
+    if allocation is not None and verbose:
+        loads, stores = count_memory_operations(AssemblyGenerator(tac_code).generate())
+        allocated_loads, allocated_stores = count_memory_operations(assembly_code)
+        print(f"\nloads: {loads} -> {allocated_loads} ({loads - allocated_loads} eliminated)")
+        print(f"stores: {stores} -> {allocated_stores} ({stores - allocated_stores} eliminated)")
+    _finish(assembly_code, peephole, run, verbose, stats, result)
+
+# The peephole pass and the run, after assembly has been generated.
+def _finish(assembly_code, peephole, run, verbose, stats, result):
+    if peephole:
+        with stats.phase('peephole'):
+            optimizer = PeepholeOptimizer()
+            assembly_code = optimizer.optimize(assembly_code)
+        stats.count('peephole_assembly_lines', optimizer.after)
+        if verbose:
+            print("\n--- 5a. Peephole Optimization ---")
+            for name, count in optimizer.report():
+                print(f"{name}: -{count}")
+            print(f"jumps threaded: {optimizer.threaded}")
+            print(f"total: {optimizer.before} -> {optimizer.after} instructions in {optimizer.rounds} rounds")
+            print(assembly_code)
+    result.assembly_code = assembly_code
+
+    if run:
+        try:
+            with stats.phase('run'):
+                program = assemble(assembly_code)
+                machine = VirtualMachine(program)
+                output = machine.run()
+        except VMError as e:
+            result.error = str(e)
+            if verbose: print(e)
+            return
+        stats.count('executed_instructions', machine.executed)
+        result.output = output
+        # Quietly, only what the program itself prints.
+        if verbose: print("\n--- 6. Execution ---")
+        for value in output:
+            print(value)
+        if verbose: print(f"{machine.executed} instructions executed ({len(program)} in the program)")
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Compile the sample program, printing every phase.")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=0)
+    arg_parser.add_argument('--inline-budget', type=int,
+                            help="largest function body (TAC instructions) inlined at -O3")
+    arg_parser.add_argument('--registers', type=int, help="allocate temps to this many registers")
+    arg_parser.add_argument('--allocator', choices=sorted(ALLOCATORS), default='linear')
+    arg_parser.add_argument('--peephole', action='store_true', help="run the peephole optimizer over the assembly")
+    arg_parser.add_argument('--run', action='store_true', help="execute the program on the virtual machine")
+    arg_parser.add_argument('--stats', choices=('text', 'json'), help="report per-phase timings and counts")
+    arg_parser.add_argument('--profile', choices=PROFILE_HOOKS, help="run every phase under this profiler")
+    arg_parser.add_argument('--ssa', action='store_true', help="print the TAC in SSA form before code generation")
+    arg_parser.add_argument('--quiet', action='store_true', help="do not print the output of each phase")
+    args = arg_parser.parse_args()
+
+    result = compile_source(SAMPLE_PROGRAM, opt_level=args.opt_level,
+                            registers=args.registers, allocator=args.allocator,
+                            peephole=args.peephole, run=args.run, verbose=not args.quiet,
+                            stats=args.stats is not None, profile=args.profile,
+                            inline_budget=args.inline_budget, ssa=args.ssa)
+    if result.error is not None and args.quiet:
+        print(result.error)
+    if result.stats is not None:
+        print(result.stats.to_json() if args.stats == 'json' else result.stats.format())
\ No newline at end of file
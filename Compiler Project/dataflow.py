@@ -0,0 +1,206 @@
+from heapq import heappop, heappush
+
+from tac import Op, TEMP, VAR, DEFINING_OPS
+
+FORWARD = 'forward'
+BACKWARD = 'backward'
+
+
+class BitsetUniverse:
+    # Dense numbering of the items a problem tracks; sets of items are
+    # Python ints used as bitsets.
+    def __init__(self):
+        self.items = []
+        self.index = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def number(self, item):
+        index = self.index.get(item)
+        if index is None:
+            index = self.index[item] = len(self.items)
+            self.items.append(item)
+        return index
+
+    # Built through a bytearray so that large sets cost linear time rather
+    # than one big-int copy per member.
+    def bits(self, indices):
+        if not indices:
+            return 0
+        buffer = bytearray((max(indices) >> 3) + 1)
+        for index in indices:
+            buffer[index >> 3] |= 1 << (index & 7)
+        return int.from_bytes(buffer, 'little')
+
+    def members(self, bits):
+        items = self.items
+        data = bits.to_bytes((bits.bit_length() + 7) >> 3, 'little')
+        members = []
+        for byte_index, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                members.append(items[(byte_index << 3) + low.bit_length() - 1])
+                byte ^= low
+        return members
+
+
+class DataflowProblem:
+    direction = FORWARD
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.universe = BitsetUniverse()
+        blocks = len(cfg.blocks)
+        self.gen = [0] * blocks
+        self.kill = [0] * blocks
+        self.block_in = [0] * blocks
+        self.block_out = [0] * blocks
+        self.compute_local_sets()
+
+    def compute_local_sets(self):
+        raise NotImplementedError
+
+    def boundary(self):
+        return 0
+
+    # Union-meet worklist solver. The worklist is a heap keyed by reverse
+    # postorder (postorder for backward problems): a block is only revisited
+    # after everything before it in that order has settled, so changes flow
+    # down the graph once per loop nesting level instead of chasing each
+    # back edge through the whole region.
+    def solve(self):
+        cfg = self.cfg
+        gen, kill = self.gen, self.kill
+        forward = self.direction == FORWARD
+        if forward:
+            order = cfg.reverse_postorder()
+            facts_in, facts_out = self.block_in, self.block_out
+            boundary_block = cfg.entry
+        else:
+            order = cfg.postorder()
+            facts_in, facts_out = self.block_out, self.block_in
+            boundary_block = cfg.exit
+        seen = {block.index for block in order}
+        order.extend(block for block in cfg.blocks if block.index not in seen)
+        priority = [0] * len(cfg.blocks)
+        for rank, block in enumerate(order):
+            priority[block.index] = rank
+
+        worklist = list(range(len(order)))
+        queued = [True] * len(cfg.blocks)
+        boundary = self.boundary()
+        while worklist:
+            block = order[heappop(worklist)]
+            index = block.index
+            queued[index] = False
+            facts = boundary if block is boundary_block else 0
+            for source in (block.predecessors if forward else block.successors):
+                facts |= facts_out[source.index]
+            facts_in[index] = facts
+            result = gen[index] | (facts & ~kill[index])
+            if result != facts_out[index]:
+                facts_out[index] = result
+                for target in (block.successors if forward else block.predecessors):
+                    if not queued[target.index]:
+                        queued[target.index] = True
+                        heappush(worklist, priority[target.index])
+        return self
+
+
+class Liveness(DataflowProblem):
+    direction = BACKWARD
+
+    # Items are TEMP and VAR operands. Variables are global storage: all of
+    # them are live when the region ends, and a call may read any of them.
+    def compute_local_sets(self):
+        universe = self.universe
+        variables = set()
+        for block in self.cfg.blocks:
+            for instr in block.instructions:
+                operands = instr.uses() + ((instr.dest,) if instr.op in DEFINING_OPS else ())
+                for operand in operands:
+                    if operand[0] in (TEMP, VAR):
+                        universe.number(operand)
+                        if operand[0] == VAR:
+                            variables.add(operand)
+        self.variables = variables
+        self.variable_bits = self.bits(variables)
+        for block in self.cfg.blocks:
+            gen, kill = set(), set()
+            for instr in reversed(block.instructions):
+                self.transfer(instr, gen, kill)
+            self.gen[block.index] = self.bits(gen)
+            self.kill[block.index] = self.bits(kill)
+
+    def bits(self, operands):
+        index = self.universe.index
+        return self.universe.bits([index[operand] for operand in operands])
+
+    def transfer(self, instr, live, kill):
+        if instr.op in DEFINING_OPS:
+            live.discard(instr.dest)
+            kill.add(instr.dest)
+        if instr.op == Op.CALL:
+            live |= self.variables
+        for operand in instr.uses():
+            if operand[0] in (TEMP, VAR):
+                live.add(operand)
+
+    def boundary(self):
+        return self.variable_bits
+
+    def live_in(self, block):
+        return self.universe.members(self.block_in[block.index])
+
+    def live_out(self, block):
+        return self.universe.members(self.block_out[block.index])
+
+    # Operands live after each instruction of a block, walking from the last
+    # instruction to the first. The same set is updated in place between
+    # steps; copy it to keep a snapshot.
+    def instruction_live_out(self, block):
+        live = set(self.live_out(block))
+        kill = set()
+        for instr in reversed(block.instructions):
+            yield instr, live
+            self.transfer(instr, live, kill)
+
+
+class ReachingDefinitions(DataflowProblem):
+    direction = FORWARD
+
+    # Items are definition sites: (block index, offset within the block).
+    def compute_local_sets(self):
+        number = self.universe.number
+        definitions_of = {}
+        for block in self.cfg.blocks:
+            for offset, instr in enumerate(block.instructions):
+                if instr.op in DEFINING_OPS:
+                    definitions_of.setdefault(instr.dest, []).append(number((block.index, offset)))
+        self.definitions_of = definitions_of
+        bits = self.universe.bits
+        index = self.universe.index
+        definition_bits = {dest: bits(sites) for dest, sites in definitions_of.items()}
+        for block in self.cfg.blocks:
+            last_definition = {}
+            for offset, instr in enumerate(block.instructions):
+                if instr.op in DEFINING_OPS:
+                    last_definition[instr.dest] = index[(block.index, offset)]
+            gen = bits(list(last_definition.values()))
+            killed = 0
+            for dest in last_definition:
+                killed |= definition_bits[dest]
+            self.gen[block.index] = gen
+            self.kill[block.index] = killed & ~gen
+
+    def reaching(self, block):
+        return self.universe.members(self.block_in[block.index])
+
+
+def liveness(cfg):
+    return Liveness(cfg).solve()
+
+
+def reaching_definitions(cfg):
+    return ReachingDefinitions(cfg).solve()
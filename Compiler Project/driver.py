@@ -0,0 +1,243 @@
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+
+from tac import format_tac
+from register_allocator import ALLOCATORS
+from peephole import PeepholeOptimizer
+from incremental import IncrementalCompiler
+from compiler import compile_source
+from parallel_codegen import MIN_FUNCTIONS
+
+SOURCE_SUFFIX = '.src'
+
+
+class BuildOptions:
+    # Sent to every worker, so it only holds plain values.
+    def __init__(self, output_dir=None, opt_level=0, registers=None, allocator='linear',
+                 peephole=False, emit_tac=True, phases=False, fused=False, inline_budget=None,
+                 cache_dir=None, codegen_jobs=None):
+        self.output_dir = output_dir
+        self.opt_level = opt_level
+        self.registers = registers
+        self.allocator = allocator
+        self.peephole = peephole
+        self.emit_tac = emit_tac
+        self.phases = phases
+        self.fused = fused
+        self.inline_budget = inline_budget
+        self.cache_dir = cache_dir
+        self.codegen_jobs = codegen_jobs
+
+
+class FileResult:
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.tokens = 0
+        self.error = None
+        self.outputs = []
+        self.phases = None
+        self.units = 0
+        self.reused = 0
+        self.seconds = 0.0
+
+
+class BatchResult:
+    def __init__(self, files, seconds):
+        self.files = files
+        self.seconds = seconds
+        self.tokens = sum(result.tokens for result in files)
+        self.errors = [result for result in files if result.error]
+        self.units = sum(result.units for result in files)
+        self.reused = sum(result.reused for result in files)
+
+    def summary(self):
+        seconds = self.seconds or float('inf')
+        if self.units:
+            # Incremental builds only lex the units they compile.
+            return (f"{len(self.files)} files ({len(self.errors)} failed), {self.reused} of {self.units} "
+                    f"units reused in {self.seconds:.3f}s: {len(self.files) / seconds:,.1f} files/s")
+        return (f"{len(self.files)} files ({len(self.errors)} failed), {self.tokens} tokens "
+                f"in {self.seconds:.3f}s: {len(self.files) / seconds:,.1f} files/s, "
+                f"{self.tokens / seconds:,.0f} tokens/s")
+
+
+# Each input is paired with the name its artifacts are written under:
+# files found in a directory keep their path relative to it, files given
+# directly keep only their base name.
+def find_sources(paths, suffix=SOURCE_SUFFIX):
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    if file.endswith(suffix):
+                        full = os.path.join(root, file)
+                        found.append((full, os.path.relpath(full, path)))
+            sources.extend(found)
+        else:
+            sources.append((path, os.path.basename(path)))
+    return sources
+
+
+# Inputs whose artifacts would be written to the same place, as lists of
+# the paths that share one.
+def output_collisions(sources):
+    by_output = {}
+    for path, name in sources:
+        by_output.setdefault(os.path.splitext(name)[0], []).append(path)
+    return [paths for paths in by_output.values() if len(paths) > 1]
+
+
+def write_artifact(options, name, suffix, text):
+    path = os.path.join(options.output_dir, os.path.splitext(name)[0] + suffix)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+        f.write("\n")
+    return path
+
+
+# Runs in a worker process. Errors are recorded on the result rather than
+# raised, so one bad file never stops the rest of the batch.
+def compile_file(path, name, options, incremental=None):
+    if incremental is not None:
+        return compile_file_incrementally(path, name, options, incremental)
+    result = FileResult(path, name)
+    start = time.perf_counter()
+    # With --phases, what the compile prints is the phase dump; it stops
+    # where compilation failed, and the error itself goes on the result.
+    buffer = io.StringIO() if options.phases else None
+    try:
+        with open(path) as f:
+            source = f.read()
+        try:
+            with redirect_stdout(buffer) if buffer is not None else nullcontext():
+                compiled = compile_source(source, fused=options.fused, opt_level=options.opt_level,
+                                          registers=options.registers, allocator=options.allocator,
+                                          peephole=options.peephole, verbose=options.phases,
+                                          inline_budget=options.inline_budget, jobs=options.codegen_jobs)
+        finally:
+            if buffer is not None:
+                result.phases = buffer.getvalue()
+        result.tokens = compiled.tokens
+        result.error = compiled.error
+        if compiled.error is None and options.output_dir is not None:
+            result.outputs.append(write_artifact(options, name, '.asm', compiled.assembly_code))
+            if options.emit_tac:
+                result.outputs.append(write_artifact(options, name, '.tac', format_tac(compiled.tac_code)))
+    except Exception as error:
+        result.error = str(error)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+# Functions and statement runs unchanged since an earlier build, of this
+# file or any other, come from the artifact cache in options.cache_dir.
+def compile_file_incrementally(path, name, options, incremental):
+    result = FileResult(path, name)
+    start = time.perf_counter()
+    try:
+        with open(path) as f:
+            source = f.read()
+        built = incremental.compile(source)
+        result.units = built.units
+        result.reused = built.reused + built.loaded
+        result.error = built.error
+        if built.error is None and options.output_dir is not None:
+            assembly_code = built.assembly
+            if options.peephole:
+                assembly_code = PeepholeOptimizer().optimize(assembly_code)
+            result.outputs.append(write_artifact(options, name, '.asm', assembly_code))
+            if options.emit_tac:
+                result.outputs.append(write_artifact(options, name, '.tac', built.tac))
+    except Exception as error:
+        result.error = str(error)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def _compile_chunk(chunk, options):
+    incremental = None
+    if options.cache_dir is not None:
+        incremental = IncrementalCompiler(options.cache_dir, opt_level=options.opt_level,
+                                          registers=options.registers, allocator=options.allocator)
+    return [compile_file(path, name, options, incremental) for path, name in chunk]
+
+
+def compile_files(sources, options, jobs=None, chunk_size=None):
+    # Files are handed out in chunks: with thousands of small inputs, one
+    # task per file spends more time on inter-process traffic than compiling.
+    jobs = jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+    if jobs == 1 or len(sources) <= 1:
+        results = _compile_chunk(sources, options)
+    else:
+        chunk_size = chunk_size or max(1, min(64, len(sources) // (jobs * 4)))
+        chunks = [sources[i:i + chunk_size] for i in range(0, len(sources), chunk_size)]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = [result for chunk in executor.map(_compile_chunk, chunks, [options] * len(chunks))
+                       for result in chunk]
+    return BatchResult(results, time.perf_counter() - start)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compile many source files in parallel.")
+    arg_parser.add_argument('inputs', nargs='+', help="source files, or directories to search")
+    arg_parser.add_argument('-o', '--output-dir', help="write .asm and .tac artifacts here")
+    arg_parser.add_argument('-j', '--jobs', type=int, help="worker processes (default: one per CPU)")
+    arg_parser.add_argument('--codegen-jobs', type=int, metavar='N',
+                            help=f"generate code for a file with at least {MIN_FUNCTIONS} functions "
+                                 f"on N workers, one function at a time")
+    arg_parser.add_argument('--suffix', default=SOURCE_SUFFIX, help="source file suffix searched for in directories")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=0)
+    arg_parser.add_argument('--inline-budget', type=int,
+                            help="largest function body (TAC instructions) inlined at -O3")
+    arg_parser.add_argument('--fused', action='store_true',
+                            help="check names and generate TAC in one traversal")
+    arg_parser.add_argument('--registers', type=int, help="allocate temps to this many registers")
+    arg_parser.add_argument('--allocator', choices=sorted(ALLOCATORS), default='linear')
+    arg_parser.add_argument('--peephole', action='store_true', help="run the peephole optimizer over the assembly")
+    arg_parser.add_argument('--no-tac', action='store_true', help="only write assembly artifacts")
+    arg_parser.add_argument('--phases', action='store_true', help="print every compiler phase for each file")
+    arg_parser.add_argument('--incremental', metavar='CACHE_DIR',
+                            help="compile function by function, reusing the artifacts cached here")
+    args = arg_parser.parse_args(argv)
+    if args.incremental is not None:
+        for flag, used in (('--phases', args.phases), ('--fused', args.fused),
+                           ('--inline-budget', args.inline_budget is not None),
+                           ('--codegen-jobs', args.codegen_jobs is not None)):
+            if used:
+                arg_parser.error(f"{flag} is not supported with --incremental")
+
+    options = BuildOptions(args.output_dir, args.opt_level, args.registers, args.allocator,
+                           args.peephole, not args.no_tac, args.phases, args.fused, args.inline_budget,
+                           args.incremental, args.codegen_jobs)
+    sources = find_sources(args.inputs, args.suffix)
+    if args.output_dir is not None:
+        collisions = output_collisions(sources)
+        for paths in collisions:
+            print(f"artifacts of {', '.join(paths)} would overwrite each other; "
+                  f"compile them in separate runs or from a common directory", file=sys.stderr)
+        if collisions:
+            return 2
+    batch = compile_files(sources, options, args.jobs)
+    for result in batch.files:
+        if result.phases:
+            print(f"=== {result.path} ===")
+            print(result.phases)
+        if result.error:
+            print(f"{result.path}: {result.error}", file=sys.stderr)
+    print(batch.summary())
+    return 1 if batch.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import argparse
+import time
+
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from tac import format_tac
+from tac_generator import TACGenerator
+from fused_pass import SemanticTACGenerator
+from memory_benchmark import synthetic_program
+
+
+def separate(ast):
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(ast)
+    generator = TACGenerator(symbols=analyzer.symbols)
+    generator.visit(ast)
+    return generator.tac_code
+
+
+def fused(ast):
+    generator = SemanticTACGenerator()
+    generator.visit(ast)
+    return generator.tac_code
+
+
+# Best time of the middle end (semantic analysis and TAC generation) over
+# repeat runs, each on a freshly parsed tree; parsing is not timed.
+def measure(source, middle_end, repeat):
+    best = tac_code = None
+    for _ in range(repeat):
+        ast = Parser(Lexer(source).tokenize()).parse()
+        start = time.perf_counter()
+        tac_code = middle_end(ast)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, tac_code
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Compare the fused middle-end pass with separate semantic and TAC passes.")
+    arg_parser.add_argument('--functions', type=int, default=5000)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    source = synthetic_program(args.functions)
+    separate_seconds, separate_tac = measure(source, separate, args.repeat)
+    fused_seconds, fused_tac = measure(source, fused, args.repeat)
+    if format_tac(fused_tac) != format_tac(separate_tac):
+        raise SystemExit("the fused pass generated different TAC")
+    print(f"{args.functions} functions, best of {args.repeat}")
+    print(f"separate  {separate_seconds:.3f}s")
+    print(f"fused     {fused_seconds:.3f}s  ({1 - fused_seconds / separate_seconds:.0%} less)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+from semantic import SemanticAnalyzer
+from symbols import VARIABLE
+from tac_generator import TACGenerator
+
+
+# Checks names and emits TAC in one traversal. Checks run at the same points
+# of the walk as in SemanticAnalyzer, so the first error reported is the same.
+# fused_benchmark.py compares it with the two separate passes: on 5000
+# functions it takes between 5% and 25% less time, about 15% typically
+# (0.38s against 0.45s), not the 40% once quoted for it.
+class SemanticTACGenerator(TACGenerator):
+    def __init__(self):
+        self.semantic = SemanticAnalyzer()
+        super().__init__(symbols=self.semantic.symbols)
+
+    def visit_identifier(self, node):
+        node.symbol = self.semantic.check_defined(node.value)
+        return super().visit_identifier(node)
+
+    def visit_assign(self, node):
+        target = node.children[0]
+        target.symbol = self.semantic.declare(target.value, VARIABLE)
+        return super().visit_assign(node)
+
+    def visit_func_def(self, node):
+        self.semantic.enter_function(node)
+        yield from super().visit_func_def(node)
+        self.semantic.leave_function()
+
+    def visit_func_call(self, node):
+        name_node = node.children[0]
+        name_node.symbol = self.semantic.check_call(name_node.value, len(node.children) - 1)
+        return super().visit_func_call(node)
@@ -0,0 +1,369 @@
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from symbols import FUNCTION, VARIABLE
+from tac import format_tac
+from tac_generator import TACGenerator
+from assembly_generator import AssemblyGenerator
+from optimizer import pass_manager_for_level
+from register_allocator import allocate_registers
+
+# Bumped whenever code generation changes, so stale artifacts never match.
+CACHE_VERSION = 4
+
+# "\bdef" is left to the loop below: a leading \b makes the scan several
+# times slower than matching the literal.
+_UNIT_RE = re.compile(r"\{|\}|def\b")
+_FUNCTION_NAME_RE = re.compile(r"def\s+([^\W\d]\w*)")
+_NAME_RE = re.compile(r"[^\W\d]\w*")
+
+
+def _is_word(char):
+    return char.isalnum() or char == '_'
+
+
+class SourceUnit:
+    __slots__ = ('kind', 'name', 'text', 'line', 'column')
+
+    def __init__(self, kind, name, text, line, column):
+        self.kind = kind
+        self.name = name
+        self.text = text
+        self.line = line
+        self.column = column
+
+
+def split_units(source):
+    # Top-level units: each "def ... { ... }" and each run of statements
+    # between them. Braces are matched on the raw text, which is enough to
+    # find unit boundaries without lexing the whole file. Returns None when
+    # the text is not balanced; the caller then compiles the file whole.
+    spans = []
+    depth = 0
+    run_start = 0
+    function_start = None
+    for match in _UNIT_RE.finditer(source):
+        start = match.start()
+        char = source[start]
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0 and function_start is not None:
+                spans.append(('function', function_start, start + 1))
+                function_start = None
+                run_start = start + 1
+        elif depth == 0 and function_start is None and not (start and _is_word(source[start - 1])):
+            if source[run_start:start].strip():
+                spans.append(('statements', run_start, start))
+            function_start = start
+    if depth or function_start is not None:
+        return None
+    if source[run_start:].strip():
+        spans.append(('statements', run_start, len(source)))
+
+    units = []
+    line, position = 1, 0
+    for kind, start, end in spans:
+        line += source.count('\n', position, start)
+        position = start
+        column = start - source.rfind('\n', 0, start)
+        name = None
+        text = source[start:end]
+        if kind == 'function':
+            match = _FUNCTION_NAME_RE.match(text)
+            name = match.group(1) if match else None
+        units.append(SourceUnit(kind, name, text, line, column))
+    return units
+
+
+class UnitSemantics(SemanticAnalyzer):
+    # Checks one unit against only its own declarations. A name the unit
+    # cannot resolve is recorded in requires, in order, with the number of
+    # arguments it is called with (None for a variable), to be checked
+    # against the global names of the units before it when linking; defines
+    # and arities are what the unit adds to the global scope. Unresolved
+    # names still get a symbol, outside every scope, so code can be
+    # generated for them. A function assigning to a name in globals writes
+    # that global, as it would in a whole-file build, instead of declaring
+    # a local.
+    def __init__(self, globals=()):
+        super().__init__()
+        self.globals = frozenset(globals)
+        self.requires = []
+        self.required = set()
+        self.external = {}
+
+    def require(self, name, arity):
+        if (name, arity) not in self.required:
+            self.required.add((name, arity))
+            self.requires.append((name, arity))
+        symbol = self.external.get(name)
+        if symbol is None:
+            symbol = self.external[name] = self.symbols.add(name, VARIABLE if arity is None else FUNCTION)
+        return symbol
+
+    def declare(self, name, kind):
+        if kind == VARIABLE and name in self.globals and self.scope.lookup(name) is None:
+            return self.require(name, None)
+        return super().declare(name, kind)
+
+    def check_defined(self, name):
+        symbol = self.scope.lookup(name)
+        return symbol if symbol is not None else self.require(name, None)
+
+    def check_call(self, name, count):
+        if self.scope.lookup(name) is None:
+            return self.require(name, count)
+        return super().check_call(name, count)
+
+    @property
+    def defines(self):
+        return self.symbols.global_kinds()
+
+    @property
+    def arities(self):
+        return self.symbols.global_arities()
+
+
+class UnitArtifact:
+    # tac, main and functions are newline-joined text, so linking joins one
+    # string per unit rather than every line of the program.
+    def __init__(self, tac, main, functions, requires, defines, arities, error=None):
+        self.tac = tac
+        self.main = main
+        self.functions = functions
+        self.requires = requires
+        self.defines = defines
+        self.arities = arities
+        self.error = error
+
+    def to_bytes(self):
+        return json.dumps({
+            'tac': self.tac, 'main': self.main, 'functions': self.functions,
+            'requires': self.requires, 'defines': self.defines, 'arities': self.arities,
+            'error': self.error,
+        }).encode('utf-8')
+
+    @classmethod
+    def from_bytes(cls, data):
+        fields = json.loads(data.decode('utf-8'))
+        fields['requires'] = [tuple(requirement) for requirement in fields['requires']]
+        return cls(**fields)
+
+
+class ArtifactCache:
+    # One file per artifact. Recency is the file's mtime, refreshed on every
+    # hit, so the LRU order survives across processes; the least recently
+    # used files are deleted once the directory grows past max_bytes.
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.unit'):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-len('.unit')], stat.st_size))
+        found.sort()
+        self.entries = OrderedDict((key, size) for _, key, size in found)
+        self.size = sum(self.entries.values())
+        self.evictions = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.unit')
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.size -= self.entries.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+        self.size += len(data) - self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        self.evict()
+
+    def evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+
+class BuildResult:
+    def __init__(self, tac=None, assembly=None, error=None):
+        self.tac = tac
+        self.assembly = assembly
+        self.error = error
+        self.units = 0
+        self.compiled = 0
+        self.reused = 0
+        self.loaded = 0
+        self.seconds = 0.0
+
+
+class IncrementalCompiler:
+    # Compiles a source file unit by unit. Artifacts are looked up by a hash
+    # of the unit's text and the build options: first among the units of the
+    # previous build, then in the on-disk cache, and only then compiled.
+    # Whether an assignment in a function writes a global or declares a
+    # local depends on the globals of the units before it, so the key of a
+    # function unit also covers the earlier globals its text names.
+    # Temps and labels are namespaced per unit (the function name, or a hash
+    # of a statement run), so cached pieces link without renumbering.
+    def __init__(self, cache_dir=None, max_cache_bytes=64 * 1024 * 1024, opt_level=0,
+                 registers=None, allocator='linear'):
+        self.cache = ArtifactCache(cache_dir, max_cache_bytes) if cache_dir else None
+        self.opt_level = opt_level
+        self.registers = registers
+        self.allocator = allocator
+        self.options = f"{CACHE_VERSION}:{opt_level}:{registers}:{allocator}"
+        self.artifacts = {}
+
+    def compile(self, source):
+        start = time.perf_counter()
+        units = split_units(source)
+        result = self.link(units) if units is not None else None
+        if result is None:
+            result = self.compile_whole(source)
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def link(self, units):
+        result = BuildResult()
+        previous, self.artifacts = self.artifacts, {}
+        namespaces = {}
+        artifacts = []
+        defined = set()
+        for unit in units:
+            if unit.kind == 'function' and unit.name:
+                base = unit.name
+            else:
+                base = f"_{zlib.crc32(unit.text.encode('utf-8')):08x}"
+            seen = namespaces.get(base, 0)
+            namespaces[base] = seen + 1
+            namespace = base if not seen else f"{base}~{seen + 1}"
+
+            bound = ()
+            if unit.kind == 'function':
+                bound = tuple(sorted(defined.intersection(_NAME_RE.findall(unit.text))))
+
+            artifact = previous.get((namespace, unit.text, bound))
+            if artifact is not None:
+                result.reused += 1
+            else:
+                key = hashlib.blake2b(f"{self.options}:{namespace}:{','.join(bound)}:{unit.text}".encode('utf-8'),
+                                      digest_size=16).hexdigest()
+                data = self.cache.get(key) if self.cache is not None else None
+                if data is not None:
+                    artifact = UnitArtifact.from_bytes(data)
+                    result.loaded += 1
+                else:
+                    artifact = self.compile_unit(unit, namespace, bound)
+                    if artifact is None:
+                        return None
+                    result.compiled += 1
+                    if self.cache is not None:
+                        self.cache.put(key, artifact.to_bytes())
+            self.artifacts[namespace, unit.text, bound] = artifact
+            artifacts.append(artifact)
+            defined.update(artifact.defines)
+        result.units = len(units)
+
+        symbol_table = {}
+        arities = {}
+        for artifact in artifacts:
+            for name, count in artifact.requires:
+                if count is None:
+                    if name not in symbol_table:
+                        result.error = f"Error: Variable or function '{name}' is not defined."
+                elif symbol_table.get(name) != 'function':
+                    result.error = f"Error: Function '{name}' is not defined."
+                elif arities[name] != count:
+                    result.error = f"Error: Function '{name}' takes {arities[name]} arguments but {count} were given."
+                if result.error:
+                    return result
+            if artifact.error:
+                result.error = artifact.error
+                return result
+            symbol_table.update(artifact.defines)
+            arities.update(artifact.arities)
+
+        result.tac = "\n".join(artifact.tac for artifact in artifacts if artifact.tac)
+        main = [artifact.main for artifact in artifacts if artifact.main]
+        functions = [artifact.functions for artifact in artifacts if artifact.functions]
+        result.assembly = "\n".join(main + ["  HALT"] + functions)
+        return result
+
+    # None means the unit does not parse on its own; the caller then falls
+    # back to compiling the whole file, which reports the error exactly as a
+    # normal build would.
+    def compile_unit(self, unit, namespace, globals=()):
+        try:
+            ast = Parser(Lexer(unit.text, unit.line, unit.column).tokenize()).parse()
+        except Exception:
+            return None
+        semantics = UnitSemantics(globals)
+        try:
+            semantics.visit(ast)
+        except (NameError, TypeError) as error:
+            return UnitArtifact("", "", "", semantics.requires, {}, {}, str(error))
+        generator = TACGenerator(namespace, semantics.symbols)
+        generator.visit(ast)
+        tac_code, main, functions = self.generate(generator.tac_code)
+        return UnitArtifact(format_tac(tac_code), "\n".join(main), "\n".join(functions),
+                            semantics.requires, semantics.defines, semantics.arities)
+
+    def generate(self, tac_code):
+        tac_code = pass_manager_for_level(self.opt_level).run(tac_code)
+        allocation = None
+        if self.registers is not None:
+            allocation = allocate_registers(tac_code, self.registers, self.allocator)
+        main, functions = AssemblyGenerator(tac_code, allocation).generate_sections()
+        return tac_code, main, functions
+
+    def compile_whole(self, source):
+        self.artifacts = {}
+        result = BuildResult()
+        result.units = result.compiled = 1
+        try:
+            ast = Parser(Lexer(source).tokenize()).parse()
+            analyzer = SemanticAnalyzer()
+            analyzer.visit(ast)
+        except Exception as error:
+            result.error = str(error)
+            return result
+        generator = TACGenerator(symbols=analyzer.symbols)
+        generator.visit(ast)
+        tac_code, main, functions = self.generate(generator.tac_code)
+        result.tac = format_tac(tac_code)
+        result.assembly = "\n".join(main + ["  HALT"] + functions)
+        return result
@@ -0,0 +1,55 @@
+import argparse
+import shutil
+import tempfile
+
+from incremental import IncrementalCompiler
+from memory_benchmark import synthetic_program
+
+
+def edit_one_line(source):
+    # Changes one statement inside the last function of the synthetic program.
+    position = source.rindex("c = b * ")
+    return source[:position] + "c = 1 + b * " + source[position + len("c = b * "):]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measure incremental rebuild times after small edits.")
+    arg_parser.add_argument('--functions', type=int, default=5000)
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=0)
+    arg_parser.add_argument('--registers', type=int, default=None)
+    args = arg_parser.parse_args()
+
+    source = synthetic_program(args.functions)
+    edited = edit_one_line(source)
+    cache_dir = tempfile.mkdtemp(prefix='incremental-')
+    options = dict(opt_level=args.opt_level, registers=args.registers)
+    columns = ('build', 'units', 'compiled', 'reused', 'loaded', 'seconds')
+    print("".join(f"{column:>12}" for column in columns))
+    try:
+        compiler = IncrementalCompiler(cache_dir, **options)
+        builds = [('cold', source), ('unchanged', source), ('one-line', edited), ('disk-cache', edited)]
+        for name, text in builds:
+            if name == 'disk-cache':
+                # A fresh process has only the on-disk cache to go on.
+                compiler = IncrementalCompiler(cache_dir, **options)
+            result = compiler.compile(text)
+            if result.error:
+                raise SystemExit(f"{name}: {result.error}")
+            row = {
+                'build': name,
+                'units': result.units,
+                'compiled': result.compiled,
+                'reused': result.reused,
+                'loaded': result.loaded,
+                'seconds': f"{result.seconds:.3f}",
+            }
+            print("".join(f"{row[column]:>12}" for column in columns))
+        whole = compiler.compile_whole(edited)
+        if whole.assembly.count("\n") != result.assembly.count("\n"):
+            raise SystemExit("incremental build differs in size from the whole-file build")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
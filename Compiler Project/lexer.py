@@ -1,84 +1,90 @@
-from structures import Token
+import re
 
-class Lexer:
-    def __init__(self, text):
-        self.text = text
-        self.pos = 0
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-        self.keywords = {'print', 'if', 'else', 'while', 'def', 'return'}
+from structures import Token
 
-    def advance(self):
-        self.pos += 1
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
+KEYWORDS = {kw: kw.upper() for kw in ('print', 'if', 'else', 'while', 'def', 'return')}
 
-    def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
+PUNCTUATION = {
+    '+': 'PLUS', '-': 'MINUS', '*': 'TIMES', '/': 'DIVIDE',
+    '=': 'ASSIGN', '(': 'LPAREN', ')': 'RPAREN', ';': 'SEMICOLON',
+    '{': 'LBRACE', '}': 'RBRACE', ',': 'COMMA'
+}
 
-    def get_number(self):
-        result = ''
-        while self.current_char is not None and self.current_char.isdigit():
-            result += self.current_char
-            self.advance()
-        return int(result)
+# One master pattern: leading blanks are absorbed by every match, and the
+# alternative that matched is identified by its group index (match.lastindex).
+# Newlines get their own alternative so line numbers are tracked for free.
+_NEWLINE, _IDENTIFIER, _NUMBER, _REL_OP, _PUNCT, _INVALID = 1, 2, 3, 4, 5, 6
+_TOKEN_RE = re.compile(r"""
+    [^\S\n]*
+    (?:
+        (\n)                    # newline
+      | ([^\W\d]\w*)            # identifier or keyword
+      | (\d+)                   # number
+      | ([<>=!]=|[<>!])         # relational operator
+      | ([-+*/=(){};,])         # punctuation
+      | (\S)                    # anything else is an error
+    )
+""", re.VERBOSE)
 
-    def get_identifier(self):
-        result = ''
-        while self.current_char is not None and (self.current_char.isalnum() or self.current_char == '_'):
-            result += self.current_char
-            self.advance()
-        
-        token_type = result.upper() if result in self.keywords else 'IDENTIFIER'
-        return Token(token_type, result)
-    
-    def get_relational_op(self):
-        op = self.current_char
-        self.advance()
-        if self.current_char == '=':
-            op += self.current_char
-            self.advance()
-        return Token('REL_OP', op)
 
-    def tokenize(self):
-        tokens = []
-        while self.current_char is not None:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
-            
-            if self.current_char.isdigit():
-                tokens.append(Token('NUMBER', self.get_number()))
-                continue
+class Lexer:
+    # line and column give the position of text[0] when text is a slice of a
+    # larger source, so token positions refer to the whole file.
+    def __init__(self, text, line=1, column=1):
+        self.text = text
+        self.keywords = KEYWORDS
+        self.line = line
+        self.column = column
 
-            if self.current_char.isalnum() or self.current_char == '_':
-                tokens.append(self.get_identifier())
-                continue
+    def iter_tokens(self):
+        return self.iter_chunk_tokens((self.text,))
 
-            if self.current_char in ('>', '<', '!'):
-                if self.current_char == '!' and self.text[self.pos+1] == '=':
-                    self.advance()
-                    self.advance()
-                    tokens.append(Token('REL_OP', '!='))
+    # Tokens of text arriving in pieces. No token spans a newline, so each
+    # chunk must end at a line boundary; line_start is moved back by the
+    # length of every finished chunk to keep columns relative to its line.
+    def iter_chunk_tokens(self, chunks):
+        keywords = self.keywords
+        punctuation = PUNCTUATION
+        line, line_start = self.line, 1 - self.column
+        for text in chunks:
+            for match in _TOKEN_RE.finditer(text):
+                kind = match.lastindex
+                if kind == _NEWLINE:
+                    line += 1
+                    line_start = match.end()
                     continue
-                tokens.append(self.get_relational_op())
-                continue
-            
-            token_map = {
-                '+': 'PLUS', '-': 'MINUS', '*': 'TIMES', '/': 'DIVIDE',
-                '=': 'ASSIGN', '(': 'LPAREN', ')': 'RPAREN', ';': 'SEMICOLON',
-                '{': 'LBRACE', '}': 'RBRACE', ',': 'COMMA'
-            }
-            if self.current_char in token_map:
-                if self.current_char == '=' and self.text[self.pos+1] == '=':
-                    self.advance()
-                    self.advance()
-                    tokens.append(Token('REL_OP', '=='))
+                value = match.group(kind)
+                column = match.start(kind) - line_start + 1
+                if kind == _IDENTIFIER:
+                    yield Token(keywords.get(value, 'IDENTIFIER'), value, line, column)
+                elif kind == _PUNCT:
+                    yield Token(punctuation[value], value, line, column)
+                elif kind == _NUMBER:
+                    yield Token('NUMBER', int(value), line, column)
+                elif kind == _REL_OP:
+                    yield Token('REL_OP', value, line, column)
                 else:
-                    tokens.append(Token(token_map[self.current_char], self.current_char))
-                    self.advance()
-                continue
+                    raise Exception(f"Invalid character: {value} at line {line}, column {column}")
+            line_start -= len(text)
+        yield Token('EOF', None, line, 1 - line_start)
+
+    def tokenize(self):
+        return list(self.iter_tokens())
+
 
-            raise Exception(f"Invalid character: {self.current_char}")
-        
-        tokens.append(Token('EOF', None))
-        return tokens
\ No newline at end of file
+# Reads a file in line-aligned chunks for Lexer.iter_chunk_tokens.
+def read_chunks(file, size=1 << 16):
+    rest = ""
+    while True:
+        block = file.read(size)
+        if not block:
+            break
+        block = rest + block
+        end = block.rfind('\n') + 1
+        if end:
+            yield block[:end]
+            rest = block[end:]
+        else:
+            rest = block
+    if rest:
+        yield rest
@@ -0,0 +1,527 @@
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from tac import (
+    Op, Instr, Temp, Const, Label, TEMP, VAR, CONST, BINARY_SYMBOLS, DEFINING_OPS, IMMEDIATES, evaluate_binary
+)
+from cfg import CodeEdits, DominatorTree, build_cfgs
+
+# A loop is fully unrolled when it runs at most MAX_UNROLL_TRIPS times and
+# the copies of its body add up to at most UNROLL_BUDGET TAC instructions.
+MAX_UNROLL_TRIPS = 8
+UNROLL_BUDGET = 64
+RELATIONAL_OPS = frozenset((Op.LT, Op.GT, Op.EQ, Op.NE, Op.LE, Op.GE))
+JUMP_OPS = frozenset((Op.GOTO, Op.IF_FALSE))
+# Instructions an unrolled loop's counter initialisation may not be
+# separated from the loop by.
+STRAIGHT_LINE_BREAKS = frozenset((Op.LABEL, Op.GOTO, Op.IF_FALSE, Op.RETURN, Op.CALL, Op.FUNC_BEGIN,
+                                  Op.FUNC_END))
+
+
+class Loop:
+    # A natural loop: the header and every block that reaches one of the
+    # back edges into it without going through the header. blocks holds only
+    # the blocks not inside an inner loop. Loops are numbered in preorder of
+    # the nesting forest; the loops inside this one are numbered pre + 1 to
+    # last.
+    def __init__(self, cfg, tree, header):
+        self.cfg = cfg
+        self.tree = tree
+        self.header = header
+        self.blocks = [header.index]
+        self.latches = []
+        self.children = []
+        self.parent = None
+        self.pre = self.last = 0
+        self._preheader = False
+
+    def contains(self, loop):
+        return self.pre <= loop.pre <= self.last
+
+    # Code placed in front of the header's first label runs once before the
+    # loop, provided the loop is only entered by falling through from the
+    # block laid out before it. Returns that position, or None. Predecessors
+    # the header dominates are the loop's own back edges.
+    def preheader_position(self):
+        if self._preheader is False:
+            self._preheader = self.find_preheader()
+        return self._preheader
+
+    def find_preheader(self):
+        header = self.header
+        if not header.instructions or header.instructions[0].op != Op.LABEL:
+            return None
+        labels = {instr.arg1 for instr in header.instructions if instr.op == Op.LABEL}
+        for predecessor in header.predecessors:
+            if self.tree.dominates(header.index, predecessor.index):
+                continue
+            if predecessor.index != header.index - 1:
+                return None
+            last = predecessor.instructions[-1]
+            if (last.op == Op.GOTO and last.arg1 in labels) or (last.op == Op.IF_FALSE and last.arg2 in labels):
+                return None
+        return header.positions[0]
+
+
+class LoopForest:
+    # Natural loops of a region and how they nest. Loops sharing a header are
+    # one loop. Headers are handled in reverse preorder of the dominator tree,
+    # which puts an inner loop's header first; once built, an inner loop is
+    # represented by its header, so the walk for the outer loop steps over it
+    # in one move and every block is visited once.
+    def __init__(self, cfg, tree=None):
+        tree = tree if tree is not None else DominatorTree(cfg)
+        blocks = cfg.blocks
+        latches = defaultdict(list)
+        for block in blocks:
+            if not tree.reachable(block.index):
+                continue
+            for successor in block.successors:
+                if tree.dominates(successor.index, block.index):
+                    latches[successor.index].append(block)
+
+        representative = list(range(len(blocks)))
+
+        def find(index):
+            while representative[index] != index:
+                representative[index] = representative[representative[index]]
+                index = representative[index]
+            return index
+
+        self.cfg = cfg
+        self.loops = []
+        self.innermost = [None] * len(blocks)
+        loop_at = {}
+        for header in sorted(latches, key=lambda index: tree.preorder[index], reverse=True):
+            loop = Loop(cfg, tree, blocks[header])
+            loop.latches = latches[header]
+            seen = {header}
+            work = [latch.index for latch in loop.latches]
+            while work:
+                index = find(work.pop())
+                if index in seen:
+                    continue
+                seen.add(index)
+                inner = loop_at.get(index)
+                if inner is not None:
+                    inner.parent = loop
+                    loop.children.append(inner)
+                else:
+                    loop.blocks.append(index)
+                representative[index] = header
+                work.extend(predecessor.index for predecessor in blocks[index].predecessors
+                            if tree.reachable(predecessor.index))
+            for index in loop.blocks:
+                self.innermost[index] = loop
+            loop_at[header] = loop
+            self.loops.append(loop)
+        self.number()
+
+    # Numbers the loops in preorder and gives each its depth and the
+    # ancestors 1, 2, 4, ... levels out, for the ancestor queries below.
+    def number(self):
+        self.preorder = []
+        for root in self.loops:
+            if root.parent is not None:
+                continue
+            root.depth = 0
+            stack = [(root, iter(root.children))]
+            self.enter(root)
+            while stack:
+                loop, children = stack[-1]
+                for child in children:
+                    child.depth = loop.depth + 1
+                    self.enter(child)
+                    stack.append((child, iter(child.children)))
+                    break
+                else:
+                    loop.last = len(self.preorder)
+                    stack.pop()
+
+    def enter(self, loop):
+        self.preorder.append(loop)
+        loop.pre = len(self.preorder)
+        jumps = loop.jumps = []
+        ancestor = loop.parent
+        while ancestor is not None:
+            jumps.append(ancestor)
+            ancestor = ancestor.jumps[len(jumps) - 1] if len(ancestor.jumps) >= len(jumps) else None
+
+    def at(self, pre):
+        return self.preorder[pre - 1]
+
+    # The loop around loop (or loop itself) at the given nesting depth.
+    def ancestor(self, loop, depth):
+        step = loop.depth - depth
+        level = 0
+        while step:
+            if step & 1:
+                loop = loop.jumps[level]
+            step >>= 1
+            level += 1
+        return loop
+
+    # Innermost loop containing both, or None if they are in separate nests.
+    def common(self, first, second):
+        if first.depth > second.depth:
+            first = self.ancestor(first, second.depth)
+        else:
+            second = self.ancestor(second, first.depth)
+        for level in range(len(first.jumps) - 1, -1, -1):
+            if level < len(first.jumps) and first.jumps[level] is not second.jumps[level]:
+                first = first.jumps[level]
+                second = second.jumps[level]
+        if first is second:
+            return first
+        return first.parent if first.parent is second.parent else None
+
+    # (instruction, position in the full TAC list, innermost loop) for
+    # every instruction inside a loop, in layout order.
+    def instructions(self):
+        for block, loop in zip(self.cfg.blocks, self.innermost):
+            if loop is not None:
+                for instr, position in zip(block.instructions, block.positions):
+                    yield instr, position, loop
+
+
+class LoopSites:
+    # For each operand, the loops (by preorder number) it has some kind of
+    # site in. Inside one loop's numbers lie exactly the loops within it, so
+    # questions about a loop are answered by bisection; the sites closest to
+    # a loop in preorder lead to the innermost loop around it with a site.
+    def __init__(self, forest):
+        self.forest = forest
+        self.sites = defaultdict(list)
+
+    def add(self, key, loop):
+        insort(self.sites[key], loop.pre)
+
+    def within(self, key, loop):
+        sites = self.sites.get(key)
+        if not sites:
+            return False
+        index = bisect_left(sites, loop.pre)
+        return index < len(sites) and sites[index] <= loop.last
+
+    # Innermost loop around loop, or loop itself, with a site of key inside.
+    def around(self, key, loop):
+        sites = self.sites.get(key)
+        if not sites:
+            return None
+        index = bisect_left(sites, loop.pre)
+        if index < len(sites) and sites[index] <= loop.last:
+            return loop
+        forest = self.forest
+        innermost = None
+        for neighbour in (index - 1, bisect_left(sites, loop.last + 1, index)):
+            if 0 <= neighbour < len(sites):
+                common = forest.common(loop, forest.at(sites[neighbour]))
+                if common is not None and (innermost is None or common.depth > innermost.depth):
+                    innermost = common
+        return innermost
+
+    # Outermost loop around loop, or loop itself, with no site of key inside.
+    def outermost_without(self, key, loop):
+        around = self.around(key, loop)
+        if around is loop:
+            return None
+        return self.forest.ancestor(loop, 0 if around is None else around.depth + 1)
+
+
+def defines(instr, operand):
+    return instr.op in DEFINING_OPS and instr.dest == operand
+
+
+# Loop forests of the regions of code that have loops, with the
+# instructions inside their loops.
+def region_loops(code):
+    for cfg in build_cfgs(code):
+        forest = LoopForest(cfg)
+        if forest.loops:
+            yield forest, list(forest.instructions())
+
+
+# Moves computations whose operands do not change inside a loop to the
+# preheader of the outermost loop that holds for, out of a whole nest at
+# once. Only temps defined once in the region qualify, so the moved value is
+# the only one the temp ever holds. Variables are read from memory that a
+# call may write, so a variable operand only counts as unchanged in loops
+# without calls. Division is only moved when it cannot fail.
+def hoist_invariants(code):
+    edits = CodeEdits()
+    hoisted_count = 0
+    for forest, body in region_loops(code):
+        definitions = Counter(instr.dest for block in forest.cfg.blocks for instr in block.instructions
+                              if instr.op in DEFINING_OPS)
+        defined = LoopSites(forest)
+        for instr, _, loop in body:
+            if instr.op in DEFINING_OPS:
+                defined.add(instr.dest, loop)
+                if instr.op == Op.CALL:
+                    defined.add(None, loop)
+        # Outermost loop around each loop, going out through loops that all
+        # have a preheader.
+        reachable = {}
+        for loop in forest.preorder:
+            if loop.preheader_position() is None:
+                reachable[loop] = None
+            else:
+                reachable[loop] = reachable.get(loop.parent) or loop
+        # Loop in front of which each moved temp is now computed.
+        moved = {}
+
+        # Outermost loop around loop that operand can be computed in front of.
+        def reach(operand, loop):
+            if operand[0] == CONST:
+                return reachable[loop]
+            if operand in moved:
+                limits = (moved[operand] if moved[operand].contains(loop) else None,)
+            elif operand[0] == VAR:
+                limits = (defined.outermost_without(operand, loop), defined.outermost_without(None, loop))
+            else:
+                limits = (defined.outermost_without(operand, loop),)
+            outermost = reachable[loop]
+            for limit in limits:
+                if limit is None or outermost is None:
+                    return None
+                if limit.depth > outermost.depth:
+                    outermost = limit
+            return outermost
+
+        for instr, position, loop in body:
+            if instr.op not in BINARY_SYMBOLS or instr.dest[0] != TEMP or definitions[instr.dest] != 1:
+                continue
+            if instr.op == Op.DIV and not (instr.arg2[0] == CONST and instr.arg2[1] != 0):
+                continue
+            first = reach(instr.arg1, loop)
+            second = first and reach(instr.arg2, loop)
+            if second is None:
+                continue
+            target = first if first.depth >= second.depth else second
+            moved[instr.dest] = target
+            edits.replace(position, ())
+            edits.insert_before(target.preheader_position(), instr)
+            hoisted_count += 1
+    return (edits.apply(code) if edits else code), hoisted_count
+
+
+# Step of "v = v + c" or "v = v - c", or None for any other definition of v.
+def induction_step(instr):
+    dest = instr.dest
+    if instr.op == Op.ADD:
+        if instr.arg1 == dest and instr.arg2[0] == CONST:
+            return instr.arg2[1]
+        if instr.arg2 == dest and instr.arg1[0] == CONST:
+            return instr.arg1[1]
+    elif instr.op == Op.SUB and instr.arg1 == dest and instr.arg2[0] == CONST:
+        return -instr.arg2[1]
+    return None
+
+
+# Replaces "t = i * k" inside a loop, where i is a basic induction variable
+# (every definition of it in the loop is "i = i + c" or "i = i - c") and k a
+# constant, with a copy of a temp that holds i * k: it is computed once in
+# the preheader and advanced by c * k right after every update of i. The
+# loop used is the innermost one around the multiplication that updates i
+# somewhere inside it.
+# Loops with calls are skipped, since a call may assign i. New temps are
+# numbered from first_temp; returns the code and how many were made.
+def reduce_strength(code, first_temp=0):
+    edits = CodeEdits()
+    made = 0
+    for forest, body in region_loops(code):
+        others = LoopSites(forest)
+        stepped = LoopSites(forest)
+        updates = defaultdict(list)
+        candidates = []
+        for instr, position, loop in body:
+            if instr.op not in DEFINING_OPS:
+                continue
+            step = induction_step(instr)
+            if step is None:
+                others.add(instr.dest, loop)
+            else:
+                stepped.add(instr.dest, loop)
+                updates[instr.dest].append((loop, position, step))
+            if instr.op == Op.CALL:
+                others.add(None, loop)
+            elif instr.op == Op.MUL and CONST in (instr.arg1[0], instr.arg2[0]):
+                candidates.append((instr, position, loop))
+
+        temps = {}
+        for instr, position, loop in candidates:
+            if instr.arg1 in updates and instr.arg2[0] == CONST:
+                variable, factor = instr.arg1, instr.arg2[1]
+            elif instr.arg2 in updates and instr.arg1[0] == CONST:
+                variable, factor = instr.arg2, instr.arg1[1]
+            else:
+                continue
+            outer = stepped.around(variable, loop)
+            if (outer is None or outer.preheader_position() is None or others.within(variable, outer)
+                    or others.within(None, outer)):
+                continue
+            temp = temps.get((outer, variable, factor))
+            if temp is None:
+                increments = [(site, step * factor) for update_loop, site, step in updates[variable]
+                              if outer.contains(update_loop)]
+                # An increment has to fit an immediate operand.
+                if any(abs(increment) not in IMMEDIATES for _, increment in increments):
+                    continue
+                header = outer.header.instructions[0].arg1[1]
+                temp = temps[(outer, variable, factor)] = Temp(f"{header}.s{first_temp + made}")
+                made += 1
+                edits.insert_before(outer.preheader_position(), Instr(Op.MUL, temp, variable, Const(factor)))
+                for site, increment in increments:
+                    if increment >= 0:
+                        edits.insert_after(site, Instr(Op.ADD, temp, temp, Const(increment)))
+                    else:
+                        edits.insert_after(site, Instr(Op.SUB, temp, temp, Const(-increment)))
+            edits.replace(position, (Instr(Op.COPY, instr.dest, temp),))
+    return (edits.apply(code) if edits else code), made
+
+
+# Fully unrolls while loops with a small constant trip count, in the shape
+# TACGenerator lowers them to:
+#
+#   L_start:  t = i < K;  if_false t goto L_end;  body;  goto L_start;  L_end:
+#
+# where i is set to a constant just before the loop and the body updates it
+# by a constant exactly once per iteration. The body is repeated once per
+# iteration with its labels renamed; the test and both jumps disappear.
+def unroll_loops(code, max_trips=MAX_UNROLL_TRIPS, budget=UNROLL_BUDGET):
+    label_positions = {}
+    references = Counter()
+    temp_uses = Counter()
+    for position, instr in enumerate(code):
+        if instr.op == Op.LABEL:
+            label_positions[instr.arg1] = position
+        elif instr.op == Op.GOTO:
+            references[instr.arg1] += 1
+        elif instr.op == Op.IF_FALSE:
+            references[instr.arg2] += 1
+        for operand in instr.uses():
+            if operand[0] == TEMP:
+                temp_uses[operand] += 1
+
+    unrolled = []
+    unrolled_count = 0
+    position = 0
+    while position < len(code):
+        plan = plan_unroll(code, position, label_positions, references, temp_uses, max_trips, budget)
+        if plan is None:
+            unrolled.append(code[position])
+            position += 1
+            continue
+        trips, body, end = plan
+        start = code[position].arg1[1]
+        own_labels = {instr.arg1 for instr in body if instr.op == Op.LABEL}
+        for trip in range(trips):
+            prefix = f"{start}.u{trip}."
+
+            def rename(operand):
+                return Label(prefix + operand[1]) if operand in own_labels else operand
+
+            for instr in body:
+                if instr.op == Op.LABEL or instr.op == Op.GOTO:
+                    instr = Instr(instr.op, None, rename(instr.arg1))
+                elif instr.op == Op.IF_FALSE:
+                    instr = Instr(instr.op, None, instr.arg1, rename(instr.arg2))
+                unrolled.append(instr)
+        unrolled_count += 1
+        position = end + 1
+    return unrolled, unrolled_count
+
+
+# Trip count, body and position of the end label of the loop whose start
+# label is at position, or None when it cannot be unrolled.
+def plan_unroll(code, position, label_positions, references, temp_uses, max_trips, budget):
+    if position + 2 >= len(code):
+        return None
+    label, test, branch = code[position], code[position + 1], code[position + 2]
+    if label.op != Op.LABEL or test.op not in RELATIONAL_OPS or branch.op != Op.IF_FALSE:
+        return None
+    if branch.arg1 != test.dest or test.dest[0] != TEMP or temp_uses[test.dest] != 1:
+        return None
+    start, end_label = label.arg1, branch.arg2
+    end = label_positions.get(end_label)
+    if end is None or end <= position + 3:
+        return None
+    back = code[end - 1]
+    if back.op != Op.GOTO or back.arg1 != start or references[start] != 1 or references[end_label] != 1:
+        return None
+
+    if test.arg1[0] in (TEMP, VAR) and test.arg2[0] == CONST:
+        counter, limit, counter_first = test.arg1, test.arg2[1], True
+    elif test.arg2[0] in (TEMP, VAR) and test.arg1[0] == CONST:
+        counter, limit, counter_first = test.arg2, test.arg1[1], False
+    else:
+        return None
+
+    value = initial_value(code, position, counter)
+    if value is None:
+        return None
+
+    def runs(value):
+        return evaluate_binary(test.op, value, limit) if counter_first else evaluate_binary(test.op, limit, value)
+
+    # Rejects large loops before looking at their bodies.
+    if runs(value) and end - position - 4 > budget:
+        return None
+    body = code[position + 3:end - 1]
+    own_labels = {instr.arg1 for instr in body if instr.op == Op.LABEL}
+    inner_references = Counter()
+    update = step = None
+    for offset, instr in enumerate(body):
+        op = instr.op
+        if op in (Op.CALL, Op.FUNC_BEGIN, Op.FUNC_END):
+            return None
+        if op in JUMP_OPS:
+            target = instr.arg1 if op == Op.GOTO else instr.arg2
+            if target not in own_labels:
+                return None
+            inner_references[target] += 1
+        if defines(instr, counter):
+            if update is not None:
+                return None
+            update = offset
+            if op == Op.ADD and instr.arg1 == counter and instr.arg2[0] == CONST:
+                step = instr.arg2[1]
+            elif op == Op.ADD and instr.arg2 == counter and instr.arg1[0] == CONST:
+                step = instr.arg1[1]
+            elif op == Op.SUB and instr.arg1 == counter and instr.arg2[0] == CONST:
+                step = -instr.arg2[1]
+            else:
+                return None
+    if update is None or any(references[name] != inner_references[name] for name in own_labels):
+        return None
+    # The update must run exactly once per iteration: no jump in the body
+    # may cross it, which also keeps it out of inner loops and branches.
+    body_positions = {instr.arg1: offset for offset, instr in enumerate(body) if instr.op == Op.LABEL}
+    for offset, instr in enumerate(body):
+        if instr.op in JUMP_OPS:
+            target = body_positions[instr.arg1 if instr.op == Op.GOTO else instr.arg2]
+            if min(offset, target) < update < max(offset, target):
+                return None
+
+    trips = 0
+    while runs(value):
+        trips += 1
+        if trips > max_trips or trips * len(body) > budget:
+            return None
+        value += step
+    return trips, body, end
+
+
+# The constant counter is set to on the straight-line way into position.
+def initial_value(code, position, counter):
+    index = position - 1
+    while index >= 0:
+        instr = code[index]
+        if instr.op in STRAIGHT_LINE_BREAKS:
+            return None
+        if defines(instr, counter):
+            if instr.op == Op.COPY and instr.arg1[0] == CONST:
+                return instr.arg1[1]
+            return None
+        index -= 1
+    return None
@@ -0,0 +1,110 @@
+import argparse
+import gc
+import json
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+import lexer
+import parser
+from lexer import Lexer
+from parser import Parser
+
+
+class DictToken:
+    def __init__(self, type, value, line=0, column=0):
+        self.type = type
+        self.value = value
+        self.line = line
+        self.column = column
+
+
+class DictASTNode:
+    def __init__(self, type, children=None, value=None, line=0, column=0):
+        self.type = type
+        self.children = children if children else []
+        self.value = value
+        self.line = line
+        self.column = column
+
+
+def synthetic_program(functions):
+    parts = []
+    for i in range(functions):
+        parts.append(f"""
+    def f{i}(a, b) {{
+        if (a > b) {{
+            c = a * {i} + (b - 1) / 2;
+        }} else {{
+            c = b * {i} - a;
+        }}
+        while (c < 100) {{
+            c = c + a + b + 1;
+        }}
+        return c;
+    }}
+    x{i} = f{i}({i}, {i} + 1);
+    print x{i};
+""")
+    return "".join(parts)
+
+
+def measure(layout, functions):
+    if layout == 'dict':
+        lexer.Token = DictToken
+        parser.ASTNode = DictASTNode
+    source = synthetic_program(functions)
+
+    arena = layout == 'arena'
+    gc.collect()
+    ast = Parser(Lexer(source).tokenize(), arena=arena).parse()
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del ast
+    gc.collect()
+
+    tracemalloc.start()
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens, arena=arena).parse()
+    snapshot = tracemalloc.take_snapshot()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = snapshot.statistics('filename')
+    return {
+        'layout': layout,
+        'functions': functions,
+        'source_bytes': len(source),
+        'peak_rss_kb': peak_rss_kb,
+        'traced_peak_bytes': traced_peak,
+        'live_bytes': sum(stat.size for stat in stats),
+        'live_allocations': sum(stat.count for stat in stats),
+    }
+
+
+def run_isolated(layout, functions):
+    # Each layout runs in a fresh interpreter so ru_maxrss is not shared.
+    output = subprocess.check_output(
+        [sys.executable, __file__, '--child', layout, '--functions', str(functions)])
+    return json.loads(output)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare token and AST memory use across node layouts.")
+    arg_parser.add_argument('--functions', type=int, default=5000)
+    arg_parser.add_argument('--child', choices=('dict', 'slots', 'arena'))
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.functions)))
+        return
+
+    layouts = ('dict', 'slots', 'arena')
+    results = [run_isolated(layout, args.functions) for layout in layouts]
+    print(f"Synthetic program: {args.functions} functions, {results[0]['source_bytes']} bytes")
+    print(f"{'metric':<20}" + "".join(f"{layout:>16}" for layout in layouts))
+    for key in ('peak_rss_kb', 'traced_peak_bytes', 'live_bytes', 'live_allocations'):
+        print(f"{key:<20}" + "".join(f"{result[key]:>16}" for result in results))
+
+
+if __name__ == '__main__':
+    main()
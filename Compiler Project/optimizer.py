@@ -0,0 +1,647 @@
+from collections import Counter, defaultdict
+
+from tac import (
+    Op, Instr, Temp, Const, Label, TEMP, VAR, CONST, LABEL, BINARY_SYMBOLS, COMMUTATIVE_OPS,
+    DEFINING_OPS, ARG1_USE_OPS, ARG2_USE_OPS, IMMEDIATES, Var, evaluate_binary, is_local
+)
+from stats import NO_STATS
+from loops import hoist_invariants, reduce_strength, unroll_loops
+from ssa import propagate_constants
+
+# The local passes reset their tables at these instructions: a label can be
+# reached from elsewhere, and control leaves the block after a jump.
+BLOCK_START_OPS = frozenset((Op.LABEL, Op.FUNC_BEGIN, Op.FUNC_END))
+BLOCK_END_OPS = frozenset((Op.GOTO, Op.IF_FALSE, Op.RETURN))
+PURE_OPS = frozenset(BINARY_SYMBOLS) | {Op.COPY}
+# Largest function body, in TAC instructions, that gets inlined.
+DEFAULT_INLINE_BUDGET = 20
+
+
+class LocalTable:
+    # Facts about operands within one basic block. Each fact is registered
+    # under the operands it depends on, so redefining an operand invalidates
+    # exactly the facts that mention it. A call may assign any variable, so it
+    # invalidates every fact that mentions one.
+    def __init__(self):
+        self.facts = {}
+        self.dependents = defaultdict(set)
+        self.variables = set()
+
+    def get(self, key, default=None):
+        return self.facts.get(key, default)
+
+    def add(self, key, value, depends_on):
+        self.facts[key] = value
+        for operand in depends_on:
+            self.dependents[operand].add(key)
+            if operand[0] == VAR:
+                self.variables.add(operand)
+
+    def kill(self, operand):
+        for key in self.dependents.pop(operand, ()):
+            self.facts.pop(key, None)
+        self.variables.discard(operand)
+
+    def kill_variables(self):
+        for operand in list(self.variables):
+            self.kill(operand)
+
+    def clear(self):
+        self.facts.clear()
+        self.dependents.clear()
+        self.variables.clear()
+
+    def update(self, instr):
+        if instr.op in DEFINING_OPS:
+            self.kill(instr.dest)
+        if instr.op == Op.CALL:
+            self.kill_variables()
+
+
+def substitute(instr, table):
+    op = instr.op
+    arg1, arg2 = instr.arg1, instr.arg2
+    if op in ARG1_USE_OPS:
+        arg1 = table.get(arg1, arg1)
+    if op in ARG2_USE_OPS:
+        arg2 = table.get(arg2, arg2)
+    if arg1 is instr.arg1 and arg2 is instr.arg2:
+        return instr
+    return Instr(op, instr.dest, arg1, arg2)
+
+
+class OptimizationPass:
+    name = None
+    # Calls the pass has taken out of the program, over all its runs.
+    calls_removed = 0
+    # Conditional branches the pass has decided, over all its runs.
+    branches_folded = 0
+
+    def run(self, code):
+        raise NotImplementedError
+
+
+class ConstantFolding(OptimizationPass):
+    name = 'constant-folding'
+
+    def run(self, code):
+        optimized = []
+        constants = LocalTable()
+        for instr in code:
+            op = instr.op
+            if op in BLOCK_START_OPS:
+                constants.clear()
+            instr = substitute(instr, constants)
+            arg1, arg2 = instr.arg1, instr.arg2
+
+            if op in BINARY_SYMBOLS and arg1[0] == CONST and arg2[0] == CONST:
+                if not (op == Op.DIV and arg2[1] == 0):
+                    value = evaluate_binary(op, arg1[1], arg2[1])
+                    if value in IMMEDIATES:
+                        instr = Instr(Op.COPY, instr.dest, Const(value))
+            elif op == Op.IF_FALSE and arg1[0] == CONST:
+                if arg1[1] != 0:
+                    continue
+                instr = Instr(Op.GOTO, None, instr.arg2)
+
+            optimized.append(instr)
+            constants.update(instr)
+            if instr.op == Op.COPY and instr.arg1[0] == CONST:
+                constants.add(instr.dest, instr.arg1, (instr.dest,))
+            elif instr.op in BLOCK_END_OPS:
+                constants.clear()
+        return optimized
+
+
+class CopyPropagation(OptimizationPass):
+    name = 'copy-propagation'
+
+    def run(self, code):
+        code = self.coalesce(code)
+        optimized = []
+        copies = LocalTable()
+        for instr in code:
+            op = instr.op
+            if op in BLOCK_START_OPS:
+                copies.clear()
+            instr = substitute(instr, copies)
+            optimized.append(instr)
+            copies.update(instr)
+            if op == Op.COPY and instr.arg1[0] in (TEMP, VAR) and instr.arg1 != instr.dest:
+                copies.add(instr.dest, instr.arg1, (instr.dest, instr.arg1))
+            elif op in BLOCK_END_OPS:
+                copies.clear()
+        return optimized
+
+    # "t = a + b; x = t" becomes "x = a + b" when t has no other use.
+    def coalesce(self, code):
+        uses = count_temp_uses(code)
+        coalesced = []
+        skip_next = False
+        for index, instr in enumerate(code):
+            if skip_next:
+                skip_next = False
+                continue
+            dest = instr.dest
+            if (instr.op in DEFINING_OPS and instr.op != Op.GET_PARAM and dest[0] == TEMP
+                    and uses[dest] == 1 and index + 1 < len(code)):
+                following = code[index + 1]
+                if following.op == Op.COPY and following.arg1 == dest:
+                    coalesced.append(Instr(instr.op, following.dest, instr.arg1, instr.arg2))
+                    skip_next = True
+                    continue
+            coalesced.append(instr)
+        return coalesced
+
+
+class CommonSubexpressionElimination(OptimizationPass):
+    name = 'common-subexpression-elimination'
+
+    def run(self, code):
+        optimized = []
+        available = LocalTable()
+        for instr in code:
+            op = instr.op
+            if op in BLOCK_START_OPS:
+                available.clear()
+            if op in BINARY_SYMBOLS:
+                arg1, arg2 = instr.arg1, instr.arg2
+                if op in COMMUTATIVE_OPS and arg2 < arg1:
+                    arg1, arg2 = arg2, arg1
+                key = (op, arg1, arg2)
+                previous = available.get(key)
+                if previous is not None:
+                    instr = Instr(Op.COPY, instr.dest, previous)
+                optimized.append(instr)
+                available.update(instr)
+                if previous is None and instr.dest not in (arg1, arg2):
+                    available.add(key, instr.dest, (arg1, arg2, instr.dest))
+                continue
+            optimized.append(instr)
+            available.update(instr)
+            if op in BLOCK_END_OPS:
+                available.clear()
+        return optimized
+
+
+class DeadCodeElimination(OptimizationPass):
+    name = 'dead-code-elimination'
+
+    def run(self, code):
+        code = self.remove_unreachable(code)
+        uses = count_temp_uses(code)
+        live = []
+        for instr in reversed(code):
+            if instr.op in PURE_OPS and instr.dest[0] == TEMP and uses[instr.dest] == 0:
+                for operand in instr.uses():
+                    if operand[0] == TEMP:
+                        uses[operand] -= 1
+                continue
+            live.append(instr)
+        live.reverse()
+        return live
+
+    # Drops code after an unconditional jump up to the next label, and jumps
+    # whose target label immediately follows them.
+    def remove_unreachable(self, code):
+        reachable = []
+        unreachable = False
+        for index, instr in enumerate(code):
+            if instr.op in BLOCK_START_OPS:
+                unreachable = False
+            if unreachable:
+                continue
+            if instr.op == Op.GOTO:
+                unreachable = True
+                following = code[index + 1] if index + 1 < len(code) else None
+                if following is not None and following.op == Op.LABEL and following.arg1 == instr.arg1:
+                    continue
+            reachable.append(instr)
+        return reachable
+
+
+def count_temp_uses(code):
+    uses = Counter()
+    for instr in code:
+        for operand in instr.uses():
+            if operand[0] == TEMP:
+                uses[operand] += 1
+    return uses
+
+
+class CallGraph:
+    # The functions of a TAC program, the slice of the code each one spans and
+    # the functions each one calls. Calls to functions that are not in the
+    # code (defined in another unit) are left out of the graph, as are
+    # functions defined more than once.
+    def __init__(self, code):
+        self.regions = []
+        self.functions = {}
+        self.callees = {}
+        duplicates = set()
+        current = None
+        for index, instr in enumerate(code):
+            op = instr.op
+            if op == Op.FUNC_BEGIN:
+                current, begin = instr.arg1[1], index
+                calls = {}
+            elif op == Op.FUNC_END and current is not None:
+                self.regions.append((current, begin, index + 1))
+                if current in self.functions:
+                    duplicates.add(current)
+                self.functions[current] = (begin, index + 1)
+                self.callees[current] = calls
+                current = None
+            elif op == Op.CALL and current is not None:
+                calls[instr.arg1[1]] = None
+        for name in duplicates:
+            del self.functions[name]
+            del self.callees[name]
+        for name, calls in self.callees.items():
+            self.callees[name] = [callee for callee in calls if callee in self.functions]
+
+    def is_recursive(self, component):
+        return len(component) > 1 or component[0] in self.callees[component[0]]
+
+    # Strongly connected components (Tarjan, without recursion), callees
+    # before their callers.
+    def components(self):
+        callees = self.callees
+        index_of = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        components = []
+        for root in self.functions:
+            if root in index_of:
+                continue
+            index_of[root] = low[root] = len(index_of)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(callees[root]))]
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index_of:
+                        index_of[child] = low[child] = len(index_of)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(callees[child])))
+                        break
+                    if child in on_stack:
+                        low[node] = min(low[node], index_of[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index_of[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+        return components
+
+    # Rebuilds the program with the code of some functions replaced.
+    def replace(self, code, bodies, top_level=None):
+        replaced = []
+        position = 0
+        for name, begin, end in self.regions:
+            if top_level is not None:
+                replaced.extend(top_level(code[position:begin]))
+            else:
+                replaced.extend(code[position:begin])
+            replaced.extend(bodies.get(name, code[begin:end]) if self.functions.get(name) == (begin, end)
+                            else code[begin:end])
+            position = end
+        replaced.extend(top_level(code[position:]) if top_level is not None else code[position:])
+        return replaced
+
+
+# A function's parameters (the GET_PARAMs it starts with) and its body
+# without the func_begin/func_end around it.
+def split_function(function_code):
+    count = 1
+    while count < len(function_code) and function_code[count].op == Op.GET_PARAM:
+        count += 1
+    return [instr.dest for instr in function_code[1:count]], function_code[count:-1]
+
+
+# The arguments of a call whose count PARAMs end code, first argument first,
+# or None when code does not end that way.
+def call_arguments(code, count):
+    start = len(code) - count
+    if start < 0 or any(instr.op != Op.PARAM for instr in code[start:]):
+        return None
+    return [instr.arg1 for instr in reversed(code[start:])]
+
+
+# Assigns call arguments to the parameters. Parameters are variables like any
+# other, so an argument that reads a parameter assigned before it is first
+# copied into a temp named after prefix.
+def bind_arguments(params, args, prefix, emit):
+    names = [param[1] for param in params]
+    values = []
+    for position, arg in enumerate(args):
+        if arg[0] == VAR and arg[1] in names[:position]:
+            staged = Temp(f"{prefix}a{position}")
+            emit(Instr(Op.COPY, staged, arg))
+            arg = staged
+        values.append(arg)
+    for param, value in zip(params, values):
+        emit(Instr(Op.COPY, param, value))
+
+
+class TailCallElimination(OptimizationPass):
+    # "t = call f; return t" inside f becomes an assignment of the arguments
+    # to f's parameters and a jump back to the start of its body. Nothing in
+    # the current frame is read after such a call, so the call can reuse it.
+    name = 'tail-call-elimination'
+
+    def run(self, code):
+        graph = CallGraph(code)
+        bodies = {}
+        for name, (begin, end) in graph.functions.items():
+            if name in graph.callees[name]:
+                function_code = self.eliminate(name, code[begin:end])
+                if function_code is not None:
+                    bodies[name] = function_code
+        return graph.replace(code, bodies) if bodies else code
+
+    def eliminate(self, name, function_code):
+        params, body = split_function(function_code)
+        entry = Label(f"{name}.entry")
+        optimized = []
+        removed = 0
+        index = 0
+        while index < len(body):
+            instr = body[index]
+            index += 1
+            if (instr.op == Op.CALL and instr.arg1[1] == name and instr.arg2[1] == len(params)
+                    and index < len(body) and body[index].op == Op.RETURN and body[index].arg1 == instr.dest):
+                args = call_arguments(optimized, len(params))
+                if args is not None:
+                    del optimized[len(optimized) - len(params):]
+                    bind_arguments(params, args, f"{instr.dest[1]}.", optimized.append)
+                    optimized.append(Instr(Op.GOTO, None, entry))
+                    removed += 1
+                    index += 1
+                    continue
+            optimized.append(instr)
+        if not removed:
+            return None
+        self.calls_removed += removed
+        head = function_code[:1 + len(params)]
+        if not (body and body[0].op == Op.LABEL and body[0].arg1 == entry):
+            head.append(Instr(Op.LABEL, None, entry))
+        return head + optimized + function_code[-1:]
+
+
+class FunctionInlining(OptimizationPass):
+    # Replaces calls to small non-recursive functions with a copy of their
+    # body. Functions are handled callees first, so what gets copied already
+    # has its own calls inlined. A function qualifies when its body, after
+    # that, is at most budget instructions and ends in a return.
+    #
+    # The callee's parameters and locals become new variables of the caller
+    # (locals of its frame, or globals when inlining into top-level code).
+    # Globals live in cells named after them; the copied code uses one
+    # operand per global name within the caller, since two operands for the
+    # same cell would look independent to the local passes, which no longer
+    # see a call between them. Temps, labels and the callee's variables get
+    # the call's result temp as a prefix, which is unique in the program.
+    name = 'inline'
+
+    def __init__(self, budget=DEFAULT_INLINE_BUDGET):
+        self.budget = budget
+
+    def run(self, code):
+        graph = CallGraph(code)
+        inlinable = {}
+        bodies = {}
+        for component in graph.components():
+            for name in component:
+                begin, end = graph.functions[name]
+                function_code = code[begin:end]
+                bodies[name] = self.inline_calls(function_code, inlinable, variables_by_name(function_code), name)
+            if not graph.is_recursive(component):
+                params, body = split_function(bodies[component[0]])
+                if body and len(body) <= self.budget and not falls_through(body):
+                    inlinable[component[0]] = (params, body)
+        if not inlinable:
+            return code
+
+        top_level = variables_by_name(graph.replace(code, {name: [] for name in graph.functions}))
+        return graph.replace(code, bodies, lambda part: self.inline_calls(part, inlinable, top_level, None))
+
+    # owner is the function code belongs to, None for top-level code.
+    def inline_calls(self, code, inlinable, by_name, owner):
+        inlined = []
+        for instr in code:
+            if instr.op == Op.CALL and instr.dest[0] == TEMP:
+                callee = inlinable.get(instr.arg1[1])
+                if callee is not None and instr.arg2[1] == len(callee[0]):
+                    args = call_arguments(inlined, len(callee[0]))
+                    if args is not None:
+                        del inlined[len(inlined) - len(args):]
+                        self.expand(instr.dest, args, callee, by_name, owner, inlined)
+                        self.calls_removed += 1
+                        continue
+            inlined.append(instr)
+        return inlined
+
+    def expand(self, result, args, callee, by_name, owner, inlined):
+        prefix = f"{result[1]}."
+        params, body = callee
+
+        def rename(operand):
+            if operand is None:
+                return None
+            kind = operand[0]
+            if kind == TEMP:
+                return Temp(prefix + operand[1])
+            if kind == LABEL:
+                return Label(prefix + operand[1])
+            if kind == VAR:
+                if is_local(operand):
+                    return Var(prefix + operand[1], None, owner)
+                return by_name.setdefault(operand[1], operand)
+            return operand
+
+        bind_arguments([rename(param) for param in params], args, prefix, inlined.append)
+        end = Label(f"{prefix}return")
+        returns = 0
+        for instr in body:
+            if instr.op == Op.RETURN:
+                inlined.append(Instr(Op.COPY, result, rename(instr.arg1)))
+                inlined.append(Instr(Op.GOTO, None, end))
+                returns += 1
+            elif instr.op == Op.CALL:
+                inlined.append(Instr(Op.CALL, rename(instr.dest), instr.arg1, instr.arg2))
+            else:
+                inlined.append(Instr(instr.op, rename(instr.dest), rename(instr.arg1), rename(instr.arg2)))
+        if body[-1].op == Op.RETURN:
+            # The last return falls through to the code after the call.
+            inlined.pop()
+            returns -= 1
+        if returns:
+            inlined.append(Instr(Op.LABEL, None, end))
+
+
+# Whether control can run off the end of body without a return; the result
+# of such a call is whatever the last return left behind.
+def falls_through(body):
+    labels = {instr.arg1: index for index, instr in enumerate(body) if instr.op == Op.LABEL}
+    seen = set()
+    work = [0]
+    while work:
+        index = work.pop()
+        if index in seen:
+            continue
+        if index == len(body):
+            return True
+        seen.add(index)
+        instr = body[index]
+        if instr.op == Op.GOTO:
+            work.append(labels.get(instr.arg1, len(body)))
+        elif instr.op == Op.IF_FALSE:
+            work.append(labels.get(instr.arg2, len(body)))
+            work.append(index + 1)
+        elif instr.op != Op.RETURN:
+            work.append(index + 1)
+    return False
+
+
+# The global variables code uses, by name.
+def variables_by_name(code):
+    by_name = {}
+    for instr in code:
+        for operand in (instr.dest, instr.arg1, instr.arg2):
+            if operand is not None and operand[0] == VAR and not is_local(operand):
+                by_name.setdefault(operand[1], operand)
+    return by_name
+
+
+class LoopInvariantCodeMotion(OptimizationPass):
+    name = 'loop-invariant-code-motion'
+
+    def __init__(self):
+        self.hoisted = 0
+
+    def run(self, code):
+        code, hoisted = hoist_invariants(code)
+        self.hoisted += hoisted
+        return code
+
+
+class StrengthReduction(OptimizationPass):
+    name = 'strength-reduction'
+
+    def __init__(self):
+        self.reduced = 0
+
+    def run(self, code):
+        code, reduced = reduce_strength(code, self.reduced)
+        self.reduced += reduced
+        return code
+
+
+class LoopUnrolling(OptimizationPass):
+    name = 'loop-unrolling'
+
+    def __init__(self):
+        self.unrolled = 0
+
+    def run(self, code):
+        code, unrolled = unroll_loops(code)
+        self.unrolled += unrolled
+        return code
+
+
+class SparseConditionalConstantPropagation(OptimizationPass):
+    name = 'sccp'
+
+    def run(self, code):
+        code, folded = propagate_constants(code)
+        self.branches_folded += folded
+        return code
+
+
+class PassResult:
+    __slots__ = ('name', 'before', 'after')
+
+    def __init__(self, name, before, after):
+        self.name = name
+        self.before = before
+        self.after = after
+
+    @property
+    def delta(self):
+        return self.after - self.before
+
+
+class PassManager:
+    def __init__(self, passes=None, iterate=False, max_rounds=10, stats=NO_STATS):
+        self.passes = list(passes or [])
+        self.iterate = iterate
+        self.max_rounds = max_rounds
+        self.report = []
+        self.stats = stats
+
+    def add(self, optimization_pass):
+        self.passes.append(optimization_pass)
+        return self
+
+    def run(self, code):
+        for _ in range(self.max_rounds if self.iterate else 1):
+            previous = [str(instr) for instr in code] if self.iterate else None
+            for optimization_pass in self.passes:
+                before = len(code)
+                with self.stats.phase(f"optimize:{optimization_pass.name}"):
+                    code = optimization_pass.run(code)
+                self.report.append(PassResult(optimization_pass.name, before, len(code)))
+            if not self.iterate or [str(instr) for instr in code] == previous:
+                break
+        return code
+
+    def summary(self):
+        totals = {}
+        for result in self.report:
+            totals[result.name] = totals.get(result.name, 0) + result.delta
+        return totals
+
+    def calls_removed(self):
+        return {optimization_pass.name: optimization_pass.calls_removed
+                for optimization_pass in self.passes if optimization_pass.calls_removed}
+
+    def branches_folded(self):
+        return {optimization_pass.name: optimization_pass.branches_folded
+                for optimization_pass in self.passes if optimization_pass.branches_folded}
+
+
+OPTIMIZATION_LEVELS = {
+    0: lambda: PassManager(),
+    1: lambda: PassManager([ConstantFolding(), CopyPropagation(), DeadCodeElimination()]),
+    2: lambda: PassManager([ConstantFolding(), CopyPropagation(), CommonSubexpressionElimination(),
+                            DeadCodeElimination()], iterate=True),
+    3: lambda: PassManager([TailCallElimination(), FunctionInlining(), SparseConditionalConstantPropagation(),
+                            ConstantFolding(), CopyPropagation(),
+                            CommonSubexpressionElimination(), DeadCodeElimination(), LoopUnrolling(),
+                            LoopInvariantCodeMotion(), StrengthReduction()], iterate=True),
+}
+
+
+def pass_manager_for_level(level, stats=NO_STATS, inline_budget=None):
+    if level not in OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown optimization level: -O{level}")
+    pass_manager = OPTIMIZATION_LEVELS[level]()
+    pass_manager.stats = stats
+    if inline_budget is not None:
+        for optimization_pass in pass_manager.passes:
+            if isinstance(optimization_pass, FunctionInlining):
+                optimization_pass.budget = inline_budget
+    return pass_manager
@@ -0,0 +1,148 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ast_arena import ASTArena
+from structures import ASTNode
+from tac import Instr
+from tac_generator import TACGenerator
+from assembly_generator import AssemblyGenerator
+from optimizer import pass_manager_for_level
+from register_allocator import allocate_registers
+
+# Below this many functions a module is generated in-process: starting the
+# workers and shipping trees to them costs more than it saves.
+MIN_FUNCTIONS = 64
+
+
+# True on a free-threaded build with the GIL actually off, where threads
+# run code generation in parallel without copying trees between processes.
+def free_threaded():
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+class CodegenContext:
+    # One independently generated piece of the program: a function, or the
+    # top-level statements (namespace None). node is an AST node in threads,
+    # or the serialized arena of its subtree when sent to another process.
+    def __init__(self, namespace, node):
+        self.namespace = namespace
+        self.node = node
+
+
+def split_contexts(ast):
+    functions = []
+    statements = []
+    names = {}
+    for child in ast.children:
+        if child.type != 'func_def':
+            statements.append(child)
+            continue
+        name = child.children[0].value
+        seen = names.get(name, 0)
+        names[name] = seen + 1
+        functions.append(CodegenContext(name if not seen else f"{name}~{seen + 1}", child))
+    main = CodegenContext(None, ASTNode('program', children=statements))
+    return main, functions
+
+
+def generate_context(namespace, node, symbols, opt_level, registers, allocator):
+    if isinstance(node, bytes):
+        node = ASTArena.from_bytes(node).root_node()
+    generator = TACGenerator(namespace, symbols)
+    generator.visit(node)
+    tac_code = pass_manager_for_level(opt_level).run(generator.tac_code)
+    allocation = None
+    if registers is not None:
+        allocation = allocate_registers(tac_code, registers, allocator)
+    main, functions = AssemblyGenerator(tac_code, allocation).generate_sections()
+    return tac_code, main, functions
+
+
+def _generate_batch(batch, symbols, opt_level, registers, allocator):
+    # Instructions travel back as plain tuples, which pickle far smaller and
+    # faster than Instr objects.
+    results = []
+    for namespace, node in batch:
+        tac_code, main, functions = generate_context(namespace, node, symbols, opt_level, registers, allocator)
+        rows = [(instr.op, instr.dest, instr.arg1, instr.arg2) for instr in tac_code]
+        results.append((rows, main, functions))
+    return results
+
+
+class ParallelCodeGenerator:
+    # Used by compile_source(jobs=...) and driver.py --codegen-jobs for
+    # modules of at least MIN_FUNCTIONS functions. Experimental: it has only
+    # been measured on one CPU (see codegen_benchmark.py). Functions are
+    # optimized without seeing each other, so -O3 cannot inline across them.
+    #
+    # Generates each function in its own context, with temps and labels in a
+    # namespace named after the function, so contexts share no counters and
+    # can run in any order. Results are merged in source order, so the output
+    # is the same for every worker count. Modules with fewer than
+    # min_functions functions are generated in-process.
+    def __init__(self, jobs=None, opt_level=0, registers=None, allocator='linear',
+                 min_functions=MIN_FUNCTIONS, batch_size=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.opt_level = opt_level
+        self.registers = registers
+        self.allocator = allocator
+        self.min_functions = min_functions
+        self.batch_size = batch_size
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def pool(self):
+        if self.executor is None:
+            if free_threaded():
+                self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+            else:
+                self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        return self.executor
+
+    # symbols is the table semantic analysis filled in for ast.
+    def generate(self, ast, symbols=None):
+        main, functions = split_contexts(ast)
+        settings = (symbols, self.opt_level, self.registers, self.allocator)
+        main_tac, main_code, _ = generate_context(main.namespace, main.node, *settings)
+        if self.jobs == 1 or len(functions) < self.min_functions:
+            generated = [generate_context(context.namespace, context.node, *settings)
+                         for context in functions]
+        else:
+            generated = self.generate_parallel(functions, settings)
+
+        tac_code = list(main_tac)
+        function_code = []
+        for function_tac, _, code in generated:
+            tac_code.extend(function_tac)
+            function_code.extend(code)
+        return tac_code, "\n".join(main_code + ["  HALT"] + function_code)
+
+    def generate_parallel(self, functions, settings):
+        executor = self.pool()
+        threads = isinstance(executor, ThreadPoolExecutor)
+        size = self.batch_size or max(1, len(functions) // (self.jobs * 4))
+        batches = []
+        for start in range(0, len(functions), size):
+            batch = functions[start:start + size]
+            if threads:
+                batches.append([(context.namespace, context.node) for context in batch])
+            else:
+                batches.append([(context.namespace, ASTArena.from_tree(context.node).to_bytes())
+                                for context in batch])
+        generated = []
+        for results in executor.map(_generate_batch, batches, *([setting] * len(batches) for setting in settings)):
+            for rows, main, code in results:
+                generated.append(([Instr(*row) for row in rows], main, code))
+        return generated
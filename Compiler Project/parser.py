@@ -1,10 +1,27 @@
+from ast_arena import ASTArena
 from structures import ASTNode
 
+RELATIONAL_PRECEDENCE = 1
+BINARY_PRECEDENCE = {'REL_OP': RELATIONAL_PRECEDENCE, 'PLUS': 2, 'MINUS': 2, 'TIMES': 3, 'DIVIDE': 3}
+
+
+class BlockFrame:
+    __slots__ = ('token', 'children', 'block_token', 'statements')
+
+    def __init__(self, token, children):
+        self.token = token
+        self.children = children
+        self.block_token = None
+        self.statements = None
+
+
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, arena=False):
         self.tokens = tokens
         self.token_index = 0
         self.current_token = self.tokens[self.token_index]
+        self.arena = ASTArena() if arena else None
+        self.make_node = self.arena.add_node if arena else ASTNode
 
     def advance(self):
         self.token_index += 1
@@ -17,59 +34,82 @@ class Parser:
             self.advance()
             return token_value
         else:
-            raise Exception(f"Syntax Error: Expected {token_type}, got {self.current_token.type} at index {self.token_index}")
+            raise Exception(f"Syntax Error: Expected {token_type}, got {self.current_token.type} at line {self.current_token.line}, column {self.current_token.column}")
 
 
-    def factor(self):
-        token = self.current_token
-        if token.type == 'NUMBER':
-            self.advance()
-            return ASTNode('number', value=token.value)
-        elif token.type == 'IDENTIFIER':
-            if self.token_index + 1 < len(self.tokens) and self.tokens[self.token_index + 1].type == 'LPAREN':
-                return self.function_call()
-            self.advance()
-            return ASTNode('identifier', value=token.value)
-        elif token.type == 'LPAREN':
-            self.advance()
-            node = self.expression()
-            self.expect('RPAREN')
-            return node
-        raise Exception(f"Invalid factor: {token.type}")
-
-    def term(self):
-        node = self.factor()
-        while self.current_token.type in ('TIMES', 'DIVIDE'):
-            op = self.current_token.value
-            self.advance()
-            node = ASTNode('binop', children=[node, self.factor()], value=op)
-        return node
-    
-    def additive_expression(self):
-        node = self.term()
-        while self.current_token.type in ('PLUS', 'MINUS'):
-            op = self.current_token.value
-            self.advance()
-            node = ASTNode('binop', children=[node, self.term()], value=op)
-        return node
-        
-    def expression(self):
-        node = self.additive_expression()
-        if self.current_token.type == 'REL_OP':
-             op = self.current_token.value
-             self.advance()
-             node = ASTNode('relop', children=[node, self.additive_expression()], value=op)
-        return node
+    def is_call(self):
+        return self.token_index + 1 < len(self.tokens) and self.tokens[self.token_index + 1].type == 'LPAREN'
 
-    def statement(self):
-        if self.current_token.type == 'IF':
-            return self.if_statement()
-        if self.current_token.type == 'WHILE':
-            return self.while_statement()
-        
+    def binary_operator(self, left, op, right):
+        node_type = 'relop' if op.type == 'REL_OP' else 'binop'
+        return self.make_node(node_type, children=[left, right], value=op.value, line=op.line, column=op.column)
+
+    # Precedence climbing with explicit operand/operator stacks, so neither
+    # parentheses nor call arguments consume Python stack frames. Each frame
+    # is one nesting level: [opener token or None, operator base, call args].
+    # Relational operators bind loosest and do not chain, as in the grammar
+    #   expression := additive [REL_OP additive]
+    def expression(self):
+        operands = []
+        operators = []
+        frames = [[None, 0, None]]
+        while True:
+            token = self.current_token
+            if token.type == 'NUMBER':
+                self.advance()
+                operands.append(self.make_node('number', value=token.value, line=token.line, column=token.column))
+            elif token.type == 'IDENTIFIER' and self.is_call():
+                self.advance()
+                self.advance()
+                if self.current_token.type != 'RPAREN':
+                    frames.append([token, len(operators), []])
+                    continue
+                self.advance()
+                operands.append(self.call_node(token, []))
+            elif token.type == 'IDENTIFIER':
+                self.advance()
+                operands.append(self.make_node('identifier', value=token.value, line=token.line, column=token.column))
+            elif token.type == 'LPAREN':
+                self.advance()
+                frames.append([token, len(operators), None])
+                continue
+            else:
+                raise Exception(f"Invalid factor: {token.type}")
+
+            while True:
+                token = self.current_token
+                frame = frames[-1]
+                base = frame[1]
+                precedence = BINARY_PRECEDENCE.get(token.type)
+                if precedence is not None and not (precedence == RELATIONAL_PRECEDENCE and len(operators) > base
+                                                   and BINARY_PRECEDENCE[operators[base].type] == RELATIONAL_PRECEDENCE):
+                    while len(operators) > base and BINARY_PRECEDENCE[operators[-1].type] >= precedence:
+                        right = operands.pop()
+                        operands.append(self.binary_operator(operands.pop(), operators.pop(), right))
+                    operators.append(token)
+                    self.advance()
+                    break
+
+                while len(operators) > base:
+                    right = operands.pop()
+                    operands.append(self.binary_operator(operands.pop(), operators.pop(), right))
+                opener, _, args = frame
+                if opener is None:
+                    return operands.pop()
+                if args is not None:
+                    args.append(operands.pop())
+                    if token.type == 'COMMA':
+                        self.advance()
+                        break
+                frames.pop()
+                self.expect('RPAREN')
+                if args is not None:
+                    operands.append(self.call_node(opener, args))
+
+    def simple_statement(self):
         node = None
         if self.current_token.type == 'IDENTIFIER':
-            if self.token_index + 1 < len(self.tokens) and self.tokens[self.token_index + 1].type == 'LPAREN':
+            if self.is_call():
                 node = self.function_call()
             else:
                 node = self.assignment_statement()
@@ -79,65 +119,101 @@ class Parser:
             node = self.return_statement()
         else:
             raise Exception(f"Invalid statement starting with {self.current_token.type}")
-        
+
         self.expect('SEMICOLON')
         return node
 
+    def open_block(self, frame):
+        frame.block_token = self.current_token
+        frame.statements = []
+        self.expect('LBRACE')
+
+    # if/while bodies are tracked on an explicit stack of open blocks, so
+    # nesting depth of compound statements is bounded by memory only.
+    def statement(self):
+        frames = []
+        while True:
+            token = self.current_token
+            if token.type in ('IF', 'WHILE'):
+                self.advance()
+                self.expect('LPAREN')
+                condition = self.expression()
+                self.expect('RPAREN')
+                frame = BlockFrame(token, [condition])
+                self.open_block(frame)
+                frames.append(frame)
+                node = None
+            else:
+                node = self.simple_statement()
+
+            while frames:
+                frame = frames[-1]
+                if node is not None:
+                    frame.statements.append(node)
+                    node = None
+                if self.current_token.type != 'RBRACE':
+                    break
+                self.advance()
+                block_token = frame.block_token
+                frame.children.append(self.make_node('statements', children=frame.statements,
+                                                     line=block_token.line, column=block_token.column))
+                if frame.token.type == 'IF' and len(frame.children) == 2 and self.current_token.type == 'ELSE':
+                    self.advance()
+                    self.open_block(frame)
+                    continue
+                frames.pop()
+                node = self.make_node(frame.token.value, children=frame.children,
+                                      line=frame.token.line, column=frame.token.column)
+            if not frames:
+                return node
+
     def statement_block(self):
+        token = self.current_token
         self.expect('LBRACE')
         statements = []
         while self.current_token.type != 'RBRACE':
             statements.append(self.statement())
         self.expect('RBRACE')
-        return ASTNode('statements', children=statements)
+        return self.make_node('statements', children=statements, line=token.line, column=token.column)
 
     def assignment_statement(self):
+        token = self.current_token
         identifier = self.expect('IDENTIFIER')
         self.expect('ASSIGN')
         expr = self.expression()
-        return ASTNode('assign', children=[ASTNode('identifier', value=identifier), expr], value='=')
+        target = self.make_node('identifier', value=identifier, line=token.line, column=token.column)
+        return self.make_node('assign', children=[target, expr], value='=', line=token.line, column=token.column)
 
     def print_statement(self):
+        token = self.current_token
         self.expect('PRINT')
         expr = self.expression()
-        return ASTNode('print', children=[expr])
-
-    def if_statement(self):
-        self.expect('IF')
-        self.expect('LPAREN')
-        condition = self.expression()
-        self.expect('RPAREN')
-        if_block = self.statement_block()
-        else_block = None
-        if self.current_token.type == 'ELSE':
-            self.advance()
-            else_block = self.statement_block()
-        return ASTNode('if', children=[condition, if_block, else_block] if else_block else [condition, if_block])
+        return self.make_node('print', children=[expr], line=token.line, column=token.column)
 
-    def while_statement(self):
-        self.expect('WHILE')
-        self.expect('LPAREN')
-        condition = self.expression()
-        self.expect('RPAREN')
-        body = self.statement_block()
-        return ASTNode('while', children=[condition, body])
+    def parameter(self):
+        token = self.current_token
+        return self.make_node('param', value=self.expect('IDENTIFIER'), line=token.line, column=token.column)
 
     def function_definition(self):
+        token = self.current_token
         self.expect('DEF')
+        name_token = self.current_token
         name = self.expect('IDENTIFIER')
         self.expect('LPAREN')
         params = []
         if self.current_token.type == 'IDENTIFIER':
-            params.append(ASTNode('param', value=self.expect('IDENTIFIER')))
+            params.append(self.parameter())
             while self.current_token.type == 'COMMA':
                 self.advance()
-                params.append(ASTNode('param', value=self.expect('IDENTIFIER')))
+                params.append(self.parameter())
         self.expect('RPAREN')
         body = self.statement_block()
-        return ASTNode('func_def', children=[ASTNode('identifier', value=name)] + params + [body])
+        name_node = self.make_node('identifier', value=name, line=name_token.line, column=name_token.column)
+        return self.make_node('func_def', children=[name_node] + params + [body], line=token.line, column=token.column)
 
     def function_call(self):
-        name = self.expect('IDENTIFIER')
+        token = self.current_token
+        self.expect('IDENTIFIER')
         self.expect('LPAREN')
         args = []
         if self.current_token.type != 'RPAREN':
@@ -146,12 +222,17 @@ class Parser:
                 self.advance()
                 args.append(self.expression())
         self.expect('RPAREN')
-        return ASTNode('func_call', children=[ASTNode('identifier', value=name)] + args)
+        return self.call_node(token, args)
+
+    def call_node(self, name_token, args):
+        name_node = self.make_node('identifier', value=name_token.value, line=name_token.line, column=name_token.column)
+        return self.make_node('func_call', children=[name_node] + args, line=name_token.line, column=name_token.column)
 
     def return_statement(self):
+        token = self.current_token
         self.expect('RETURN')
         value = self.expression()
-        return ASTNode('return', children=[value])
+        return self.make_node('return', children=[value], line=token.line, column=token.column)
 
     def parse(self):
         declarations = []
@@ -160,5 +241,9 @@ class Parser:
                 declarations.append(self.function_definition())
             else:
                 declarations.append(self.statement())
-        return ASTNode('program', children=declarations)
+        root = self.make_node('program', children=declarations)
+        if self.arena is not None:
+            self.arena.root = root
+            return self.arena.root_node()
+        return root
 
@@ -0,0 +1,353 @@
+from collections import Counter
+
+from assembly_generator import OPCODES
+from tac import Op, IMMEDIATES, evaluate_binary
+
+LABEL = 'LABEL'
+JUMP_OPCODES = frozenset(('JMP', 'JE'))
+BRANCH_OPCODES = JUMP_OPCODES | {'CALL'}
+# Control never falls through these.
+UNCONDITIONAL_OPCODES = frozenset(('JMP', 'RET', 'HALT'))
+BINARY_OPCODES = {name: op for op, name in OPCODES.items()}
+
+# R1 and R2 only carry values between the instructions of one lowered TAC
+# instruction: code after a label or a jump always reloads them, and R2 is
+# dead once the instruction that reads it has run.
+SCRATCH_REGISTERS = frozenset(('R1', 'R2'))
+
+
+# Instructions are plain (opcode, operands) tuples, like TAC operands: cheap
+# to build, compared by value and ignored by the cyclic GC.
+def AsmInstr(opcode, operands=()):
+    return (opcode, operands)
+
+
+def format_instr(instr):
+    opcode, operands = instr
+    if opcode == LABEL:
+        return f"\n{operands[0]}:"
+    if not operands:
+        return f"  {opcode}"
+    return f"  {opcode} {', '.join(operands)}"
+
+
+def parse_assembly(assembly_code):
+    instructions = []
+    for line in assembly_code.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.endswith(':'):
+            instructions.append((LABEL, (line[:-1],)))
+            continue
+        opcode, _, rest = line.partition(' ')
+        instructions.append((opcode, tuple(rest.split(', ')) if rest else ()))
+    return instructions
+
+
+def format_assembly(instructions):
+    return "\n".join(format_instr(instr) for instr in instructions)
+
+
+def is_immediate(operand):
+    return operand.startswith('#')
+
+
+def immediate_value(operand):
+    return int(operand[1:])
+
+
+# Rules look at the tail of the code emitted so far and return how many
+# trailing instructions to replace and what to replace them with, or None.
+
+def redundant_load(tail):
+    # STORE R, m; LOAD m, S  ->  STORE R, m; MOV R, S
+    if len(tail) < 2:
+        return None
+    (first, stored), (second, loaded) = tail[-2], tail[-1]
+    if first != 'STORE' or second != 'LOAD' or loaded[0] != stored[1]:
+        return None
+    register, target = stored[0], loaded[1]
+    return 1, [] if register == target else [AsmInstr('MOV', (register, target))]
+
+
+def move_through_scratch(tail):
+    # MOV R, S; STORE S, m  ->  STORE R, m  when S is a scratch register
+    if len(tail) < 2:
+        return None
+    (first, moved), (second, stored) = tail[-2], tail[-1]
+    if first != 'MOV' or second != 'STORE' or moved[1] not in SCRATCH_REGISTERS or moved[1] != stored[0]:
+        return None
+    return 2, [AsmInstr('STORE', (moved[0], stored[1]))]
+
+
+def repeated_load(tail):
+    if len(tail) < 2:
+        return None
+    if tail[-2][0] == 'LOAD' and tail[-2] == tail[-1]:
+        return 1, []
+    return None
+
+
+def self_move(tail):
+    source, target = tail[-1][1]
+    if source == target:
+        return 1, []
+    return None
+
+
+def constant_fold(tail):
+    # LOAD #a, R; LOAD #b, R2; OP R, R2  ->  LOAD #(a op b), R
+    if len(tail) < 3:
+        return None
+    (first, left), (second, right), (opcode, (target, source)) = tail[-3], tail[-2], tail[-1]
+    if (first != 'LOAD' or second != 'LOAD' or left[1] != target or right[1] != source
+            or source == target or source not in SCRATCH_REGISTERS
+            or not is_immediate(left[0]) or not is_immediate(right[0])):
+        return None
+    op = BINARY_OPCODES[opcode]
+    a, b = immediate_value(left[0]), immediate_value(right[0])
+    if op == Op.DIV and b == 0:
+        return None
+    value = evaluate_binary(op, a, b)
+    if value not in IMMEDIATES:
+        return None
+    return 3, [AsmInstr('LOAD', (f"#{value}", target))]
+
+
+def dead_scratch_load(tail):
+    # A scratch register loaded right before a label, jump, return or halt,
+    # or loaded again straight away, is never read.
+    if len(tail) < 2:
+        return None
+    (first, operands), following = tail[-2], tail[-1]
+    if first != 'LOAD' or operands[1] not in SCRATCH_REGISTERS:
+        return None
+    if following[0] == LABEL or following[0] in UNCONDITIONAL_OPCODES:
+        return 2, [following]
+    if following[0] == 'LOAD' and following[1][1] == operands[1]:
+        return 2, [following]
+    return None
+
+
+def constant_branch(tail):
+    # CMP R, #0; JE L where R was last set by LOAD #c, R with only stores in
+    # between: the branch is always or never taken.
+    if len(tail) < 3:
+        return None
+    (compare, compared), (_, target) = tail[-2], tail[-1]
+    if compare != 'CMP' or compared[1] != '#0':
+        return None
+    register = compared[0]
+    for opcode, operands in reversed(tail[:-2]):
+        if opcode == 'STORE':
+            continue
+        if opcode == 'LOAD' and operands[1] == register and is_immediate(operands[0]):
+            if immediate_value(operands[0]) == 0:
+                return 2, [AsmInstr('JMP', target)]
+            return 2, []
+        return None
+    return None
+
+
+def jump_to_next(tail):
+    # JMP L / JE L immediately followed by L:
+    if len(tail) < 2:
+        return None
+    jump, label = tail[-2], tail[-1]
+    if jump[0] in JUMP_OPCODES and jump[1] == label[1]:
+        return 2, [label]
+    return None
+
+
+# Each rule is tried only when the instruction just emitted has one of its
+# trigger opcodes.
+RULES = {
+    'redundant-load': (('LOAD',), redundant_load),
+    'move-through-scratch': (('STORE',), move_through_scratch),
+    'repeated-load': (('LOAD',), repeated_load),
+    'self-move': (('MOV',), self_move),
+    'constant-fold': (tuple(BINARY_OPCODES), constant_fold),
+    'dead-scratch-load': ((LABEL, 'LOAD') + tuple(UNCONDITIONAL_OPCODES), dead_scratch_load),
+    'constant-branch': (('JE',), constant_branch),
+    'jump-to-next': ((LABEL,), jump_to_next),
+}
+
+
+class PeepholeOptimizer:
+    # Local rules are matched against the tail of the output while it is
+    # being built, so a rewrite that exposes another match is handled on the
+    # spot instead of waiting for the next sweep. The global steps (jump
+    # threading, unreachable code, unused labels, dead stores) each take one
+    # linear pass; rounds repeat until nothing changes.
+    def __init__(self, rules=None, window=4, thread_jumps=True, remove_unreachable=True,
+                 remove_labels=True, remove_dead_stores=True, max_rounds=10):
+        self.rules = {}
+        for name in (rules if rules is not None else RULES):
+            triggers, rule = RULES[name]
+            for opcode in triggers:
+                self.rules.setdefault(opcode, []).append((name, rule))
+        self.window = window
+        self.thread_jumps = thread_jumps
+        self.remove_unreachable = remove_unreachable
+        self.remove_labels = remove_labels
+        self.remove_dead_stores = remove_dead_stores
+        self.max_rounds = max_rounds
+        self.removed = Counter()
+        self.before = 0
+        self.after = 0
+        self.rounds = 0
+        self.threaded = 0
+
+    def optimize(self, assembly_code):
+        code = parse_assembly(assembly_code)
+        self.before = len(code)
+        for _ in range(self.max_rounds):
+            self.rounds += 1
+            previous = code
+            code = self.apply_rules(code)
+            if self.thread_jumps:
+                code = self.thread(code)
+            if self.remove_unreachable:
+                code = self.drop_unreachable(code)
+            if self.remove_labels:
+                code = self.drop_unused_labels(code)
+            if self.remove_dead_stores:
+                code = self.drop_dead_stores(code)
+                code = self.drop_dead_scratch_writes(code)
+            if code == previous:
+                break
+        self.after = len(code)
+        return format_assembly(code)
+
+    def apply_rules(self, code):
+        output = []
+        window = self.window
+        rules = self.rules
+        for instr in code:
+            output.append(instr)
+            candidates = rules.get(instr[0])
+            while candidates:
+                tail = output[-window:]
+                for name, rule in candidates:
+                    match = rule(tail)
+                    if match is not None:
+                        count, replacement = match
+                        del output[-count:]
+                        output.extend(replacement)
+                        self.removed[name] += count - len(replacement)
+                        candidates = rules.get(output[-1][0]) if output else None
+                        break
+                else:
+                    candidates = None
+        return output
+
+    def thread(self, code):
+        # Where each label leads once the labels and unconditional jumps
+        # starting at it are followed.
+        first_after = {}
+        pending = []
+        for instr in code:
+            if instr[0] == LABEL:
+                pending.append(instr[1][0])
+                continue
+            for name in pending:
+                first_after[name] = instr
+            pending.clear()
+
+        resolved = {}
+
+        def destination(label):
+            seen = []
+            while label not in resolved:
+                instr = first_after.get(label)
+                if instr is None or instr[0] != 'JMP' or label in seen:
+                    break
+                seen.append(label)
+                label = instr[1][0]
+            final = resolved.get(label, label)
+            for name in seen:
+                resolved[name] = final
+            return final
+
+        threaded = []
+        for instr in code:
+            opcode, operands = instr
+            if opcode in JUMP_OPCODES:
+                target = destination(operands[0])
+                if target != operands[0]:
+                    self.threaded += 1
+                    instr = AsmInstr(opcode, (target,))
+            threaded.append(instr)
+        return threaded
+
+    def drop_unreachable(self, code):
+        reachable = []
+        unreachable = False
+        for instr in code:
+            if instr[0] == LABEL:
+                unreachable = False
+            if unreachable:
+                self.removed['unreachable-code'] += 1
+                continue
+            reachable.append(instr)
+            if instr[0] in UNCONDITIONAL_OPCODES:
+                unreachable = True
+        return reachable
+
+    # A function nobody calls loses its label here, and its body then goes
+    # as unreachable code after the preceding RET or HALT.
+    def drop_unused_labels(self, code):
+        targets = {instr[1][0] for instr in code if instr[0] in BRANCH_OPCODES}
+        kept = []
+        for instr in code:
+            if instr[0] == LABEL and instr[1][0] not in targets:
+                self.removed['unused-label'] += 1
+                continue
+            kept.append(instr)
+        return kept
+
+    def drop_dead_stores(self, code):
+        # Memory is only ever read by name, so a location that no instruction
+        # reads does not need to be written.
+        read = set()
+        for opcode, operands in code:
+            if opcode == 'STORE':
+                read.add(operands[0])
+            elif opcode != LABEL:
+                read.update(operands)
+        live = []
+        for instr in code:
+            opcode, operands = instr
+            if opcode == 'STORE' and operands[1] not in read:
+                self.removed['dead-store'] += 1
+                continue
+            live.append(instr)
+        return live
+
+    # Backward scan: a LOAD or MOV into a scratch register that is
+    # overwritten, or reaches a label or jump, before being read is dead.
+    def drop_dead_scratch_writes(self, code):
+        live = set()
+        kept = []
+        for instr in reversed(code):
+            opcode, operands = instr
+            if opcode == LABEL or opcode in BRANCH_OPCODES or opcode in UNCONDITIONAL_OPCODES:
+                live.clear()
+            elif opcode in ('LOAD', 'MOV'):
+                target = operands[1]
+                if target in SCRATCH_REGISTERS:
+                    if target not in live:
+                        self.removed['dead-scratch-write'] += 1
+                        continue
+                    live.discard(target)
+                live.add(operands[0])
+            else:
+                live.update(operands)
+            kept.append(instr)
+        kept.reverse()
+        return kept
+
+    def report(self):
+        return [(name, count) for name, count in self.removed.items() if count]
+
@@ -0,0 +1,140 @@
+import argparse
+import random
+
+RELATIONAL = ('<', '>', '<=', '>=', '==', '!=')
+ADDITIVE = ('+', '-')
+
+
+class ProgramShape:
+    # functions: number of defs; statements: statements per block;
+    # depth: if/while nesting inside each function; chain: operators per
+    # arithmetic expression; calls: top-level call sites.
+    def __init__(self, functions=10, statements=4, depth=1, chain=3, calls=10, seed=0):
+        self.functions = functions
+        self.statements = statements
+        self.depth = depth
+        self.chain = chain
+        self.calls = calls
+        self.seed = seed
+
+
+# Shapes stressing one dimension each; the size argument scales that
+# dimension and keeps the others small.
+SHAPES = {
+    'wide': lambda size: ProgramShape(functions=size, statements=3, depth=1, chain=3, calls=size),
+    'deep': lambda size: ProgramShape(functions=4, statements=2, depth=size, chain=2, calls=4),
+    'chains': lambda size: ProgramShape(functions=4, statements=4, depth=0, chain=size, calls=4),
+    'calls': lambda size: ProgramShape(functions=10, statements=2, depth=1, chain=2, calls=size),
+}
+
+
+class ProgramGenerator:
+    # Programs are valid and terminate: variables are assigned before they
+    # are read, functions only call functions defined before them, every
+    # while loop counts a fresh variable up to a small bound, and division
+    # is only ever by a non-zero constant. Values stay small: an expression
+    # of n terms, each at most 99 times a variable, is divided by 100 * n
+    # before it is assigned.
+    def __init__(self, shape):
+        self.shape = shape
+        self.random = random.Random(shape.seed)
+        self.lines = []
+        self.loop_count = 0
+
+    def expression(self, names, length):
+        choice = self.random.choice
+        randint = self.random.randint
+        parts = [choice(names)]
+        for _ in range(length):
+            term = randint(0, 5)
+            if term == 0:
+                parts.append(f"/ {randint(1, 9)}")
+            elif term == 1:
+                parts.append(f"{choice(ADDITIVE)} {choice(names)} * {randint(0, 99)}")
+            elif term == 2:
+                parts.append(f"{choice(ADDITIVE)} ({choice(names)} {choice(ADDITIVE)} {randint(0, 99)})")
+            else:
+                parts.append(f"{choice(ADDITIVE)} {choice(names + [str(randint(0, 99))])}")
+        return f"({' '.join(parts)}) / {100 * (length + 1)}"
+
+    def condition(self, names):
+        return f"{self.random.choice(names)} {self.random.choice(RELATIONAL)} {self.random.randint(0, 99)}"
+
+    # Emits statements nested depth levels deep, alternating if/else and
+    # while. Blocks are opened in a loop and their closing lines kept on a
+    # stack, so depth is limited by memory rather than recursion. targets
+    # are the names statements may assign; loop counters are read but only
+    # ever assigned by their own increment.
+    def block(self, names, targets, depth):
+        shape = self.shape
+        emit = self.lines.append
+        closers = []
+        for level in range(depth + 1):
+            # Indentation stops growing past eight levels, so the size of a
+            # deep program stays linear in its depth.
+            pad = "    " * min(level + 1, 8)
+            for _ in range(shape.statements):
+                emit(f"{pad}{self.random.choice(targets)} = {self.expression(names, shape.chain)};")
+            if level == depth:
+                break
+            if self.loop_count % 2 == 0:
+                emit(f"{pad}if ({self.condition(names)}) {{")
+                closers.append([f"{pad}}} else {{", f"{pad}    {targets[0]} = {self.expression(names, 1)};", f"{pad}}}"])
+            else:
+                counter = f"w{self.loop_count}"
+                emit(f"{pad}{counter} = 0;")
+                emit(f"{pad}while ({counter} < {2 if level == 0 else 1}) {{")
+                closers.append([f"{pad}    {counter} = {counter} + 1;", f"{pad}}}"])
+                names = names + [counter]
+            self.loop_count += 1
+        while closers:
+            self.lines.extend(closers.pop())
+
+    def function(self, index):
+        emit = self.lines.append
+        names = ['a', 'b', f"v{index}"]
+        emit(f"def f{index}(a, b) {{")
+        emit(f"    v{index} = a + b;")
+        # Calls stay within groups of eight functions, so no call chain is
+        # longer than seven however many functions there are.
+        if index % 8:
+            callee = index - 1 - self.random.randrange(index % 8)
+            emit(f"    v{index} = v{index} + f{callee}(a, {self.random.randint(0, 9)});")
+        self.block(names, names, self.shape.depth)
+        emit(f"    return {self.expression(names, self.shape.chain)};")
+        emit("}")
+
+    def generate(self):
+        shape = self.shape
+        emit = self.lines.append
+        for index in range(shape.functions):
+            self.function(index)
+        emit("total = 0;")
+        names = ['total']
+        for site in range(shape.calls):
+            if shape.functions:
+                callee = site % shape.functions
+                emit(f"r{site} = f{callee}({site}, {self.expression(names, 1)});")
+                names.append(f"r{site}")
+            emit(f"total = total + r{site};" if shape.functions else f"total = total + {site};")
+        emit("print total;")
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_program(shape):
+    return ProgramGenerator(shape).generate()
+
+
+def generate_shape(name, size, seed=0):
+    shape = SHAPES[name](size)
+    shape.seed = seed
+    return generate_program(shape)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Print a synthetic program of the given shape.")
+    arg_parser.add_argument('shape', choices=sorted(SHAPES))
+    arg_parser.add_argument('size', type=int)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    print(generate_shape(args.shape, args.size, args.seed), end="")
@@ -0,0 +1,208 @@
+from bisect import bisect_right
+
+from cfg import build_cfgs
+from dataflow import Liveness
+from tac import Op, TEMP, DEFINING_OPS
+
+# R1 and R2 stay reserved as scratch registers for memory operands, so the
+# allocatable pool starts at R3.
+FIRST_ALLOCATABLE_REGISTER = 3
+
+
+def register_names(count):
+    return [f"R{FIRST_ALLOCATABLE_REGISTER + index}" for index in range(count)]
+
+
+class LiveInterval:
+    __slots__ = ('temp', 'start', 'end', 'uses', 'crosses_call', 'register')
+
+    def __init__(self, temp, position):
+        self.temp = temp
+        self.start = position
+        self.end = position
+        self.uses = 0
+        self.crosses_call = False
+        self.register = None
+
+    def extend(self, position):
+        if position < self.start:
+            self.start = position
+        if position > self.end:
+            self.end = position
+
+    def overlaps(self, other):
+        return self.start <= other.end and other.start <= self.end
+
+    def __repr__(self):
+        return f"LiveInterval({self.temp[1]}, {self.start}-{self.end}, register={self.register})"
+
+
+def live_intervals(cfg):
+    # Positions are numbered over the region's blocks in layout order; a temp
+    # live into or out of a block covers the block's first or last position.
+    liveness = Liveness(cfg).solve()
+    universe = liveness.universe
+    temp_mask = universe.bits([index for operand, index in universe.index.items() if operand[0] == TEMP])
+    intervals = {}
+    calls = []
+
+    def touch(temp, position):
+        interval = intervals.get(temp)
+        if interval is None:
+            intervals[temp] = LiveInterval(temp, position)
+        else:
+            interval.extend(position)
+
+    position = 0
+    for block in cfg.blocks:
+        if not block.instructions:
+            continue
+        first, last = position, position + len(block.instructions) - 1
+        for temp in universe.members(liveness.block_in[block.index] & temp_mask):
+            touch(temp, first)
+        for temp in universe.members(liveness.block_out[block.index] & temp_mask):
+            touch(temp, last)
+        for instr in block.instructions:
+            for operand in instr.uses():
+                if operand[0] == TEMP:
+                    touch(operand, position)
+                    intervals[operand].uses += 1
+            if instr.op in DEFINING_OPS and instr.dest[0] == TEMP:
+                touch(instr.dest, position)
+            if instr.op == Op.CALL:
+                calls.append(position)
+            position += 1
+
+    # Callees use the same registers, so a temp that stays live across a
+    # call is kept in memory.
+    for interval in intervals.values():
+        index = bisect_right(calls, interval.start)
+        interval.crosses_call = index < len(calls) and calls[index] < interval.end
+    return sorted(intervals.values(), key=lambda interval: (interval.start, interval.end))
+
+
+class LinearScanAllocator:
+    name = 'linear'
+
+    def __init__(self, registers):
+        self.registers = register_names(registers)
+
+    # Poletto & Sarkar: walk intervals by start point, expire the ones that
+    # ended before it, and when no register is free spill whichever of the
+    # current and active intervals ends last.
+    def allocate(self, intervals):
+        free = list(reversed(self.registers))
+        active = []
+        spilled = []
+        for interval in intervals:
+            if interval.crosses_call:
+                spilled.append(interval)
+                continue
+            still_active = []
+            for other in active:
+                if other.end < interval.start:
+                    free.append(other.register)
+                else:
+                    still_active.append(other)
+            active = still_active
+            if free:
+                interval.register = free.pop()
+                active.append(interval)
+                continue
+            victim = max(active, key=lambda other: other.end) if active else None
+            if victim is not None and victim.end > interval.end:
+                interval.register = victim.register
+                victim.register = None
+                spilled.append(victim)
+                active.remove(victim)
+                active.append(interval)
+            else:
+                spilled.append(interval)
+        return spilled
+
+
+class GraphColoringAllocator:
+    name = 'coloring'
+
+    def __init__(self, registers):
+        self.registers = register_names(registers)
+
+    # Chaitin-Briggs: simplify nodes of degree < k, optimistically push a
+    # cheapest-to-spill node when none is left, then assign colours in reverse.
+    def allocate(self, intervals):
+        candidates = [interval for interval in intervals if not interval.crosses_call]
+        spilled = [interval for interval in intervals if interval.crosses_call]
+        neighbours = {id(interval): set() for interval in candidates}
+        active = []
+        for interval in candidates:
+            active = [other for other in active if other.end >= interval.start]
+            for other in active:
+                neighbours[id(interval)].add(id(other))
+                neighbours[id(other)].add(id(interval))
+            active.append(interval)
+
+        by_id = {id(interval): interval for interval in candidates}
+        degree = {node: len(edges) for node, edges in neighbours.items()}
+        k = len(self.registers)
+        remaining = set(by_id)
+        low = [node for node in remaining if degree[node] < k]
+        stack = []
+        while remaining:
+            if low:
+                node = low.pop()
+                if node not in remaining:
+                    continue
+            else:
+                node = min(remaining, key=lambda node: (by_id[node].uses + 1) / (degree[node] + 1))
+            remaining.discard(node)
+            stack.append(node)
+            for neighbour in neighbours[node]:
+                if neighbour in remaining:
+                    degree[neighbour] -= 1
+                    if degree[neighbour] == k - 1:
+                        low.append(neighbour)
+
+        while stack:
+            node = stack.pop()
+            taken = {by_id[neighbour].register for neighbour in neighbours[node]}
+            for register in self.registers:
+                if register not in taken:
+                    by_id[node].register = register
+                    break
+            else:
+                spilled.append(by_id[node])
+        return spilled
+
+
+ALLOCATORS = {
+    LinearScanAllocator.name: LinearScanAllocator,
+    GraphColoringAllocator.name: GraphColoringAllocator,
+}
+
+
+class RegisterAllocation:
+    def __init__(self, registers, method):
+        self.registers = registers
+        self.method = method
+        self.assignment = {}
+        self.spilled = set()
+        self.intervals = 0
+
+    def register_of(self, operand):
+        return self.assignment.get(operand)
+
+
+def allocate_registers(code, registers=4, method='linear'):
+    if method not in ALLOCATORS:
+        raise ValueError(f"Unknown register allocator: {method}")
+    allocator = ALLOCATORS[method](registers)
+    allocation = RegisterAllocation(registers, method)
+    for cfg in build_cfgs(code):
+        intervals = live_intervals(cfg)
+        allocation.intervals += len(intervals)
+        spilled = allocator.allocate(intervals)
+        allocation.spilled.update(interval.temp for interval in spilled)
+        for interval in intervals:
+            if interval.register is not None:
+                allocation.assignment[interval.temp] = interval.register
+    return allocation
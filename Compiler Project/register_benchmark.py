@@ -0,0 +1,66 @@
+import argparse
+import time
+
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from tac_generator import TACGenerator
+from optimizer import pass_manager_for_level
+from assembly_generator import AssemblyGenerator, count_memory_operations
+from register_allocator import ALLOCATORS, allocate_registers
+from compiler import SAMPLE_PROGRAM
+from memory_benchmark import synthetic_program
+
+
+def generate_tac(source, opt_level):
+    ast = Parser(Lexer(source).tokenize()).parse()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(ast)
+    generator = TACGenerator(symbols=analyzer.symbols)
+    generator.visit(ast)
+    return pass_manager_for_level(opt_level).run(generator.tac_code)
+
+
+def measure(name, tac_code, registers, method):
+    loads, stores = count_memory_operations(AssemblyGenerator(tac_code).generate())
+    start = time.perf_counter()
+    allocation = allocate_registers(tac_code, registers, method)
+    elapsed = time.perf_counter() - start
+    allocated_loads, allocated_stores = count_memory_operations(AssemblyGenerator(tac_code, allocation).generate())
+    return {
+        'program': name,
+        'allocator': method,
+        'registers': registers,
+        'temps': allocation.intervals,
+        'spilled': len(allocation.spilled),
+        'loads': loads,
+        'loads_eliminated': loads - allocated_loads,
+        'stores': stores,
+        'stores_eliminated': stores - allocated_stores,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Report loads and stores removed by register allocation.")
+    arg_parser.add_argument('--functions', type=int, nargs='+', default=[100, 1000])
+    arg_parser.add_argument('--registers', type=int, nargs='+', default=[2, 4, 8])
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=0)
+    args = arg_parser.parse_args()
+
+    programs = [('sample', SAMPLE_PROGRAM)]
+    programs += [(f"synthetic-{functions}", synthetic_program(functions)) for functions in args.functions]
+    columns = ('program', 'allocator', 'registers', 'temps', 'spilled',
+               'loads', 'loads_eliminated', 'stores', 'stores_eliminated', 'seconds')
+    print("".join(f"{column:>18}" for column in columns))
+    for name, source in programs:
+        tac_code = generate_tac(source, args.opt_level)
+        for method in ALLOCATORS:
+            for registers in args.registers:
+                result = measure(name, tac_code, registers, method)
+                result['seconds'] = f"{result['seconds']:.3f}"
+                print("".join(f"{result[column]:>18}" for column in columns))
+
+
+if __name__ == '__main__':
+    main()
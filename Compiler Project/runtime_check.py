@@ -0,0 +1,107 @@
+import argparse
+import sys
+
+from incremental import IncrementalCompiler
+from program_generator import ProgramShape, generate_program
+from register_allocator import ALLOCATORS
+from vm import VirtualMachine, run_assembly
+from vm_benchmark import build
+
+
+# Programs whose output depends on names resolving to the right storage at
+# run time: parameters and locals shadowing globals, globals written from
+# inside functions, and recursion, where every active call needs its own
+# copy of its parameters and temps. The rest are regressions: a strength
+# reduced increment and a literal too wide for 32 bits, and identifiers
+# spelled like the compiler's temps and labels.
+PROGRAMS = (
+    ('shadowed-parameter', "a = 1; def f(a) { return a; } r = f(7); print a; print r;", [1, 7]),
+    ('shadowed-global', "x = 5; def f(x) { return x + 1; } r = f(10); print x; print r;", [5, 11]),
+    ('local', "def f(n) { s = 0; while (n > 0) { s = s + n; n = n - 1; } return s; } s = 7; print f(4); print s;",
+     [10, 7]),
+    ('global-write', "g = 0; def f(n) { g = g + n; return g; } print f(3); print f(4); print g;", [3, 7, 7]),
+    ('fib', "def fib(n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); } print fib(12);", [144]),
+    ('fact', "def fact(n) { if (n == 0) { return 1; } return n * fact(n - 1); } print fact(10);", [3628800]),
+    ('nested-calls', "def sq(x) { return x * x; } def sum(a, b) { return sq(a) + sq(b); } "
+                     "a = 2; b = 3; print sum(b, a); print a; print b;", [13, 2, 3]),
+    ('wide-step', "i = 0; s = 0; while (i < 3000000) { s = s + i * 100000; i = i + 100000; } print s;",
+     [4350000000000]),
+    ('wide-literal', "x = 3000000000; print x; print x * 4;", [3000000000, 12000000000]),
+    ('temp-named-variable', "t1 = 100; x = 2 * t1 + 1; print x; print t1;", [201, 100]),
+    ('label-named-function', "def L1(a) { return a; } x = 0; if (x > 0) { x = L1(5); } print 7;", [7]),
+    ('earlier-global-write', "x = 5; def f() { x = 1; return x; } y = f(); print x; print y;", [1, 1]),
+)
+
+
+# Generated programs with globals assigned between the functions, named like
+# the functions' parameters and locals, so that whether an assignment in a
+# function writes a global depends on the units before it.
+def generated_programs(count):
+    for seed in range(count):
+        lines = generate_program(ProgramShape(functions=6, statements=3, depth=2, chain=2, calls=6,
+                                              seed=seed)).splitlines()
+        program = []
+        for index, line in enumerate(lines):
+            if line.startswith('def ') and (seed + index) % 3:
+                program.append(f"v{(seed + index) % 4} = {index};")
+            program.append(line)
+        program.insert(-1, "print v0 + v1 + v2 + v3;")
+        yield f"generated-{seed}", "\n".join(["v0 = 0;", "v1 = 0;", "v2 = 0;", "v3 = 0;"] + program)
+
+
+# An incremental build checks and generates each unit on its own; its
+# output must match a whole-file build of the same source.
+def check_incremental(verbose):
+    failures = 0
+    sources = [(name, source) for name, source, _ in PROGRAMS] + list(generated_programs(20))
+    for opt_level in (0, 1, 2, 3):
+        compiler = IncrementalCompiler(opt_level=opt_level)
+        for name, source in sources:
+            whole = compiler.compile_whole(source)
+            result = compiler.compile(source)
+            if result.error or whole.error:
+                failures += 1
+                print(f"{name} -O{opt_level} incremental: {result.error or whole.error}")
+                continue
+            expected, got = run_assembly(whole.assembly).output, run_assembly(result.assembly).output
+            if expected != got:
+                failures += 1
+                print(f"{name} -O{opt_level} incremental: expected {expected}, got {got}")
+            elif verbose:
+                print(f"{name} -O{opt_level} incremental: ok")
+    return failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Run programs that depend on scoping and recursion under every backend configuration.")
+    arg_parser.add_argument('-v', '--verbose', action='store_true', help="print every configuration checked")
+    args = arg_parser.parse_args()
+
+    failures = 0
+    for name, source, expected in PROGRAMS:
+        for opt_level in (0, 1, 2, 3):
+            for registers in (None, 2, 4):
+                for allocator in (ALLOCATORS if registers else ('linear',)):
+                    for peephole in (False, True):
+                        program = build(source, opt_level, registers, peephole, allocator)
+                        for fast_loops in (False, True):
+                            machine = VirtualMachine(program, fast_loops)
+                            machine.run()
+                            setting = (f"-O{opt_level} registers={registers} allocator={allocator} "
+                                       f"peephole={peephole} fast_loops={fast_loops}")
+                            if machine.output != expected:
+                                failures += 1
+                                print(f"{name} {setting}: expected {expected}, got {machine.output}")
+                            elif args.verbose:
+                                print(f"{name} {setting}: ok")
+    failures += check_incremental(args.verbose)
+    if failures:
+        print(f"{failures} failed")
+        return 1
+    print(f"{len(PROGRAMS)} programs ok")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,56 +1,108 @@
-class SemanticAnalyzer:
-    def __init__(self):
-        self.symbol_table = {}
+from visitor import NodeVisitor
+from symbols import SymbolTable, VARIABLE, FUNCTION, PARAMETER
 
-    def visit(self, node):
-        method_name = 'visit_' + node.type
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
 
-    def generic_visit(self, node):
-        for child in node.children:
-            self.visit(child)
+# Names resolve through a chain of scopes: a function's parameters and the
+# variables it first assigns belong to its own scope, everything else to the
+# global one. Blocks do not open scopes; as before, a variable first assigned
+# inside an if or while is visible after it. Every resolved identifier,
+# parameter and function name gets the ID of its symbol in node.symbol.
+class SemanticAnalyzer(NodeVisitor):
+    def __init__(self, symbols=None):
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.scope = self.symbols.global_scope
 
-    def visit_program(self, node): self.generic_visit(node)
-    def visit_statements(self, node): self.generic_visit(node)
+    @property
+    def symbol_table(self):
+        return self.symbols.global_kinds()
+
+    def declare(self, name, kind):
+        symbols = self.symbols
+        if kind == FUNCTION:
+            scope = symbols.global_scope
+        elif kind == VARIABLE:
+            # Assigning to a visible name writes that variable.
+            symbol = self.scope.lookup(name)
+            if symbol is not None:
+                symbols.set_kind(symbol, VARIABLE)
+                return symbol
+            scope = self.scope
+        else:
+            scope = self.scope
+        symbol = scope.names.get(name)
+        if symbol is not None:
+            symbols.set_kind(symbol, kind)
+            return symbol
+        return symbols.declare(scope, name, kind)
+
+    def check_defined(self, name):
+        symbol = self.scope.lookup(name)
+        if symbol is None:
+            raise NameError(f"Error: Variable or function '{name}' is not defined.")
+        return symbol
+
+    def check_function(self, name):
+        symbol = self.scope.lookup(name)
+        if symbol is None or not self.symbols.is_function(symbol):
+            raise NameError(f"Error: Function '{name}' is not defined.")
+        return symbol
+
+    # The callee pops its own arguments, so a call must pass exactly as
+    # many as the function declares.
+    def check_call(self, name, count):
+        symbol = self.check_function(name)
+        arity = self.symbols.arities[symbol]
+        if arity is not None and arity != count:
+            raise TypeError(f"Error: Function '{name}' takes {arity} arguments but {count} were given.")
+        return symbol
+
+    def enter_function(self, node):
+        name_node = node.children[0]
+        name_node.symbol = function = self.declare(name_node.value, FUNCTION)
+        self.symbols.set_arity(function, len(node.children) - 2)
+        self.scope = self.symbols.function_scope(function)
+        for param_node in node.children[1:-1]:
+            param_node.symbol = self.declare(param_node.value, PARAMETER)
+
+    def leave_function(self):
+        self.scope = self.scope.parent
+
+    def visit_program(self, node): return self.generic_visit(node)
+    def visit_statements(self, node): return self.generic_visit(node)
     def visit_number(self, node): pass
-    def visit_binop(self, node): self.generic_visit(node)
-    def visit_relop(self, node): self.generic_visit(node)
-    def visit_return(self, node): self.generic_visit(node)
+    def visit_binop(self, node): return self.generic_visit(node)
+    def visit_relop(self, node): return self.generic_visit(node)
+    def visit_return(self, node): return self.generic_visit(node)
     def visit_param(self, node): pass
 
     def visit_assign(self, node):
-        var_name = node.children[0].value
-        self.symbol_table[var_name] = 'variable'
-        self.visit(node.children[1])
+        target = node.children[0]
+        target.symbol = self.declare(target.value, VARIABLE)
+        yield node.children[1]
 
     def visit_identifier(self, node):
-        if node.value not in self.symbol_table:
-            raise NameError(f"Error: Variable or function '{node.value}' is not defined.")
+        node.symbol = self.check_defined(node.value)
 
     def visit_print(self, node):
-        self.visit(node.children[0])
+        yield node.children[0]
 
     def visit_if(self, node):
-        self.visit(node.children[0])
-        self.visit(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
         if len(node.children) > 2 and node.children[2]:
-            self.visit(node.children[2])
-    
+            yield node.children[2]
+
     def visit_while(self, node):
-        self.visit(node.children[0])
-        self.visit(node.children[1])
+        yield node.children[0]
+        yield node.children[1]
 
     def visit_func_def(self, node):
-        func_name = node.children[0].value
-        self.symbol_table[func_name] = 'function'
-        for param_node in node.children[1:-1]:
-             self.symbol_table[param_node.value] = 'variable'
-        self.visit(node.children[-1])
-    
+        self.enter_function(node)
+        yield node.children[-1]
+        self.leave_function()
+
     def visit_func_call(self, node):
-        func_name = node.children[0].value
-        if func_name not in self.symbol_table or self.symbol_table[func_name] != 'function':
-            raise NameError(f"Error: Function '{func_name}' is not defined.")
+        name_node = node.children[0]
+        name_node.symbol = self.check_call(name_node.value, len(node.children) - 1)
         for arg_node in node.children[1:]:
-            self.visit(arg_node)
\ No newline at end of file
+            yield arg_node
@@ -0,0 +1,84 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from compile_client import CompileClient
+from memory_benchmark import synthetic_program
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_each(commands):
+    start = time.perf_counter()
+    for command in commands:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) / len(commands)
+
+
+def wait_for(path, seconds=30):
+    deadline = time.monotonic() + seconds
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise SystemExit(f"the server did not start listening on {path}")
+        time.sleep(0.01)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare cold compiler runs with requests to a warm server.")
+    arg_parser.add_argument('--files', type=int, default=50)
+    arg_parser.add_argument('--functions', type=int, default=5, help="functions in each file")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=0)
+    args = arg_parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='server-')
+    socket_path = os.path.join(directory, 'server.sock')
+    paths = []
+    for index in range(args.files):
+        path = os.path.join(directory, f"file{index}.src")
+        with open(path, 'w') as f:
+            # A distinct first line keeps every file out of the others' cache entries.
+            f.write(f"seed = {index};\n" + synthetic_program(args.functions))
+        paths.append(path)
+    level = f"-O{args.opt_level}"
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'compile_server.py'), '--socket', socket_path],
+                              stderr=subprocess.DEVNULL)
+    try:
+        wait_for(socket_path)
+        cold = run_each([[sys.executable, os.path.join(HERE, 'driver.py'), '-j', '1', level, path]
+                         for path in paths])
+        client_process = run_each([[sys.executable, '-S', os.path.join(HERE, 'compile_client.py'),
+                                    '--socket', socket_path, level, path] for path in paths])
+        interpreter = run_each([[sys.executable, '-S', '-c', 'pass']] * len(paths))
+
+        rows = []
+        with CompileClient(socket_path) as client:
+            for name in ('first request', 'cached request'):
+                round_trip = server_side = 0.0
+                for path in paths:
+                    start = time.perf_counter()
+                    response = client.compile(path, opt_level=args.opt_level)
+                    round_trip += time.perf_counter() - start
+                    if not response['ok']:
+                        raise SystemExit(f"{path}: {response['error']}")
+                    server_side += response['seconds']
+                rows.append((name, round_trip / len(paths), (round_trip - server_side) / len(paths)))
+            client.request({'op': 'shutdown'})
+    finally:
+        server.wait(timeout=30)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{'per file':<36}{'ms':>10}")
+    print(f"{'cold process (driver.py)':<36}{cold * 1000:>10.3f}")
+    print(f"{'client process (compile_client.py)':<36}{client_process * 1000:>10.3f}")
+    print(f"{'  of which interpreter start':<36}{interpreter * 1000:>10.3f}")
+    for name, round_trip, overhead in rows:
+        print(f"{name:<36}{round_trip * 1000:>10.3f}")
+        print(f"{'  of which transport':<36}{overhead * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,608 @@
+from collections import defaultdict
+
+from tac import (
+    Op, Instr, Const, VAR, CONST, BINARY_SYMBOLS, DEFINING_OPS, ARG1_USE_OPS, IMMEDIATES,
+    evaluate_binary, is_local
+)
+from cfg import CodeEdits, DominatorTree, build_cfgs, split_regions
+from dataflow import BACKWARD, DataflowProblem
+from loops import LoopForest
+
+# Where a value that is not defined by an instruction or a phi comes from:
+# whatever the name held when the region was entered, or a call that may
+# have assigned the variable.
+ENTRY = -1
+CLOBBER = -2
+# Lattice of sparse conditional constant propagation, besides the constants
+# themselves: no evidence yet, and more than one possible value.
+UNDEFINED = 'undefined'
+VARYING = 'varying'
+JUMP_OPS = frozenset((Op.GOTO, Op.IF_FALSE, Op.RETURN, Op.FUNC_END))
+PURE_OPS = frozenset(BINARY_SYMBOLS) | {Op.COPY}
+
+
+# The SSA name of an operand: globals live in memory cells named by the
+# variable, whatever symbol they resolved to, locals in a slot of their
+# function's frame, and temps are unique by name. The name of a name is
+# itself.
+def ssa_name(operand):
+    if is_local(operand):
+        return (VAR, operand[1], None, operand[3])
+    return operand[:2]
+
+
+# Names of the globals each function may assign, itself or through the
+# functions it calls, or None for a function that may assign any: one that
+# calls a function not in the code, or one defined more than once.
+def variables_written(code):
+    written = {}
+    callees = {}
+    for name, instructions, _ in split_regions(code)[1:]:
+        if name in written:
+            written[name] = None
+            continue
+        written[name] = {instr.dest[1] for instr in instructions
+                         if instr.op in DEFINING_OPS and instr.dest[0] == VAR and not is_local(instr.dest)}
+        callees[name] = {instr.arg1[1] for instr in instructions if instr.op == Op.CALL}
+    callers = defaultdict(list)
+    for name, called in callees.items():
+        for callee in called:
+            if written.get(callee, None) is None:
+                written[name] = None
+            callers[callee].append(name)
+    work = list(written)
+    while work:
+        callee = work.pop()
+        assigned = written.get(callee)
+        for caller in callers[callee]:
+            current = written[caller]
+            if current is None:
+                continue
+            if assigned is None:
+                written[caller] = None
+            elif not assigned <= current:
+                current |= assigned
+            else:
+                continue
+            work.append(caller)
+    return written
+
+
+class Phi:
+    __slots__ = ('name', 'value', 'block', 'args')
+
+    def __init__(self, name, value, block, sources):
+        self.name = name
+        self.value = value
+        self.block = block
+        self.args = [None] * sources
+
+
+class ValueLiveness(DataflowProblem):
+    direction = BACKWARD
+
+    # Liveness of SSA names, for pruning phis. Only names some block reads
+    # before defining them are tracked, since no other name is live into any
+    # block. Unlike register liveness, a call does not read variables here
+    # but ends the life of those it may assign.
+    def __init__(self, ssa):
+        self.ssa = ssa
+        super().__init__(ssa.cfg)
+
+    def compute_local_sets(self):
+        ssa = self.ssa
+        universe = self.universe
+        exposed = []
+        for block in self.cfg.blocks:
+            reads, writes = [], set()
+            any_variable = False
+            for site in ssa.block_sites(block.index):
+                instr = ssa.instructions[site]
+                for operand in instr.uses():
+                    if operand[0] != CONST:
+                        name = ssa_name(operand)
+                        if name not in writes and not (any_variable and name[0] == VAR):
+                            reads.append(name)
+                            universe.number(name)
+                if instr.op == Op.CALL:
+                    if ssa.call_writes[site] is None:
+                        any_variable = True
+                    else:
+                        writes.update(ssa.call_writes[site])
+                if instr.op in DEFINING_OPS:
+                    writes.add(ssa_name(instr.dest))
+            exposed.append((reads, writes, any_variable))
+        index = universe.index
+        self.variable_bits = universe.bits([index[name] for name in ssa.variables if name in index])
+        for block, (reads, writes, any_variable) in zip(self.cfg.blocks, exposed):
+            self.gen[block.index] = universe.bits([index[name] for name in reads])
+            self.kill[block.index] = (universe.bits([index[name] for name in writes if name in index])
+                                      | (self.variable_bits if any_variable else 0))
+
+    # Brandner et al.'s two passes for reducible graphs: one over the graph
+    # without its back edges in postorder, after which a name live into a
+    # loop's header is live throughout the loop, handed down the loop
+    # nesting forest. That costs one step per block and edge however deeply
+    # loops nest, where iterating to a fixed point revisits a block once per
+    # enclosing loop. Their argument assumes SSA values; for a variable the
+    # loop redefines, the result can include blocks where the variable is
+    # dead, which costs at most a phi that nothing reads. The generated code
+    # is always reducible; anything else falls back to iterating.
+    def solve(self):
+        cfg, tree = self.cfg, self.ssa.tree
+        order = cfg.postorder()
+        finished = [-1] * len(cfg.blocks)
+        for rank, block in enumerate(order):
+            finished[block.index] = rank
+        for block in order:
+            for successor in block.successors:
+                if (finished[successor.index] >= finished[block.index]
+                        and not tree.dominates(successor.index, block.index)):
+                    return super().solve()
+        gen, kill = self.gen, self.kill
+        live_in, live_out = self.block_in, self.block_out
+        for block in order:
+            index = block.index
+            facts = 0
+            for successor in block.successors:
+                if finished[successor.index] < finished[index]:
+                    facts |= live_in[successor.index]
+            live_out[index] = facts
+            live_in[index] = gen[index] | (facts & ~kill[index])
+        forest = LoopForest(cfg, tree)
+        through = {}
+        for loop in forest.preorder:
+            live = live_in[loop.header.index] | through.get(loop.parent, 0)
+            through[loop] = live
+            for index in loop.blocks:
+                live_in[index] |= live
+                live_out[index] |= live
+        return self
+
+    def bit(self, name):
+        index = self.universe.index.get(name)
+        return 0 if index is None else 1 << index
+
+    def live_variables(self, index):
+        return [name for name in self.universe.members(self.block_in[index] & self.variable_bits)]
+
+
+class SSAForm:
+    # Static single assignment view of one CFG region. Every definition of a
+    # temp or variable gets a value, a dense integer, and so does every phi
+    # placed where definitions meet. The TAC itself is not renamed:
+    # uses[site] holds the values an instruction's operands read (None for
+    # constants, in instr.uses() order) and defs[site] the value it writes.
+    # Variables live in memory shared by name, so a call defines a new value
+    # of every variable the callee may assign; a call to an unknown function
+    # may assign any, and those values are only made when something reads
+    # them. Phis are only placed where the name is live (pruned SSA).
+    #
+    # Each value remembers the name it is a version of, and no transformation
+    # made over this form moves a definition past another version of its
+    # name, so versions never overlap and leaving SSA is dropping the phis.
+    def __init__(self, cfg, written=None):
+        self.cfg = cfg
+        self.tree = DominatorTree(cfg)
+        self.names = []
+        self.origins = []
+        self.phis = [[] for _ in cfg.blocks]
+        self.instructions = []
+        self.positions = []
+        self.site_blocks = []
+        self.first_sites = []
+        for block in cfg.blocks:
+            self.first_sites.append(len(self.instructions))
+            self.instructions.extend(block.instructions)
+            self.positions.extend(block.positions)
+            self.site_blocks.extend([block.index] * len(block.instructions))
+        self.first_sites.append(len(self.instructions))
+        self.uses = [()] * len(self.instructions)
+        self.defs = [None] * len(self.instructions)
+        self.clobbers = defaultdict(list)
+        self.find_call_writes(written)
+        self.place_phis()
+        self.rename()
+
+    def block_sites(self, index):
+        return range(self.first_sites[index], self.first_sites[index + 1])
+
+    # Entry edge of the region counts as one more source of the entry block.
+    def sources(self, index):
+        block = self.cfg.blocks[index]
+        if index == self.cfg.entry.index:
+            return block.predecessors + [None]
+        return block.predecessors
+
+    def new_value(self, name, origin):
+        self.names.append(name)
+        self.origins.append(origin)
+        return len(self.names) - 1
+
+    # Variables of the region each call may assign: a list of SSA names, or
+    # None when it may assign any.
+    def find_call_writes(self, written):
+        names = set()
+        for instr in self.instructions:
+            for operand in instr.uses() + ((instr.dest,) if instr.op in DEFINING_OPS else ()):
+                if operand[0] == VAR:
+                    names.add(ssa_name(operand))
+        self.variables = names
+        by_name = {name[1]: name for name in names if len(name) == 2}
+        self.call_writes = {}
+        for site, instr in enumerate(self.instructions):
+            if instr.op != Op.CALL:
+                continue
+            assigned = written.get(instr.arg1[1]) if written is not None else None
+            if assigned is None:
+                self.call_writes[site] = None
+            elif len(assigned) < len(by_name):
+                self.call_writes[site] = [by_name[name] for name in assigned if name in by_name]
+            else:
+                self.call_writes[site] = [name for variable, name in by_name.items() if variable in assigned]
+
+    # Phis go on the iterated dominance frontier of each name's definitions,
+    # at blocks the name is live into (pruned SSA). A block where the name is
+    # not live needs no phi, and no definition flows from it to a later join
+    # without being redefined on the way, so the frontier walk stops there
+    # too. The frontier of the calls that may assign any variable is shared
+    # by all variables and walked once.
+    def place_phis(self):
+        tree = self.tree
+        frontiers = tree.frontiers()
+        liveness = ValueLiveness(self).solve()
+        live_in = liveness.block_in
+        definitions = defaultdict(set)
+        unknown_calls = set()
+        for site, instr in enumerate(self.instructions):
+            index = self.site_blocks[site]
+            if not tree.reachable(index):
+                continue
+            if instr.op in DEFINING_OPS:
+                definitions[ssa_name(instr.dest)].add(index)
+            if instr.op == Op.CALL:
+                writes = self.call_writes[site]
+                if writes is None:
+                    unknown_calls.add(index)
+                else:
+                    for name in writes:
+                        definitions[name].add(index)
+
+        placed = defaultdict(set)
+        for index in sorted(self.iterated_frontier(unknown_calls, frontiers)):
+            for name in liveness.live_variables(index):
+                self.add_phi(name, index)
+                placed[name].add(index)
+        for name, blocks in definitions.items():
+            bit = liveness.bit(name)
+            if not bit:
+                continue
+            at = placed[name]
+            work = list(blocks)
+            while work:
+                for index in frontiers[work.pop()]:
+                    if index not in at and live_in[index] & bit:
+                        at.add(index)
+                        self.add_phi(name, index)
+                        work.append(index)
+
+    def iterated_frontier(self, blocks, frontiers):
+        result = set()
+        work = list(blocks)
+        while work:
+            for index in frontiers[work.pop()]:
+                if index not in result:
+                    result.add(index)
+                    work.append(index)
+        return result
+
+    def add_phi(self, name, index):
+        phi = Phi(name, None, index, len(self.sources(index)))
+        phi.value = self.new_value(name, phi)
+        self.phis[index].append(phi)
+
+    # Walks the dominator tree keeping, per name, a stack of the values in
+    # scope. Every push gets a stamp that grows along the current path, so a
+    # variable's top value is out of date exactly when a call that may assign
+    # any variable has a larger stamp.
+    def rename(self):
+        cfg, tree = self.cfg, self.tree
+        stacks = defaultdict(list)
+        unknown_calls = []
+        entry_values = {}
+        clobbered = {}
+        stamp = 0
+
+        def current(operand):
+            name = ssa_name(operand)
+            stack = stacks.get(name)
+            if name[0] == VAR and unknown_calls and (not stack or stack[-1][1] < unknown_calls[-1][1]):
+                site = unknown_calls[-1][0]
+                value = clobbered.get((site, name))
+                if value is None:
+                    value = clobbered[(site, name)] = self.new_value(name, CLOBBER)
+                    self.clobbers[site].append(value)
+                return value
+            if stack:
+                return stack[-1][0]
+            value = entry_values.get(name)
+            if value is None:
+                value = entry_values[name] = self.new_value(name, ENTRY)
+            return value
+
+        entry = cfg.entry.index
+        for phi in self.phis[entry]:
+            phi.args[-1] = current(phi.name)
+        slots = {}
+        work = [(entry, None)]
+        while work:
+            index, pushed = work.pop()
+            if pushed is not None:
+                for name in pushed:
+                    stacks[name].pop()
+                while unknown_calls and unknown_calls[-1][2] == index:
+                    unknown_calls.pop()
+                continue
+            pushed = []
+            work.append((index, pushed))
+            for phi in self.phis[index]:
+                stamp += 1
+                stacks[phi.name].append((phi.value, stamp))
+                pushed.append(phi.name)
+            for site in self.block_sites(index):
+                instr = self.instructions[site]
+                self.uses[site] = tuple(None if operand[0] == CONST else current(operand)
+                                        for operand in instr.uses())
+                if instr.op == Op.CALL:
+                    stamp += 1
+                    writes = self.call_writes[site]
+                    if writes is None:
+                        unknown_calls.append((site, stamp, index))
+                    for name in writes or ():
+                        value = self.new_value(name, CLOBBER)
+                        self.clobbers[site].append(value)
+                        stacks[name].append((value, stamp))
+                        pushed.append(name)
+                if instr.op in DEFINING_OPS:
+                    stamp += 1
+                    name = ssa_name(instr.dest)
+                    self.defs[site] = self.new_value(name, site)
+                    stacks[name].append((self.defs[site], stamp))
+                    pushed.append(name)
+            block = cfg.blocks[index]
+            for successor in block.successors:
+                if not self.phis[successor.index]:
+                    continue
+                slot = slots.get(successor.index)
+                if slot is None:
+                    slot = slots[successor.index] = {predecessor.index: position for position, predecessor
+                                                     in enumerate(successor.predecessors)}
+                for phi in self.phis[successor.index]:
+                    phi.args[slot[index]] = current(phi.name)
+            work.extend((child, None) for child in reversed(tree.children[index]))
+
+    # For each value, the sites and phis that read it.
+    def users(self):
+        users = [[] for _ in self.names]
+        for site, values in enumerate(self.uses):
+            for value in values:
+                if value is not None:
+                    users[value].append(site)
+        for phis in self.phis:
+            for phi in phis:
+                for value in phi.args:
+                    if value is not None:
+                        users[value].append(phi)
+        return users
+
+    def format(self):
+        versions = []
+        counts = defaultdict(int)
+        for name in self.names:
+            versions.append(f"{name[1]}.{counts[name]}")
+            counts[name] += 1
+
+        def versioned(operand, value):
+            return operand if value is None else (operand[0], versions[value])
+
+        lines = []
+        for block in self.cfg.blocks[:-1]:
+            if not self.tree.reachable(block.index):
+                continue
+            sites = self.block_sites(block.index)
+            labels = 0
+            while labels < len(sites) and self.instructions[sites[labels]].op == Op.LABEL:
+                lines.append(str(self.instructions[sites[labels]]))
+                labels += 1
+            for phi in self.phis[block.index]:
+                args = ", ".join(versions[value] if value is not None else "-" for value in phi.args)
+                lines.append(f"{versions[phi.value]} = phi({args})")
+            for site in sites[labels:]:
+                instr = self.instructions[site]
+                uses = iter(self.uses[site])
+                arg1, arg2 = instr.arg1, instr.arg2
+                if instr.op in BINARY_SYMBOLS:
+                    arg1, arg2 = versioned(arg1, next(uses)), versioned(arg2, next(uses))
+                elif instr.op in ARG1_USE_OPS:
+                    arg1 = versioned(arg1, next(uses))
+                dest = versioned(instr.dest, self.defs[site]) if instr.op in DEFINING_OPS else instr.dest
+                line = str(Instr(instr.op, dest, arg1, arg2))
+                if self.clobbers.get(site):
+                    line += "  ; may assign " + ", ".join(versions[value] for value in self.clobbers[site])
+                lines.append(line)
+        return "\n".join(lines)
+
+
+class SparseConditionalConstants:
+    # Wegman and Zadeck's propagation over an SSAForm. Values start out
+    # UNDEFINED and only move down to a constant and then to VARYING; a block
+    # is only evaluated once an edge into it is found executable, and a
+    # branch on a constant only makes its taken edge executable, so values
+    # on paths that never run do not spoil the joins they flow into. Each
+    # value changes at most twice and each edge is followed once.
+    def __init__(self, ssa):
+        self.ssa = ssa
+        self.lattice = [UNDEFINED if isinstance(origin, Phi) or origin >= 0 else VARYING
+                        for origin in ssa.origins]
+        self.executable = [False] * len(ssa.cfg.blocks)
+        self.edges = set()
+        self.solve()
+
+    def solve(self):
+        ssa = self.ssa
+        users = ssa.users()
+        self.flow = [(None, ssa.cfg.entry.index)]
+        self.changed = []
+        while self.flow or self.changed:
+            if self.flow:
+                edge = self.flow.pop()
+                if edge in self.edges:
+                    continue
+                self.edges.add(edge)
+                index = edge[1]
+                for phi in ssa.phis[index]:
+                    self.visit_phi(phi)
+                if not self.executable[index]:
+                    self.executable[index] = True
+                    self.visit_block(index)
+            else:
+                for user in users[self.changed.pop()]:
+                    if isinstance(user, Phi):
+                        if self.executable[user.block]:
+                            self.visit_phi(user)
+                    elif self.executable[ssa.site_blocks[user]]:
+                        self.visit_site(user)
+
+    def lower(self, value, new):
+        if self.lattice[value] != new:
+            self.lattice[value] = new
+            self.changed.append(value)
+
+    def visit_phi(self, phi):
+        result = UNDEFINED
+        for source, value in zip(self.ssa.sources(phi.block), phi.args):
+            if value is None or (source.index if source is not None else None, phi.block) not in self.edges:
+                continue
+            incoming = self.lattice[value]
+            if incoming is UNDEFINED:
+                continue
+            if incoming is VARYING or (result is not UNDEFINED and result != incoming):
+                result = VARYING
+                break
+            result = incoming
+        self.lower(phi.value, result)
+
+    def visit_block(self, index):
+        ssa = self.ssa
+        sites = ssa.block_sites(index)
+        for site in sites:
+            self.visit_site(site)
+        block = ssa.cfg.blocks[index]
+        if not sites or ssa.instructions[sites[-1]].op not in JUMP_OPS:
+            for successor in block.successors:
+                self.flow.append((index, successor.index))
+
+    def value_of(self, operand, value):
+        return operand[1] if value is None else self.lattice[value]
+
+    def visit_site(self, site):
+        ssa = self.ssa
+        instr = ssa.instructions[site]
+        op = instr.op
+        uses = ssa.uses[site]
+        if op in BINARY_SYMBOLS:
+            left, right = self.value_of(instr.arg1, uses[0]), self.value_of(instr.arg2, uses[1])
+            if left is VARYING or right is VARYING:
+                result = VARYING
+            elif left is UNDEFINED or right is UNDEFINED:
+                result = UNDEFINED
+            elif op == Op.DIV and right == 0:
+                result = VARYING
+            else:
+                result = evaluate_binary(op, left, right)
+                if result not in IMMEDIATES:
+                    result = VARYING
+            self.lower(ssa.defs[site], result)
+        elif op == Op.COPY:
+            self.lower(ssa.defs[site], self.value_of(instr.arg1, uses[0]))
+        elif op in DEFINING_OPS:
+            self.lower(ssa.defs[site], VARYING)
+        elif op in JUMP_OPS:
+            index = ssa.site_blocks[site]
+            cfg = ssa.cfg
+            if op == Op.GOTO:
+                self.flow.append((index, cfg.label_blocks[instr.arg1[1]].index))
+            elif op == Op.IF_FALSE:
+                condition = self.value_of(instr.arg1, uses[0])
+                if condition is UNDEFINED:
+                    return
+                if condition is VARYING or condition != 0:
+                    self.flow.append((index, index + 1))
+                if condition is VARYING or condition == 0:
+                    self.flow.append((index, cfg.label_blocks[instr.arg2[1]].index))
+            else:
+                self.flow.append((index, cfg.exit.index))
+
+    def constant(self, value):
+        result = self.lattice[value] if value is not None else VARYING
+        return None if result is VARYING or result is UNDEFINED else result
+
+    # Records the rewritten region in edits: uses of constant values become
+    # constants, instructions computing a constant become copies of it,
+    # decided branches become a goto or nothing, and blocks never found
+    # executable are dropped. Returns how many branches were decided.
+    def rewrite(self, edits):
+        ssa = self.ssa
+        folded = 0
+        for block in ssa.cfg.blocks[:-1]:
+            sites = ssa.block_sites(block.index)
+            if not self.executable[block.index]:
+                for site in sites:
+                    if ssa.instructions[site].op not in (Op.FUNC_BEGIN, Op.FUNC_END):
+                        edits.replace(ssa.positions[site], ())
+                continue
+            for site in sites:
+                instr = ssa.instructions[site]
+                uses = ssa.uses[site]
+                replacement = instr
+                if instr.op == Op.IF_FALSE:
+                    condition = self.constant(uses[0])
+                    if condition is not None:
+                        folded += 1
+                        edits.replace(ssa.positions[site], () if condition != 0 else
+                                      (Instr(Op.GOTO, None, instr.arg2),))
+                        continue
+                if instr.op in PURE_OPS and self.constant(ssa.defs[site]) is not None:
+                    replacement = Instr(Op.COPY, instr.dest, Const(self.constant(ssa.defs[site])))
+                elif uses:
+                    constants = [self.constant(value) for value in uses]
+                    if any(value is not None for value in constants):
+                        arg1 = Const(constants[0]) if constants[0] is not None else instr.arg1
+                        arg2 = instr.arg2
+                        if len(constants) > 1 and constants[1] is not None:
+                            arg2 = Const(constants[1])
+                        replacement = Instr(instr.op, instr.dest, arg1, arg2)
+                if replacement is not instr and str(replacement) != str(instr):
+                    edits.replace(ssa.positions[site], (replacement,))
+        return folded
+
+
+# Sparse conditional constant propagation over every region of code.
+# Returns the code and how many conditional branches were decided.
+def propagate_constants(code):
+    written = variables_written(code)
+    edits = CodeEdits()
+    folded = 0
+    for cfg in build_cfgs(code):
+        folded += SparseConditionalConstants(SSAForm(cfg, written)).rewrite(edits)
+    return (edits.apply(code) if edits else code), folded
+
+
+def format_ssa(code):
+    written = variables_written(code)
+    sections = []
+    for cfg in build_cfgs(code):
+        if cfg.instruction_count():
+            sections.append(f"--- {cfg.name} ---\n" + SSAForm(cfg, written).format())
+    return "\n\n".join(sections)
+
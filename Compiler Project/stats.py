@@ -0,0 +1,183 @@
+import cProfile
+import json
+import pstats
+import resource
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+
+PROFILE_HOOKS = ('cprofile', 'tracemalloc')
+# Functions kept per phase from a cProfile run, by internal time.
+PROFILE_TOP = 10
+
+
+class PhaseStats:
+    # rss_growth_kb is how far the phase raised the process's peak RSS,
+    # summed over its runs: a phase that only reuses memory freed by earlier
+    # ones shows 0. peak_traced_bytes, under the tracemalloc hook, is the
+    # most the phase had allocated at once beyond what was live when it
+    # started.
+    __slots__ = ('name', 'seconds', 'runs', 'rss_growth_kb', 'peak_traced_bytes', 'profile')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.runs = 0
+        self.rss_growth_kb = 0
+        self.peak_traced_bytes = None
+        self.profile = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Phase:
+    # Times one run of a phase. A phase entered several times (an
+    # optimization pass in every round) accumulates into one PhaseStats.
+    __slots__ = ('stats', 'phase', 'start', 'start_rss_kb', 'start_traced', 'profiler')
+
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+        self.profiler = None
+
+    def __enter__(self):
+        hook = self.stats.profile
+        self.start_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if hook == 'tracemalloc':
+            tracemalloc.reset_peak()
+            self.start_traced = tracemalloc.get_traced_memory()[0]
+        elif hook == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+        return self.phase
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        phase = self.phase
+        phase.seconds += elapsed
+        phase.runs += 1
+        # ru_maxrss is the process high-water mark, so only its growth is the
+        # phase's own.
+        phase.rss_growth_kb += resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self.start_rss_kb
+        if self.profiler is not None:
+            self.profiler.disable()
+            phase.profile = profile_summary(self.profiler, phase.profile)
+        elif self.stats.profile == 'tracemalloc':
+            peak = tracemalloc.get_traced_memory()[1] - self.start_traced
+            phase.peak_traced_bytes = max(peak, phase.peak_traced_bytes or 0)
+        return False
+
+
+def profile_summary(profiler, previous=None):
+    rows = {} if previous is None else {row['function']: row for row in previous}
+    for (filename, line, function), (_, calls, internal, cumulative, _) in pstats.Stats(profiler).stats.items():
+        name = f"{filename}:{line}({function})"
+        row = rows.setdefault(name, {'function': name, 'calls': 0, 'tottime': 0.0, 'cumtime': 0.0})
+        row['calls'] += calls
+        row['tottime'] += internal
+        row['cumtime'] += cumulative
+    return sorted(rows.values(), key=lambda row: row['tottime'], reverse=True)[:PROFILE_TOP]
+
+
+class CompileStats:
+    # Instrumentation for one compilation: per-phase timings and memory
+    # growth, plus counters of what each phase produced.
+    # profile optionally wraps every phase in a cProfile or tracemalloc run.
+    enabled = True
+
+    def __init__(self, profile=None):
+        if profile is not None and profile not in PROFILE_HOOKS:
+            raise ValueError(f"Unknown profile hook: {profile}")
+        self.profile = profile
+        self.phases = {}
+        self.counts = {}
+        self.node_types = Counter()
+        self.seconds = 0.0
+        self.started_tracing = False
+
+    def phase(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = PhaseStats(name)
+        return Phase(self, phase)
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def count_nodes(self, ast):
+        node_types = self.node_types
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            node_types[node.type] += 1
+            stack.extend(node.children)
+        self.counts['ast_nodes'] = sum(node_types.values())
+
+    def __enter__(self):
+        if self.profile == 'tracemalloc':
+            self.started_tracing = not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        if self.profile == 'tracemalloc' and self.started_tracing:
+            tracemalloc.stop()
+        return False
+
+    def to_dict(self):
+        return {
+            'seconds': self.seconds,
+            'phases': [phase.to_dict() for phase in self.phases.values()],
+            'counts': dict(self.counts),
+            'node_types': dict(sorted(self.node_types.items())),
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def format(self):
+        width = max([len('phase')] + [len(name) for name in self.phases]) + 2
+        traced = self.profile == 'tracemalloc'
+        header = f"{'phase':<{width}}{'runs':>6}{'seconds':>12}{'rss growth kB':>16}"
+        lines = [header + (f"{'traced peak kB':>16}" if traced else "")]
+        for phase in self.phases.values():
+            line = f"{phase.name:<{width}}{phase.runs:>6}{phase.seconds:>12.6f}{phase.rss_growth_kb:>16}"
+            if traced:
+                line += f"{(phase.peak_traced_bytes or 0) / 1024:>16.1f}"
+            lines.append(line)
+        lines.append(f"{'total':<{width}}{'':>6}{self.seconds:>12.6f}")
+        lines.extend(f"{name}: {value}" for name, value in self.counts.items())
+        return "\n".join(lines)
+
+
+_NO_PHASE = nullcontext()
+
+
+class NullStats:
+    # Stands in when instrumentation is off: every hook is a no-op and
+    # callers skip the counting work behind "if stats.enabled".
+    enabled = False
+
+    def phase(self, name):
+        return _NO_PHASE
+
+    def count(self, name, value):
+        pass
+
+    def count_nodes(self, ast):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_STATS = NullStats()
@@ -0,0 +1,148 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+from lexer import Lexer, read_chunks
+from parser import Parser
+from semantic import SemanticAnalyzer
+from tac import format_tac
+from tac_generator import TACGenerator
+from assembly_generator import AssemblyGenerator
+from optimizer import pass_manager_for_level
+from register_allocator import ALLOCATORS, allocate_registers
+from structures import ASTNode
+
+
+class StreamingParser(Parser):
+    # Pulls tokens from an iterator instead of indexing a list. The grammar
+    # needs one token of lookahead beyond the current one (is_call), which
+    # the small buffer holds.
+    def __init__(self, tokens):
+        self.token_iter = iter(tokens)
+        self.lookahead = deque()
+        self.current_token = next(self.token_iter)
+        self.arena = None
+        self.make_node = ASTNode
+
+    def advance(self):
+        if self.lookahead:
+            self.current_token = self.lookahead.popleft()
+        elif self.current_token.type != 'EOF':
+            self.current_token = next(self.token_iter)
+
+    def is_call(self):
+        if not self.lookahead:
+            if self.current_token.type == 'EOF':
+                return False
+            self.lookahead.append(next(self.token_iter))
+        return self.lookahead[0].type == 'LPAREN'
+
+    # One top-level declaration at a time; nothing before it is kept.
+    def declarations(self):
+        while self.current_token.type != 'EOF':
+            if self.current_token.type == 'DEF':
+                yield self.function_definition()
+            else:
+                yield self.statement()
+
+
+class StreamResult:
+    def __init__(self):
+        self.declarations = 0
+        self.tac_instructions = 0
+        self.assembly_lines = 0
+        self.largest_declaration = 0
+        self.seconds = 0.0
+
+
+def stream_compile(source, output, tac_output=None, opt_level=0, registers=None, allocator='linear',
+                   chunk_size=1 << 16):
+    # source and output are open text files. Each declaration is checked,
+    # lowered to TAC and to assembly, and written out before the next one is
+    # parsed. Names and numbering continue across declarations, so at -O0
+    # the result is exactly what compiling the whole file at once produces;
+    # optimization passes see one declaration at a time. Function bodies go
+    # after HALT; they are spooled to a temporary file until the top-level
+    # code is complete.
+    result = StreamResult()
+    start = time.perf_counter()
+    parser = StreamingParser(Lexer("").iter_chunk_tokens(read_chunks(source, chunk_size)))
+    analyzer = SemanticAnalyzer()
+    generator = TACGenerator(symbols=analyzer.symbols)
+    with tempfile.TemporaryFile('w+') as functions:
+        for declaration in parser.declarations():
+            analyzer.visit(declaration)
+            generator.tac_code = []
+            generator.visit(declaration)
+            tac_code = pass_manager_for_level(opt_level).run(generator.tac_code)
+            if tac_output is not None and tac_code:
+                tac_output.write(format_tac(tac_code) + "\n")
+            allocation = None
+            if registers is not None:
+                allocation = allocate_registers(tac_code, registers, allocator)
+            main_code, function_code = AssemblyGenerator(tac_code, allocation).generate_sections()
+            if main_code:
+                output.write("\n".join(main_code) + "\n")
+            if function_code:
+                functions.write("\n" + "\n".join(function_code))
+            result.declarations += 1
+            result.tac_instructions += len(tac_code)
+            result.assembly_lines += len(main_code) + len(function_code)
+            result.largest_declaration = max(result.largest_declaration, len(tac_code))
+        output.write("  HALT")
+        functions.seek(0)
+        shutil.copyfileobj(functions, output)
+    result.assembly_lines += 1
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compile a source file one declaration at a time.")
+    arg_parser.add_argument('input')
+    arg_parser.add_argument('-o', '--output', required=True, help="assembly output file")
+    arg_parser.add_argument('--tac', help="also write TAC to this file")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2, 3), default=0)
+    arg_parser.add_argument('--registers', type=int, help="allocate temps to this many registers")
+    arg_parser.add_argument('--allocator', choices=sorted(ALLOCATORS), default='linear')
+    arg_parser.add_argument('--trace-memory', action='store_true', help="report peak traced memory")
+    args = arg_parser.parse_args()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    written = []
+    tac_output = None
+    result = None
+    try:
+        with open(args.input) as source, open(args.output, 'w') as output:
+            written.append(args.output)
+            if args.tac:
+                tac_output = open(args.tac, 'w')
+                written.append(args.tac)
+            result = stream_compile(source, output, tac_output, args.opt_level, args.registers, args.allocator)
+    except Exception as error:
+        print(f"{args.input}: {error}", file=sys.stderr)
+    finally:
+        if tac_output is not None:
+            tac_output.close()
+    if result is None:
+        # What was written before the error is not a program; remove it
+        # rather than leave a truncated file behind.
+        for path in written:
+            os.remove(path)
+        return 1
+    print(f"{result.declarations} declarations, {result.tac_instructions} TAC instructions, "
+          f"{result.assembly_lines} assembly lines in {result.seconds:.3f}s "
+          f"({os.path.getsize(args.input)} bytes of source)")
+    if args.trace_memory:
+        print(f"peak traced memory: {tracemalloc.get_traced_memory()[1]} bytes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import argparse
+import sys
+import time
+
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from tac_generator import TACGenerator
+from assembly_generator import AssemblyGenerator
+
+
+def nested_parentheses(depth):
+    return "x = " + "(" * depth + "1" + " + 1)" * depth + ";\nprint x;\n"
+
+
+def right_nested_expression(depth):
+    return "x = " + "1 + (" * depth + "1" + ")" * depth + ";\nprint x;\n"
+
+
+def nested_calls(depth):
+    return "def f(a) { return a; }\nx = " + "f(" * depth + "1" + ")" * depth + ";\n"
+
+
+def nested_ifs(depth):
+    return "x = 0;\n" + "if (x < 1) {\n" * depth + "x = x + 1;\n" + "} else { x = 0; }\n" * depth
+
+
+def nested_whiles(depth):
+    return "i = 0;\n" + "while (i < 1) {\n" * depth + "i = i + 1;\n" + "}\n" * depth
+
+
+CASES = {
+    'nested_parentheses': nested_parentheses,
+    'right_nested_expression': right_nested_expression,
+    'nested_calls': nested_calls,
+    'nested_ifs': nested_ifs,
+    'nested_whiles': nested_whiles,
+}
+
+
+def run_case(name, depth, arena):
+    source = CASES[name](depth)
+    start = time.perf_counter()
+    ast = Parser(Lexer(source).tokenize(), arena=arena).parse()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(ast)
+    tac_generator = TACGenerator(symbols=analyzer.symbols)
+    tac_generator.visit(ast)
+    AssemblyGenerator(tac_generator.tac_code).generate()
+    return time.perf_counter() - start, len(tac_generator.tac_code)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compile pathologically deep programs through every phase.")
+    arg_parser.add_argument('--depth', type=int, default=100000)
+    arg_parser.add_argument('--arena', action='store_true')
+    arg_parser.add_argument('cases', nargs='*', default=list(CASES))
+    args = arg_parser.parse_args()
+
+    failed = False
+    for name in args.cases:
+        try:
+            elapsed, tac_lines = run_case(name, args.depth, args.arena)
+            print(f"{name:<26} depth={args.depth:<8} tac={tac_lines:<8} {elapsed:.2f}s")
+        except RecursionError:
+            print(f"{name:<26} depth={args.depth:<8} FAILED: RecursionError")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
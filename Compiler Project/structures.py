@@ -1,18 +1,34 @@
 # structures.py
+import sys
+
+# Shared by every leaf node so that leaves do not each allocate an empty list.
+EMPTY_CHILDREN = ()
+
 
 class Token:
-    def __init__(self, type, value):
+    __slots__ = ('type', 'value', 'line', 'column')
+
+    def __init__(self, type, value, line=0, column=0):
         self.type = type
         self.value = value
-    
+        self.line = line
+        self.column = column
+
     def __repr__(self):
         return f"Token({self.type}, {repr(self.value)})"
 
+
 class ASTNode:
-    def __init__(self, type, children=None, value=None):
-        self.type = type
-        self.children = children if children else []
+    # symbol is filled in by semantic analysis on identifier and param nodes.
+    __slots__ = ('type', 'children', 'value', 'line', 'column', 'symbol')
+
+    def __init__(self, type, children=None, value=None, line=0, column=0):
+        self.type = sys.intern(type)
+        self.children = children if children else EMPTY_CHILDREN
         self.value = value
+        self.line = line
+        self.column = column
+        self.symbol = None
 
     def __repr__(self):
         return f"ASTNode({self.type}, value={self.value})"
\ No newline at end of file
@@ -0,0 +1,84 @@
+import sys
+
+VARIABLE = 'variable'
+FUNCTION = 'function'
+PARAMETER = 'parameter'
+
+# Owner of symbols declared at the top level.
+GLOBAL = -1
+
+
+class Scope:
+    __slots__ = ('parent', 'names', 'owner')
+
+    def __init__(self, parent=None, owner=GLOBAL):
+        self.parent = parent
+        self.names = {}
+        self.owner = owner
+
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            symbol = scope.names.get(name)
+            if symbol is not None:
+                return symbol
+            scope = scope.parent
+        return None
+
+
+# Every declaration gets a dense integer ID; what is known about it lives in
+# parallel lists indexed by that ID. The owner of a parameter or local is the
+# ID of its function; globals are owned by GLOBAL. A function's arity is its
+# number of parameters, which every call must match. Frames are laid out by the
+# assembly generator, from the code that is left after optimization.
+class SymbolTable:
+    def __init__(self):
+        self.names = []
+        self.kinds = []
+        self.owners = []
+        self.arities = []
+        self.global_scope = Scope()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, kind, owner=GLOBAL):
+        symbol = len(self.names)
+        self.names.append(sys.intern(name))
+        self.kinds.append(kind)
+        self.owners.append(owner)
+        self.arities.append(None)
+        return symbol
+
+    def declare(self, scope, name, kind):
+        symbol = self.add(name, kind, scope.owner)
+        scope.names[self.names[symbol]] = symbol
+        return symbol
+
+    def set_kind(self, symbol, kind):
+        self.kinds[symbol] = kind
+
+    def set_arity(self, function, count):
+        self.arities[function] = count
+
+    def function_scope(self, function):
+        return Scope(self.global_scope, function)
+
+    # The function whose frame holds symbol, or None for a global.
+    def owner_name(self, symbol):
+        owner = self.owners[symbol]
+        return None if owner == GLOBAL else self.names[owner]
+
+    def is_function(self, symbol):
+        return self.kinds[symbol] == FUNCTION
+
+    # Names declared at the top level and their kinds.
+    def global_kinds(self):
+        kinds = self.kinds
+        return {name: kinds[symbol] for name, symbol in self.global_scope.names.items()}
+
+    # Functions declared at the top level and their arities.
+    def global_arities(self):
+        kinds, arities = self.kinds, self.arities
+        return {name: arities[symbol] for name, symbol in self.global_scope.names.items()
+                if kinds[symbol] == FUNCTION}
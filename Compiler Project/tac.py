@@ -0,0 +1,135 @@
+from enum import IntEnum
+
+
+class Op(IntEnum):
+    LABEL = 0
+    GOTO = 1
+    IF_FALSE = 2
+    FUNC_BEGIN = 3
+    FUNC_END = 4
+    RETURN = 5
+    PARAM = 6
+    GET_PARAM = 7
+    PRINT = 8
+    CALL = 9
+    COPY = 10
+    ADD = 11
+    SUB = 12
+    MUL = 13
+    DIV = 14
+    LT = 15
+    GT = 16
+    EQ = 17
+    NE = 18
+    LE = 19
+    GE = 20
+
+
+BINARY_OPS = {
+    '+': Op.ADD, '-': Op.SUB, '*': Op.MUL, '/': Op.DIV,
+    '<': Op.LT, '>': Op.GT, '==': Op.EQ, '!=': Op.NE, '<=': Op.LE, '>=': Op.GE
+}
+BINARY_SYMBOLS = {op: symbol for symbol, op in BINARY_OPS.items()}
+COMMUTATIVE_OPS = frozenset((Op.ADD, Op.MUL, Op.EQ, Op.NE))
+
+# Instructions that define instr.dest, and those that read arg1 / arg2 as values.
+DEFINING_OPS = frozenset(BINARY_SYMBOLS) | {Op.COPY, Op.CALL, Op.GET_PARAM}
+ARG1_USE_OPS = frozenset(BINARY_SYMBOLS) | {Op.COPY, Op.IF_FALSE, Op.RETURN, Op.PARAM, Op.PRINT}
+ARG2_USE_OPS = frozenset(BINARY_SYMBOLS)
+
+
+# Operands are plain (kind, value) tuples: they hash and compare by value, and
+# tuples of atomic values are untracked by the cyclic GC, which keeps the
+# hundreds of thousands of operands in a large program nearly free.
+TEMP, VAR, CONST, LABEL = range(4)
+KIND_NAMES = ('Temp', 'Var', 'Const', 'Label')
+
+
+def Temp(name): return (TEMP, name)
+# A variable resolved by semantic analysis also carries its symbol ID, so two
+# variables with the same name in different scopes stay distinct; the name
+# at [1] is what gets printed. A function's parameters and locals also carry
+# the function's name: they live in its frame, one copy per active call,
+# rather than in a global cell.
+def Var(name, symbol=None, function=None):
+    if function is not None:
+        return (VAR, name, symbol, function)
+    return (VAR, name) if symbol is None else (VAR, name, symbol)
+def is_local(operand): return operand[0] == VAR and len(operand) > 3
+def Const(value): return (CONST, value)
+def Label(name): return (LABEL, name)
+
+
+def format_operand(operand):
+    return str(operand[1])
+
+
+# Constants passes may create as immediates. Folding leaves a value outside
+# this range to be computed at run time; the VM also encodes wider literals
+# written in the source, up to 64 bits.
+IMMEDIATES = range(-2 ** 31, 2 ** 31)
+
+
+def evaluate_binary(op, left, right):
+    if op == Op.ADD: return left + right
+    if op == Op.SUB: return left - right
+    if op == Op.MUL: return left * right
+    if op == Op.DIV:
+        # Integer division truncating toward zero.
+        quotient = abs(left) // abs(right)
+        return quotient if (left < 0) == (right < 0) else -quotient
+    if op == Op.LT: return int(left < right)
+    if op == Op.GT: return int(left > right)
+    if op == Op.EQ: return int(left == right)
+    if op == Op.NE: return int(left != right)
+    if op == Op.LE: return int(left <= right)
+    if op == Op.GE: return int(left >= right)
+    raise ValueError(f"Not a binary operator: {op}")
+
+
+class Instr:
+    __slots__ = ('op', 'dest', 'arg1', 'arg2')
+
+    def __init__(self, op, dest=None, arg1=None, arg2=None):
+        self.op = op
+        self.dest = dest
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def uses(self):
+        op = self.op
+        if op in ARG2_USE_OPS:
+            return (self.arg1, self.arg2)
+        if op in ARG1_USE_OPS:
+            return (self.arg1,)
+        return ()
+
+    def __str__(self):
+        return _FORMATTERS[self.op](self)
+
+    def __repr__(self):
+        return f"Instr({self})"
+
+
+def _format_binary(instr):
+    return f"{instr.dest[1]} = {instr.arg1[1]} {BINARY_SYMBOLS[instr.op]} {instr.arg2[1]}"
+
+
+_FORMATTERS = {
+    Op.LABEL: lambda i: f"{i.arg1[1]}:",
+    Op.GOTO: lambda i: f"goto {i.arg1[1]}",
+    Op.IF_FALSE: lambda i: f"if_false {i.arg1[1]} goto {i.arg2[1]}",
+    Op.FUNC_BEGIN: lambda i: f"func_begin {i.arg1[1]}",
+    Op.FUNC_END: lambda i: "func_end",
+    Op.RETURN: lambda i: f"return {i.arg1[1]}",
+    Op.PARAM: lambda i: f"param {i.arg1[1]}",
+    Op.GET_PARAM: lambda i: f"get_param {i.dest[1]}",
+    Op.PRINT: lambda i: f"print {i.arg1[1]}",
+    Op.CALL: lambda i: f"{i.dest[1]} = call {i.arg1[1]}, {i.arg2[1]}",
+    Op.COPY: lambda i: f"{i.dest[1]} = {i.arg1[1]}",
+}
+_FORMATTERS.update((op, _format_binary) for op in BINARY_SYMBOLS)
+
+
+def format_tac(instructions):
+    return "\n".join(str(instr) for instr in instructions)
@@ -1,98 +1,108 @@
-class TACGenerator:
-    def __init__(self):
+from tac import Op, Instr, Temp, Var, Const, Label, BINARY_OPS
+from visitor import NodeVisitor
+
+
+class TACGenerator(NodeVisitor):
+    # namespace prefixes temp and label names ("f.t1", "f.L1") so that code
+    # generated separately can be linked without renaming. symbols is the
+    # table semantic analysis filled in; it tells which variables belong to
+    # a function's frame. Without it every variable is global.
+    def __init__(self, namespace=None, symbols=None):
         self.temp_count = 0
         self.label_count = 0
         self.tac_code = []
+        self.prefix = f"{namespace}." if namespace else ""
+        self.symbols = symbols
 
     def new_temp(self):
         self.temp_count += 1
-        return f"t{self.temp_count}"
+        return Temp(f"{self.prefix}t{self.temp_count}")
 
     def new_label(self):
         self.label_count += 1
-        return f"L{self.label_count}"
-
-    def visit(self, node):
-        method_name = 'visit_' + node.type
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        return Label(f"{self.prefix}L{self.label_count}")
 
-    def generic_visit(self, node):
-        for child in node.children:
-            self.visit(child)
+    def emit(self, op, dest=None, arg1=None, arg2=None):
+        self.tac_code.append(Instr(op, dest, arg1, arg2))
 
-    def visit_program(self, node): self.generic_visit(node)
-    def visit_statements(self, node): self.generic_visit(node)
+    def visit_program(self, node): return self.generic_visit(node)
+    def visit_statements(self, node): return self.generic_visit(node)
     
-    def visit_number(self, node): return node.value
-    def visit_identifier(self, node): return node.value
-    def visit_param(self, node): return node.value
+    def variable(self, node):
+        symbol = node.symbol
+        if self.symbols is None or symbol is None:
+            return Var(node.value, symbol)
+        return Var(node.value, symbol, self.symbols.owner_name(symbol))
+
+    def visit_number(self, node): return Const(node.value)
+    def visit_identifier(self, node): return self.variable(node)
+    def visit_param(self, node): return self.variable(node)
     
     def visit_assign(self, node):
-        var_name = node.children[0].value
-        expr_result = self.visit(node.children[1])
-        self.tac_code.append(f"{var_name} = {expr_result}")
+        target = node.children[0]
+        expr_result = yield node.children[1]
+        self.emit(Op.COPY, self.variable(target), expr_result)
 
     def visit_binop(self, node):
-        left = self.visit(node.children[0])
-        right = self.visit(node.children[1])
+        left = yield node.children[0]
+        right = yield node.children[1]
+        op = BINARY_OPS.get(node.value)
+        if op is None:
+            raise Exception(f"Unsupported operator: {node.value}")
         temp = self.new_temp()
-        self.tac_code.append(f"{temp} = {left} {node.value} {right}")
+        self.emit(op, temp, left, right)
         return temp
     
-    def visit_relop(self, node):
-        left = self.visit(node.children[0])
-        right = self.visit(node.children[1])
-        temp = self.new_temp()
-        self.tac_code.append(f"{temp} = {left} {node.value} {right}")
-        return temp
+    visit_relop = visit_binop
 
     def visit_if(self, node):
-        condition_var = self.visit(node.children[0])
+        condition_var = yield node.children[0]
         label_after_if = self.new_label()
-        self.tac_code.append(f"if_false {condition_var} goto {label_after_if}")
-        self.visit(node.children[1])
+        self.emit(Op.IF_FALSE, None, condition_var, label_after_if)
+        yield node.children[1]
         
         if len(node.children) > 2 and node.children[2]:
             label_after_else = self.new_label()
-            self.tac_code.append(f"goto {label_after_else}")
-            self.tac_code.append(f"{label_after_if}:")
-            self.visit(node.children[2])
-            self.tac_code.append(f"{label_after_else}:")
+            self.emit(Op.GOTO, None, label_after_else)
+            self.emit(Op.LABEL, None, label_after_if)
+            yield node.children[2]
+            self.emit(Op.LABEL, None, label_after_else)
         else:
-            self.tac_code.append(f"{label_after_if}:")
+            self.emit(Op.LABEL, None, label_after_if)
 
     def visit_while(self, node):
         label_start = self.new_label()
         label_end = self.new_label()
-        self.tac_code.append(f"{label_start}:")
-        condition_var = self.visit(node.children[0])
-        self.tac_code.append(f"if_false {condition_var} goto {label_end}")
-        self.visit(node.children[1])
-        self.tac_code.append(f"goto {label_start}")
-        self.tac_code.append(f"{label_end}:")
+        self.emit(Op.LABEL, None, label_start)
+        condition_var = yield node.children[0]
+        self.emit(Op.IF_FALSE, None, condition_var, label_end)
+        yield node.children[1]
+        self.emit(Op.GOTO, None, label_start)
+        self.emit(Op.LABEL, None, label_end)
         
     def visit_func_def(self, node):
         func_name = node.children[0].value
-        self.tac_code.append(f"func_begin {func_name}")
+        self.emit(Op.FUNC_BEGIN, None, Label(func_name))
         for param in node.children[1:-1]:
-            self.tac_code.append(f"get_param {param.value}")
-        self.visit(node.children[-1])
-        self.tac_code.append(f"func_end")
+            self.emit(Op.GET_PARAM, self.variable(param))
+        yield node.children[-1]
+        self.emit(Op.FUNC_END)
         
     def visit_func_call(self, node):
         func_name = node.children[0].value
-        args = [self.visit(arg) for arg in node.children[1:]]
+        args = []
+        for arg in node.children[1:]:
+            args.append((yield arg))
         for arg in reversed(args):
-            self.tac_code.append(f"param {arg}")
+            self.emit(Op.PARAM, None, arg)
         temp = self.new_temp()
-        self.tac_code.append(f"{temp} = call {func_name}, {len(args)}")
+        self.emit(Op.CALL, temp, Label(func_name), Const(len(args)))
         return temp
 
     def visit_return(self, node):
-        return_val = self.visit(node.children[0])
-        self.tac_code.append(f"return {return_val}")
+        return_val = yield node.children[0]
+        self.emit(Op.RETURN, None, return_val)
 
     def visit_print(self, node):
-        expr_to_print = self.visit(node.children[0])
-        self.tac_code.append(f"print {expr_to_print}")
\ No newline at end of file
+        expr_to_print = yield node.children[0]
+        self.emit(Op.PRINT, None, expr_to_print)
@@ -0,0 +1,40 @@
+from types import GeneratorType
+
+
+class NodeVisitor:
+    # Handlers are resolved once per class into a table keyed by node type,
+    # instead of building 'visit_' + node.type and calling getattr per node.
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch_table = {
+            name[len('visit_'):]: getattr(cls, name)
+            for name in dir(cls) if name.startswith('visit_')
+        }
+
+    # Visit methods that need their children's results are generators: they
+    # yield a child node and receive its result back. visit() drives them from
+    # an explicit stack, so tree depth is not limited by Python recursion.
+    def visit(self, node):
+        table = self.dispatch_table
+        generic_visit = type(self).generic_visit
+        result = table.get(node.type, generic_visit)(self, node)
+        if type(result) is not GeneratorType:
+            return result
+        stack = [result]
+        value = None
+        while stack:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            value = table.get(child.type, generic_visit)(self, child)
+            if type(value) is GeneratorType:
+                stack.append(value)
+                value = None
+        return value
+
+    def generic_visit(self, node):
+        for child in node.children:
+            yield child
@@ -0,0 +1,411 @@
+import json
+import struct
+import sys
+from array import array
+from enum import IntEnum
+
+from peephole import LABEL, parse_assembly
+
+
+class Bytecode(IntEnum):
+    HALT = 0
+    MOVE = 1
+    SET = 2
+    GETSP = 3
+    ADD = 4
+    SUB = 5
+    MUL = 6
+    DIV = 7
+    CMPLT = 8
+    CMPGT = 9
+    CMPEQ = 10
+    CMPNE = 11
+    CMPLE = 12
+    CMPGE = 13
+    CMP = 14
+    CMPI = 15
+    JE = 16
+    JMP = 17
+    CALL = 18
+    RET = 19
+    PUSH = 20
+    PUSHI = 21
+    POP = 22
+    PRINT = 23
+    PRINTI = 24
+    LOOP = 25
+    LOAD_FRAME = 26
+    STORE_FRAME = 27
+    ENTER = 28
+    LEAVE = 29
+
+
+# Every instruction is three 64-bit ints: opcode and two operands.
+# Operands are cell numbers, immediates or code offsets, fixed per opcode by
+# the assembler, so handlers never look at an operand's kind. Folding keeps
+# to tac.IMMEDIATES, but a literal in the source can be wider; any that fits
+# 64 bits is encoded as it is, and a wider one is a VMError.
+WIDTH = 3
+CODE_TYPE = 'q'
+WORD = range(-2 ** 63, 2 ** 63)
+# Cell 0 holds the flag set by CMP and read by JE, cell 1 the frame base BP;
+# registers and variables get the following cells in order of first use.
+# Frame slots ("[BP+k]", "[BP-k]") are not cells but stack entries at BP + k.
+FLAG_CELL = 0
+BP_CELL = 1
+
+BINARY_BYTECODES = {
+    'ADD': Bytecode.ADD, 'SUB': Bytecode.SUB, 'MUL': Bytecode.MUL, 'DIV': Bytecode.DIV,
+    'CMPLT': Bytecode.CMPLT, 'CMPGT': Bytecode.CMPGT, 'CMPEQ': Bytecode.CMPEQ,
+    'CMPNE': Bytecode.CMPNE, 'CMPLE': Bytecode.CMPLE, 'CMPGE': Bytecode.CMPGE,
+}
+JUMP_BYTECODES = {'JE': Bytecode.JE, 'JMP': Bytecode.JMP, 'CALL': Bytecode.CALL}
+
+_MAGIC = b'VMB2'
+# magic, byte order flag, code length in ints, length of the symbol table
+_HEADER = struct.Struct('<4sBII')
+
+
+class VMError(Exception):
+    pass
+
+
+def truncating_div(left, right):
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+class Program:
+    def __init__(self, code, symbols, labels):
+        self.code = code
+        self.symbols = symbols
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.code) // WIDTH
+
+    def cell(self, name):
+        return self.symbols.index(name)
+
+    def to_bytes(self):
+        table = json.dumps({'symbols': self.symbols, 'labels': self.labels}).encode('utf-8')
+        byte_order = 0 if sys.byteorder == 'little' else 1
+        header = _HEADER.pack(_MAGIC, byte_order, len(self.code), len(table))
+        return header + self.code.tobytes() + table
+
+    @classmethod
+    def from_bytes(cls, data):
+        view = memoryview(data)
+        magic, byte_order, length, table_length = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError("Not serialized bytecode")
+        code = array(CODE_TYPE)
+        offset = _HEADER.size
+        code.frombytes(view[offset:offset + length * code.itemsize])
+        if byte_order != (0 if sys.byteorder == 'little' else 1):
+            code.byteswap()
+        offset += length * code.itemsize
+        table = json.loads(bytes(view[offset:offset + table_length]).decode('utf-8'))
+        return cls(code, table['symbols'], table['labels'])
+
+
+def is_frame_slot(operand):
+    return operand.startswith('[')
+
+
+def frame_offset(operand):
+    # "[BP+3]" -> 3, "[BP-2]" -> -2
+    return int(operand[3:-1])
+
+
+def immediate(operand, opcode, operands):
+    value = int(operand[1:])
+    if value not in WORD:
+        raise VMError(f"Immediate operand out of range: {opcode} {', '.join(operands)}")
+    return value
+
+
+class Assembler:
+    def __init__(self):
+        self.symbols = ['FLAG', 'BP']
+        self.cells = {'BP': BP_CELL}
+
+    def cell(self, name):
+        index = self.cells.get(name)
+        if index is None:
+            index = self.cells[name] = len(self.symbols)
+            self.symbols.append(name)
+        return index
+
+    # Labels are resolved to code offsets in a first pass, so the encoded
+    # program never refers to a label by name.
+    def assemble(self, assembly_code):
+        instructions = parse_assembly(assembly_code)
+        labels = {}
+        offset = 0
+        for opcode, operands in instructions:
+            if opcode == LABEL:
+                labels[operands[0]] = offset
+            else:
+                offset += WIDTH
+
+        code = array(CODE_TYPE)
+        for opcode, operands in instructions:
+            if opcode != LABEL:
+                code.extend(self.encode(opcode, operands, labels))
+        return Program(code, self.symbols, labels)
+
+    def encode(self, opcode, operands, labels):
+        cell = self.cell
+        if opcode in ('LOAD', 'STORE', 'MOV'):
+            source, target = operands
+            if is_frame_slot(source):
+                return Bytecode.LOAD_FRAME, cell(target), frame_offset(source)
+            if is_frame_slot(target):
+                return Bytecode.STORE_FRAME, cell(source), frame_offset(target)
+            if source.startswith('#'):
+                return Bytecode.SET, cell(target), immediate(source, opcode, operands)
+            if source == 'SP':
+                return Bytecode.GETSP, cell(target), 0
+            return Bytecode.MOVE, cell(target), cell(source)
+        if opcode in BINARY_BYTECODES:
+            target, source = operands
+            if source.startswith('#'):
+                raise VMError(f"Immediate operand not supported: {opcode} {', '.join(operands)}")
+            return BINARY_BYTECODES[opcode], cell(target), cell(source)
+        if opcode == 'CMP':
+            left, right = operands
+            if right.startswith('#'):
+                return Bytecode.CMPI, cell(left), immediate(right, opcode, operands)
+            return Bytecode.CMP, cell(left), cell(right)
+        if opcode in JUMP_BYTECODES:
+            if operands[0] not in labels:
+                raise VMError(f"Undefined label: {operands[0]}")
+            return JUMP_BYTECODES[opcode], labels[operands[0]], 0
+        if opcode in ('PUSH', 'PRINT'):
+            if operands[0].startswith('#'):
+                return Bytecode[opcode + 'I'], immediate(operands[0], opcode, operands), 0
+            return Bytecode[opcode], cell(operands[0]), 0
+        if opcode == 'POP':
+            return Bytecode.POP, cell(operands[0]), 0
+        if opcode in ('ENTER', 'LEAVE'):
+            return Bytecode[opcode], int(operands[0][1:]), 0
+        if opcode == 'RET':
+            return Bytecode.RET, 0, 0
+        if opcode == 'HALT':
+            return Bytecode.HALT, 0, 0
+        raise VMError(f"Unknown instruction: {opcode}")
+
+
+def assemble(assembly_code):
+    return Assembler().assemble(assembly_code)
+
+
+# Straight-line statements for the loop fast path, one per bytecode.
+_LOOP_STATEMENTS = {
+    Bytecode.MOVE: "c[{a}] = c[{b}]",
+    Bytecode.SET: "c[{a}] = {b}",
+    Bytecode.GETSP: "c[{a}] = len(stack)",
+    Bytecode.ADD: "c[{a}] += c[{b}]",
+    Bytecode.SUB: "c[{a}] -= c[{b}]",
+    Bytecode.MUL: "c[{a}] *= c[{b}]",
+    Bytecode.DIV: "c[{a}] = div(c[{a}], c[{b}])",
+    Bytecode.CMPLT: "c[{a}] = 1 if c[{a}] < c[{b}] else 0",
+    Bytecode.CMPGT: "c[{a}] = 1 if c[{a}] > c[{b}] else 0",
+    Bytecode.CMPEQ: "c[{a}] = 1 if c[{a}] == c[{b}] else 0",
+    Bytecode.CMPNE: "c[{a}] = 1 if c[{a}] != c[{b}] else 0",
+    Bytecode.CMPLE: "c[{a}] = 1 if c[{a}] <= c[{b}] else 0",
+    Bytecode.CMPGE: "c[{a}] = 1 if c[{a}] >= c[{b}] else 0",
+    Bytecode.CMP: "f = c[{a}] == c[{b}]",
+    Bytecode.CMPI: "f = c[{a}] == {b}",
+    Bytecode.PUSH: "stack.append(c[{a}])",
+    Bytecode.PUSHI: "stack.append({a})",
+    Bytecode.POP: "c[{a}] = stack.pop()",
+    Bytecode.PRINT: "out(c[{a}])",
+    Bytecode.PRINTI: "out({a})",
+    Bytecode.LOAD_FRAME: "c[{a}] = stack[c[1] + {b}]",
+    Bytecode.STORE_FRAME: "stack[c[1] + {b}] = c[{a}]",
+}
+
+
+def compile_loop(code, header, back_jump):
+    # A loop qualifies when the code from its header to the JMP back to it
+    # only jumps forward within itself (an if/else in the body) or out of
+    # the loop through JE. The body becomes one Python function that runs
+    # whole iterations without going through dispatch, and returns the
+    # offset it left from with the number of instructions it executed.
+    starts = {header}
+    for pc in range(header, back_jump, WIDTH):
+        op, target = code[pc], code[pc + 1]
+        if op == Bytecode.JE or op == Bytecode.JMP:
+            inside = header <= target <= back_jump
+            if (op == Bytecode.JMP and not inside) or (inside and target <= pc):
+                return None
+            if inside:
+                starts.add(target)
+            starts.add(pc + WIDTH)
+        elif op not in _LOOP_STATEMENTS:
+            return None
+    starts.discard(back_jump + WIDTH)
+    starts = sorted(starts)
+    block_of = {start: index for index, start in enumerate(starts)}
+    ends = starts[1:] + [back_jump + WIDTH]
+
+    # Blocks run in layout order; s is the block to run next, so a forward
+    # jump simply skips the blocks in between.
+    branching = len(starts) > 1
+    lines = [
+        "def loop(c, stack, out, budget):",
+        "    f = c[0]",
+        "    n = 0",
+        "    while n < budget:",
+    ]
+    if branching:
+        lines.append("        s = 0")
+    for index, (start, end) in enumerate(zip(starts, ends)):
+        size = (end - start) // WIDTH
+        indent = "        "
+        if branching:
+            if index:
+                lines.append(f"        if s == {index}:")
+                indent += "    "
+            lines.append(f"{indent}s = {index + 1}")
+        lines.append(f"{indent}n += {size}")
+        for pc in range(start, end, WIDTH):
+            op, a, b = code[pc], code[pc + 1], code[pc + 2]
+            if pc == back_jump:
+                break
+            if op == Bytecode.JE:
+                remaining = (end - pc) // WIDTH - 1
+                lines.append(f"{indent}if f:")
+                if header <= a <= back_jump:
+                    lines.append(f"{indent}    s = {block_of[a]}")
+                else:
+                    lines.append(f"{indent}    c[0] = 1")
+                    lines.append(f"{indent}    return {a}, n - {remaining}")
+            elif op == Bytecode.JMP:
+                lines.append(f"{indent}s = {block_of[a]}")
+            else:
+                lines.append(indent + _LOOP_STATEMENTS[op].format(a=a, b=b))
+    lines.append("    c[0] = f")
+    lines.append(f"    return {header}, n")
+    namespace = {'div': truncating_div}
+    exec(compile("\n".join(lines), f"<loop@{header}>", 'exec'), namespace)
+    return namespace['loop']
+
+
+class VirtualMachine:
+    def __init__(self, program, fast_loops=True):
+        self.program = program
+        self.code = array(CODE_TYPE, program.code)
+        self.cells = [0] * len(program.symbols)
+        self.stack = []
+        self.frames = []
+        self.output = []
+        self.pc = 0
+        self.executed = 0
+        self.loops = []
+        if fast_loops:
+            self.install_loops()
+        self.handlers = self.handler_table()
+
+    # Each backward JMP closes a candidate loop; the header instruction of a
+    # qualifying one is replaced by LOOP, whose operand indexes self.loops.
+    def install_loops(self):
+        code = self.code
+        for pc in range(0, len(code), WIDTH):
+            if code[pc] != Bytecode.JMP:
+                continue
+            header = code[pc + 1]
+            if header >= pc or code[header] == Bytecode.LOOP:
+                continue
+            loop = compile_loop(code, header, pc)
+            if loop is not None:
+                code[header + 1] = len(self.loops)
+                code[header] = Bytecode.LOOP
+                self.loops.append(loop)
+
+    def handler_table(self):
+        cells, stack, frames, output = self.cells, self.stack, self.frames, self.output
+
+        # Handlers take the two operands and the offset of the next
+        # instruction, and return the offset to continue at; -1 halts.
+        def halt(a, b, pc): return -1
+        def move(a, b, pc): cells[a] = cells[b]; return pc
+        def set_(a, b, pc): cells[a] = b; return pc
+        def getsp(a, b, pc): cells[a] = len(stack); return pc
+        def add(a, b, pc): cells[a] += cells[b]; return pc
+        def sub(a, b, pc): cells[a] -= cells[b]; return pc
+        def mul(a, b, pc): cells[a] *= cells[b]; return pc
+        def div(a, b, pc): cells[a] = truncating_div(cells[a], cells[b]); return pc
+        def cmplt(a, b, pc): cells[a] = 1 if cells[a] < cells[b] else 0; return pc
+        def cmpgt(a, b, pc): cells[a] = 1 if cells[a] > cells[b] else 0; return pc
+        def cmpeq(a, b, pc): cells[a] = 1 if cells[a] == cells[b] else 0; return pc
+        def cmpne(a, b, pc): cells[a] = 1 if cells[a] != cells[b] else 0; return pc
+        def cmple(a, b, pc): cells[a] = 1 if cells[a] <= cells[b] else 0; return pc
+        def cmpge(a, b, pc): cells[a] = 1 if cells[a] >= cells[b] else 0; return pc
+        def cmp(a, b, pc): cells[0] = cells[a] == cells[b]; return pc
+        def cmpi(a, b, pc): cells[0] = cells[a] == b; return pc
+        def je(a, b, pc): return a if cells[0] else pc
+        def jmp(a, b, pc): return a
+        def call(a, b, pc): frames.append(pc); return a
+        def ret(a, b, pc): return frames.pop() if frames else -1
+        def push(a, b, pc): stack.append(cells[a]); return pc
+        def pushi(a, b, pc): stack.append(a); return pc
+        def pop(a, b, pc): cells[a] = stack.pop(); return pc
+        def print_(a, b, pc): output.append(cells[a]); return pc
+        def printi(a, b, pc): output.append(a); return pc
+        def loop(a, b, pc): raise VMError("LOOP is dispatched by run()")
+        def load_frame(a, b, pc): cells[a] = stack[cells[1] + b]; return pc
+        def store_frame(a, b, pc): stack[cells[1] + b] = cells[a]; return pc
+
+        def enter(a, b, pc):
+            stack.append(cells[1])
+            cells[1] = len(stack)
+            stack.extend([0] * a)
+            return pc
+
+        def leave(a, b, pc):
+            del stack[cells[1]:]
+            cells[1] = stack.pop()
+            if a:
+                del stack[-a:]
+            return pc
+
+        return [halt, move, set_, getsp, add, sub, mul, div, cmplt, cmpgt, cmpeq, cmpne,
+                cmple, cmpge, cmp, cmpi, je, jmp, call, ret, push, pushi, pop, print_, printi, loop,
+                load_frame, store_frame, enter, leave]
+
+    def run(self, max_steps=None):
+        code, handlers, loops = self.code, self.handlers, self.loops
+        cells, stack, out = self.cells, self.stack, self.output.append
+        limit = max_steps if max_steps is not None else sys.maxsize
+        loop_op = Bytecode.LOOP
+        pc = self.pc
+        steps = 0
+        try:
+            while pc >= 0 and steps < limit:
+                op = code[pc]
+                if op == loop_op:
+                    pc, executed = loops[code[pc + 1]](cells, stack, out, limit - steps)
+                    steps += executed
+                    continue
+                pc = handlers[op](code[pc + 1], code[pc + 2], pc + WIDTH)
+                steps += 1
+        except (IndexError, ZeroDivisionError) as error:
+            raise VMError(f"{error} at offset {pc}")
+        finally:
+            self.pc = pc
+            self.executed += steps
+        if pc >= 0:
+            raise VMError(f"Step limit of {limit} reached at offset {pc}")
+        return self.output
+
+    def value(self, name):
+        return self.cells[self.program.cell(name)]
+
+
+def run_assembly(assembly_code, fast_loops=True, max_steps=None):
+    machine = VirtualMachine(assemble(assembly_code), fast_loops)
+    machine.run(max_steps)
+    return machine
@@ -0,0 +1,147 @@
+import argparse
+import time
+
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from tac_generator import TACGenerator
+from optimizer import pass_manager_for_level
+from assembly_generator import AssemblyGenerator
+from register_allocator import allocate_registers
+from peephole import PeepholeOptimizer
+from vm import VirtualMachine, assemble
+from compiler import SAMPLE_PROGRAM
+from memory_benchmark import synthetic_program
+
+
+def counting_loop(iterations):
+    return f"""
+    i = 0;
+    total = 0;
+    while (i < {iterations}) {{
+        total = total + i * 2 - 1;
+        i = i + 1;
+    }}
+    print total;
+"""
+
+
+def nested_loops(iterations):
+    return f"""
+    i = 0;
+    total = 0;
+    while (i < {iterations}) {{
+        j = 0;
+        while (j < 100) {{
+            if (j > 50) {{
+                total = total + 1;
+            }} else {{
+                total = total - 1;
+            }}
+            j = j + 1;
+        }}
+        i = i + 1;
+    }}
+    print total;
+"""
+
+
+# Loop-invariant arithmetic, an induction variable scaled by a constant and
+# an inner loop with a constant trip count: what -O3's loop passes target.
+def loop_kernel(iterations):
+    return f"""
+    n = 7;
+    m = 3;
+    i = 0;
+    total = 0;
+    while (i < {iterations}) {{
+        total = total + (n * m + 5) + i * 4;
+        j = 0;
+        while (j < 3) {{
+            total = total + j * n;
+            j = j + 1;
+        }}
+        i = i + 1;
+    }}
+    print total;
+"""
+
+
+# Backend configurations, from the plain lowering to the full pipeline.
+CONFIGURATIONS = (
+    ('O0', 0, None, False),
+    ('O2', 2, None, False),
+    ('O2+regs', 2, 4, False),
+    ('O2+regs+peephole', 2, 4, True),
+    ('O3', 3, None, False),
+    ('O3+regs+peephole', 3, 4, True),
+)
+
+
+def build(source, opt_level, registers, peephole, allocator='linear'):
+    ast = Parser(Lexer(source).tokenize()).parse()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(ast)
+    generator = TACGenerator(symbols=analyzer.symbols)
+    generator.visit(ast)
+    tac_code = pass_manager_for_level(opt_level).run(generator.tac_code)
+    allocation = allocate_registers(tac_code, registers, allocator) if registers else None
+    assembly_code = AssemblyGenerator(tac_code, allocation).generate()
+    if peephole:
+        assembly_code = PeepholeOptimizer().optimize(assembly_code)
+    return assemble(assembly_code)
+
+
+def measure(program, fast_loops, repeat):
+    best = None
+    for _ in range(repeat):
+        machine = VirtualMachine(program, fast_loops)
+        start = time.perf_counter()
+        machine.run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, machine)
+    elapsed, machine = best
+    return machine, elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measure virtual machine throughput per backend configuration.")
+    arg_parser.add_argument('--iterations', type=int, default=200000)
+    arg_parser.add_argument('--functions', type=int, default=2000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    programs = [
+        ('sample', SAMPLE_PROGRAM),
+        ('counting-loop', counting_loop(args.iterations)),
+        ('nested-loops', nested_loops(args.iterations // 100)),
+        ('loop-kernel', loop_kernel(args.iterations // 10)),
+        (f"synthetic-{args.functions}", synthetic_program(args.functions)),
+    ]
+    columns = ('program', 'backend', 'fast_loops', 'code', 'executed', 'seconds', 'ips')
+    print("".join(f"{column:>18}" for column in columns))
+    for name, source in programs:
+        reference = None
+        for backend, opt_level, registers, peephole in CONFIGURATIONS:
+            program = build(source, opt_level, registers, peephole)
+            for fast_loops in (False, True):
+                machine, elapsed = measure(program, fast_loops, args.repeat)
+                if reference is None:
+                    reference = machine.output
+                elif machine.output != reference:
+                    raise SystemExit(f"{name} / {backend}: output differs from the O0 build")
+                row = {
+                    'program': name,
+                    'backend': backend,
+                    'fast_loops': 'on' if fast_loops else 'off',
+                    'code': len(program),
+                    'executed': machine.executed,
+                    'seconds': f"{elapsed:.4f}",
+                    'ips': f"{machine.executed / elapsed:,.0f}" if elapsed else '-',
+                }
+                print("".join(f"{row[column]:>18}" for column in columns))
+
+
+if __name__ == '__main__':
+    main()